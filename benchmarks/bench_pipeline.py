@@ -0,0 +1,246 @@
+"""
+Benchmark harness for the pix2gba conversion pipeline.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_pipeline run --output baseline.json
+    python -m benchmarks.bench_pipeline run --output current.json --compare baseline.json
+    python -m benchmarks.bench_pipeline compare baseline.json current.json --threshold 0.15
+"""
+import argparse
+import contextlib
+import io
+import json
+import platform
+import statistics
+import struct
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from src.palette import palette_from_img, create_conversion_table
+from src.tile_creator import create_tile_data
+from src.deduper import dedupe_tiles
+from src.tile_output import create_c_file, create_header_file
+from src.converter import run_conversion
+from src.compress_output import gba_lz77_compress, compress_tile_data, create_compressed_c_file
+
+from .synthetic import IMAGE_KINDS, make_image
+
+QUICK_SIZES = [8, 32, 128, 256]
+FULL_SIZES = [8, 16, 32, 64, 128, 256, 512, 1024]
+BPPS = [4, 8]
+METATILE_SHAPES = [(1, 1), (2, 2), (4, 2), (4, 4)]
+TRANSPARENT = 0x5D53
+
+
+def _time_call(func, repeat: int) -> dict:
+    """
+    Times `func` `repeat` times (its output is silenced).
+    :param func: Function without arguments to time
+    :param repeat: Number of runs
+    :return: Dictionary with the min and median wall time in seconds
+    """
+    times = []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+
+    return {"min": min(times), "median": statistics.median(times), "runs": repeat}
+
+
+def _codec_available() -> bool:
+    """
+    :return: If the LZ77 codec library can be loaded from the working directory
+    """
+    try:
+        gba_lz77_compress(b"\0" * 4)
+        return True
+    except OSError:
+        return False
+
+
+def _unit_args(image_path: Path, out_dir: Path, bpp: int, shape: tuple, dedupe: bool, compress: bool) -> dict:
+    """
+    Creates the same argument dictionary `create_unit_args` makes for a TOML unit.
+    """
+    return {
+        "image_path": image_path,
+        "image_name": image_path.stem,
+        "meta_width": shape[0],
+        "meta_height": shape[1],
+        "bpp": bpp,
+        "transparent": TRANSPARENT,
+        "palette_path": None,
+        "palette_included": 1,
+        "generate_palette": 0,
+        "destination_path": out_dir,
+        "output_type": "both",
+        "compress": int(compress),
+        "dedupe": int(dedupe),
+    }
+
+
+def run_benchmarks(sizes: list[int], kinds: list[str], repeat: int) -> dict:
+    """
+    Runs every stage benchmark and the end to end benchmarks.
+    :param sizes: Square image sizes (in pixels) to benchmark
+    :param kinds: Kinds of synthetic images to benchmark
+    :param repeat: Number of runs per benchmark
+    :return: Dictionary of benchmark name to timing results
+    """
+    results = {}
+    has_codec = _codec_available()
+    if not has_codec:
+        print("* LZ77 codec library not found in ./bin, skipping compression benchmarks")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+
+        for kind in kinds:
+            for size in sizes:
+                for bpp in BPPS:
+                    tag = f"{kind}/{size}x{size}/{bpp}bpp"
+                    print(f"* {tag}")
+
+                    img = make_image(kind, size, size, bpp)
+                    image_path = tmp_dir / f"{kind}_{size}_{bpp}.png"
+                    img.save(image_path)
+
+                    # Individual stages
+                    palette = palette_from_img(img, bpp, TRANSPARENT)
+                    results[f"palette_from_img/{tag}"] = _time_call(
+                        lambda: palette_from_img(img, bpp, TRANSPARENT), repeat)
+
+                    table = create_conversion_table(img, palette)
+                    results[f"create_conversion_table/{tag}"] = _time_call(
+                        lambda: create_conversion_table(img, palette), repeat)
+
+                    shapes = [s for s in METATILE_SHAPES if size % (s[0] * 8) == 0 and size % (s[1] * 8) == 0]
+                    for shape in shapes:
+                        results[f"create_tile_data/{tag}/mt{shape[0]}x{shape[1]}"] = _time_call(
+                            lambda: create_tile_data(img, table, shape[0], shape[1], bpp), repeat)
+
+                    tile_data = create_tile_data(img, table, 1, 1, bpp)
+                    results[f"dedupe_tiles/{tag}"] = _time_call(
+                        lambda: dedupe_tiles(tile_data, bpp), repeat)
+
+                    if has_codec:
+                        # Packed ahead of time so only the codec itself is timed
+                        tile_bytes = struct.pack("<%dI" % len(tile_data), *(int(s, 16) for s in tile_data))
+                        results[f"gba_lz77_compress/{tag}"] = _time_call(
+                            lambda: gba_lz77_compress(tile_bytes), repeat)
+                        results[f"compress_tile_data/{tag}"] = _time_call(
+                            lambda: compress_tile_data(tile_data), repeat)
+
+                    # Emitters
+                    args = _unit_args(image_path, tmp_dir, bpp, (1, 1), dedupe=False, compress=False)
+                    results[f"create_c_file/{tag}"] = _time_call(
+                        lambda: create_c_file(args, img, tile_data, None, palette), repeat)
+                    results[f"create_header_file/{tag}"] = _time_call(
+                        lambda: create_header_file(args, img, palette), repeat)
+
+                    if has_codec:
+                        with contextlib.redirect_stdout(io.StringIO()):
+                            compressed = compress_tile_data(tile_data)
+                        results[f"create_compressed_c_file/{tag}"] = _time_call(
+                            lambda: create_compressed_c_file(args, img, palette, compressed), repeat)
+
+                    # End to end over dedupe/compress on and off
+                    for dedupe in (False, True):
+                        for compress in (False, True):
+                            if compress and not has_codec:
+                                continue
+                            e2e_args = _unit_args(image_path, tmp_dir, bpp, (1, 1), dedupe, compress)
+                            results[f"end_to_end/{tag}/dedupe{int(dedupe)}_compress{int(compress)}"] = _time_call(
+                                lambda: run_conversion(e2e_args), repeat)
+
+    return results
+
+
+def compare_results(baseline: dict, current: dict, threshold: float) -> list[str]:
+    """
+    Finds every benchmark that got slower than the baseline by more than the threshold.
+    :param baseline: Results of the baseline run
+    :param current: Results of the current run
+    :param threshold: Allowed slowdown as a fraction (0.15 = 15%)
+    :return: A list of printable regression descriptions
+    """
+    regressions = []
+    for name, result in current.items():
+        if name not in baseline:
+            continue
+        old = baseline[name]["min"]
+        new = result["min"]
+        if old > 0 and (new - old) / old > threshold:
+            regressions.append(f"{name}: {old*1000:.3f} ms -> {new*1000:.3f} ms (+{(new - old) / old * 100:.1f}%)")
+
+    return regressions
+
+
+def _load_results(path: str) -> dict:
+    with open(path) as file:
+        return json.load(file)["results"]
+
+
+def _report_regressions(baseline: dict, current: dict, threshold: float) -> int:
+    """
+    Prints the regressions between two result sets.
+    :return: Exit code (1 if any benchmark regressed)
+    """
+    regressions = compare_results(baseline, current, threshold)
+    if regressions:
+        print(f"* {len(regressions)} benchmark(s) regressed by more than {threshold*100:.0f}%:")
+        for line in regressions:
+            print(f" \t{line}")
+        return 1
+
+    print(f"* No benchmark regressed by more than {threshold*100:.0f}%")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the pix2gba conversion pipeline.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="Run the benchmarks and save the results as JSON")
+    run.add_argument("--output", default="bench_results.json", help="Path of the JSON results")
+    run.add_argument("--full", action="store_true", help="Use every size from 8x8 up to 1024x1024")
+    run.add_argument("--sizes", type=int, nargs="+", default=None, help="Square image sizes to benchmark")
+    run.add_argument("--kinds", nargs="+", default=IMAGE_KINDS, choices=IMAGE_KINDS, help="Kinds of images")
+    run.add_argument("--repeat", type=int, default=3, help="Runs per benchmark (the minimum is kept)")
+    run.add_argument("--compare", default=None, help="Baseline JSON to compare the new results against")
+    run.add_argument("--threshold", type=float, default=0.15, help="Allowed slowdown before flagging (fraction)")
+
+    compare = sub.add_parser("compare", help="Compare two saved result files")
+    compare.add_argument("baseline", help="Baseline JSON")
+    compare.add_argument("current", help="Current JSON")
+    compare.add_argument("--threshold", type=float, default=0.15, help="Allowed slowdown before flagging (fraction)")
+
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        return _report_regressions(_load_results(args.baseline), _load_results(args.current), args.threshold)
+
+    sizes = args.sizes or (FULL_SIZES if args.full else QUICK_SIZES)
+    results = run_benchmarks(sizes, args.kinds, args.repeat)
+
+    with open(args.output, "w") as file:
+        json.dump({
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "results": results,
+        }, file, indent=2)
+    print(f"* Saved {len(results)} results to {args.output}")
+
+    if args.compare:
+        return _report_regressions(_load_results(args.compare), results, args.threshold)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
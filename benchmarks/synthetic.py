@@ -0,0 +1,89 @@
+import numpy as np
+from PIL import Image as PILImage
+
+# Kinds of synthetic images the benchmarks can generate
+IMAGE_KINDS = [
+    "noise",
+    "flat",
+    "tiled",
+    "photo",
+]
+
+
+def _random_colors(rng: np.random.Generator, count: int) -> np.ndarray:
+    """
+    Creates `count` distinct-ish random RGB888 colors.
+    :param rng: The random generator
+    :param count: Number of colors
+    :return: A (count, 3) uint8 array of colors
+    """
+    # Keep colors on the RGB15 grid so two colors never collapse into one GBA color
+    return (rng.integers(0, 32, size=(count, 3)) * 8).astype(np.uint8)
+
+
+def noise_image(width: int, height: int, bpp: int, rng: np.random.Generator) -> PILImage.Image:
+    """
+    Every pixel is a random pick out of 2^bpp colors (worst case for dedupe and compression).
+    """
+    colors = _random_colors(rng, 1 << bpp)
+    indices = rng.integers(0, len(colors), size=(height, width))
+    return PILImage.fromarray(colors[indices], "RGB")
+
+
+def flat_image(width: int, height: int, bpp: int, rng: np.random.Generator) -> PILImage.Image:
+    """
+    A single color (best case for dedupe and compression).
+    """
+    color = _random_colors(rng, 1)[0]
+    return PILImage.fromarray(np.broadcast_to(color, (height, width, 3)).copy(), "RGB")
+
+
+def tiled_image(width: int, height: int, bpp: int, rng: np.random.Generator) -> PILImage.Image:
+    """
+    A map built from a small set of random 8x8 tiles (typical background).
+    """
+    colors = _random_colors(rng, 1 << bpp)
+    tile_set = rng.integers(0, len(colors), size=(16, 8, 8))
+
+    tiles_h = max(1, height // 8)
+    tiles_w = max(1, width // 8)
+    picks = rng.integers(0, len(tile_set), size=(tiles_h, tiles_w))
+
+    # (tiles_h, tiles_w, 8, 8) -> (tiles_h * 8, tiles_w * 8)
+    indices = tile_set[picks].transpose(0, 2, 1, 3).reshape(tiles_h * 8, tiles_w * 8)
+    return PILImage.fromarray(colors[indices[:height, :width]], "RGB")
+
+
+def photo_image(width: int, height: int, bpp: int, rng: np.random.Generator) -> PILImage.Image:
+    """
+    Smooth gradients with grain, quantized down to 256 colors (photo-like backgrounds).
+    """
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    r = 127 + 127 * np.sin(x / max(width, 1) * 6.0)
+    g = 127 + 127 * np.cos(y / max(height, 1) * 4.0)
+    b = 127 + 127 * np.sin((x + y) / max(width + height, 1) * 5.0)
+    rgb = np.stack([r, g, b], axis=-1) + rng.normal(0, 12, size=(height, width, 3))
+    rgb = np.clip(rgb, 0, 255).astype(np.uint8)
+
+    img = PILImage.fromarray(rgb, "RGB")
+    return img.quantize(256).convert("RGB")
+
+
+def make_image(kind: str, width: int, height: int, bpp: int, seed: int = 0) -> PILImage.Image:
+    """
+    Creates a reproducible synthetic image.
+    :param kind: One of IMAGE_KINDS
+    :param width: Width in pixels
+    :param height: Height in pixels
+    :param bpp: Bits per pixel the image is meant for (limits the number of colors)
+    :param seed: Seed of the random generator
+    :return: The RGB PIL image
+    """
+    generators = {
+        "noise": noise_image,
+        "flat": flat_image,
+        "tiled": tiled_image,
+        "photo": photo_image,
+    }
+    rng = np.random.default_rng(seed)
+    return generators[kind](width, height, bpp, rng)
@@ -0,0 +1,2 @@
+from .library import ConvertOptions, ConvertResult, convert_image
+from .errors import Pix2gbaError, InvalidOptionsError, ConversionError
@@ -0,0 +1,45 @@
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class DeltaRun:
+    """
+    Consecutive VRAM slots that change between two frames and get consecutive tiles (one DMA).
+
+    :param slot: First tile slot of the frame (in the frame's tile order) that changes.
+    :param tile: Index in the unit's Tiles of the first new tile.
+    :param count: Number of slots (and tiles) in the run.
+    """
+    slot: int
+    tile: int
+    count: int
+
+
+def frame_deltas(tile_mapping: list, frame_tiles: int) -> list[list[DeltaRun]]:
+    """
+    Finds the tiles that change going from every frame to the next (the last frame loops back to the first).
+    :param tile_mapping: Screen entry (deduped tile index) of every slot of every frame, frame after frame
+    :param frame_tiles: Number of tiles (slots) in one frame
+    :return: The DeltaRuns of every transition (transition N goes from frame N to frame N+1)
+    """
+    frames = [tile_mapping[i:i + frame_tiles] for i in range(0, len(tile_mapping), frame_tiles)]
+
+    deltas = []
+    for n, frame in enumerate(frames):
+        next_frame = frames[(n + 1) % len(frames)]
+
+        runs = []
+        for slot, (old, new) in enumerate(zip(frame, next_frame)):
+            if old == new:
+                continue
+            tile = new & 0x3FF
+
+            # Extend the last run when both the slot and the tile follow it
+            if runs and runs[-1].slot + runs[-1].count == slot and runs[-1].tile + runs[-1].count == tile:
+                last = runs[-1]
+                runs[-1] = DeltaRun(slot=last.slot, tile=last.tile, count=last.count + 1)
+            else:
+                runs.append(DeltaRun(slot=slot, tile=tile, count=1))
+        deltas.append(runs)
+
+    return deltas
@@ -1,19 +1,115 @@
 import os, sys
 import re
+import glob
+import json
+import time
+from dataclasses import asdict
 from pathlib import Path
-from PySide6 import QtCore, QtGui, QtWidgets
+from concurrent.futures import ProcessPoolExecutor
 from PIL import Image as PILImage
 
-from .config import discover_build_roots, build_units, validate_unit, convert_unit, find_unit, create_unit_args
-from .visualizer import OutputWindow
-from .converter import simulate_conversion
+from .config import discover_build_roots, load_toml_cache, save_toml_cache, build_units, validate_unit, convert_unit, load_unit, create_unit_args, budget_bytes, \
+    plan_palette_pools, clean_palette_pool, prepare_unit, unit_scene, plan_vram_scene, clean_vram_scenes
+from .converter import simulate_conversion, estimate_conversion_memory, emit_conversion
+from .streaming import can_stream, estimate_streaming_memory
 from .config import clean_unit
-from .units import ConversionStats, VerificationStats
+from .units import ConversionStats, VerificationStats, UnitReport
 from .template_output import add_template_file
 from .deduper import dedupe_tiles
+from .preview import write_unit_preview
+from .deep_verify import deep_verify_unit, deep_verify_scene
+from .palette_pool import pool_unit_args
+from .png_header import load_header_cache, save_header_cache
+from .unit_index import build_unit_index, duplicate_units, lookup_unit, select_unit_names, save_unit_index, \
+    load_unit_index, is_unit_glob
+from .errors import Pix2gbaError
+from .watcher import watched_sources, source_snapshot, changed_sources
+from .conversion_cache import ConversionCache, enable_conversion_cache, disable_conversion_cache, \
+    default_cache_directory, DEFAULT_CACHE_SIZE
+from .profiler import Profiler, enable_profiling, disable_profiling, unit as profile_unit
 
 ROOT_DIRECTORY = Path(os.getcwd())
 
+# Discovery options (set from the command line)
+IGNORE_GLOBS: list[str] = []
+NESTED_PROJECTS = False
+
+# Conversion cache options (set from the command line, the cache is off without a directory)
+CACHE_DIRECTORY: Path = None
+CACHE_SIZE = DEFAULT_CACHE_SIZE
+
+def _cache_path(file_name: str) -> Path:
+    return ROOT_DIRECTORY / ".pix2gba" / file_name
+
+def _index_units(build_paths: list[Path]) -> dict:
+    """
+    Indexes the units of the discovered projects by name, warns about names used more than once and saves the index
+    :param build_paths: The directories containing a pix2gba.toml
+    :return: The unit index
+    """
+    index = build_unit_index(build_paths)
+    for name, locations in duplicate_units(index).items():
+        print(f" \tWARNING: Unit `{name}` is defined in more than one project: "
+              f"{', '.join(str(location.toml_path) for location in locations)}")
+    save_unit_index(index, _cache_path("unit_index.json"))
+    return index
+
+def _discover_build_roots() -> list[Path]:
+    """
+    Finds every project below ROOT_DIRECTORY (refreshing the unit index) and loads what earlier runs parsed
+    (TOMLs and PNG headers)
+    :return: The directories containing a pix2gba.toml
+    """
+    load_toml_cache(_cache_path("toml_cache.json"))
+    load_header_cache(_cache_path("png_headers.json"))
+    build_paths = discover_build_roots(ROOT_DIRECTORY, IGNORE_GLOBS, NESTED_PROJECTS)
+    _index_units(build_paths)
+    return build_paths
+
+def _indexed_units(patterns: list[str]) -> dict:
+    """
+    Finds the units matching names or globs through the unit index. Only exact names are looked up in a saved
+    index, globs (and names the index is missing, out of date or wrong about) search the whole tree again
+    :param patterns: Unit names or globs (e.g. `enemy_*`)
+    :return: Dictionary of every matching unit name to the places it is defined (empty if nothing matches)
+    """
+    load_toml_cache(_cache_path("toml_cache.json"))
+    load_header_cache(_cache_path("png_headers.json"))
+
+    index = None
+    if not any(is_unit_glob(pattern) for pattern in patterns):
+        index = load_unit_index(_cache_path("unit_index.json"))
+    if index is not None:
+        matches = {name: lookup_unit(index, name) for name in select_unit_names(index, patterns)}
+        if matches and all(matches.values()):
+            return matches
+
+    # The units may be new or moved, look through the whole tree again
+    index = _index_units(discover_build_roots(ROOT_DIRECTORY, IGNORE_GLOBS, NESTED_PROJECTS))
+    return {name: index[name] for name in select_unit_names(index, patterns)}
+
+def _find_unit(img_name: str):
+    """
+    Finds a single unit by name through the unit index
+    :param img_name: Name of the unit
+    :return: The ConversionUnit
+    """
+    locations = _indexed_units([img_name]).get(img_name)
+    if not locations:
+        raise Pix2gbaError(f"Unit does not exist: `{img_name}`")
+    if len(locations) > 1:
+        raise Pix2gbaError(f"Unit `{img_name}` is defined in more than one project: "
+                           f"{', '.join(str(location.toml_path) for location in locations)}")
+    return load_unit(locations[0].toml_path, locations[0].position)
+
+def _save_caches() -> None:
+    """
+    Saves the parsed TOMLs and PNG headers so the next command doesn't parse them again
+    :return: None
+    """
+    save_toml_cache(_cache_path("toml_cache.json"))
+    save_header_cache(_cache_path("png_headers.json"))
+
 def _output_conversion_stats(stats: ConversionStats) -> None:
     """
     Output the final stats (how many failed and which ones)
@@ -41,25 +137,233 @@ def _output_conversion_stats(stats: ConversionStats) -> None:
               "directory with units")
 
 
-def build_outputs():
+def _output_profile(profiler: Profiler, profile_json: str, profile_trace: str) -> None:
     """
-    Handler for finding all units, converting them, and saving the output
+    Output the per stage timings of the conversion (and save them if asked)
+    :param profiler: The Profiler that recorded the conversion
+    :param profile_json: Path to save the timings as JSON (None to skip)
+    :param profile_trace: Path to save the timings as a Chrome trace (None to skip)
     :return: None
     """
-    print(f"* Converting all units in {ROOT_DIRECTORY}")
+    print("* Profile... ")
+    print(profiler.summary_table())
 
-    # Fetch all toml files
-    build_paths = discover_build_roots(ROOT_DIRECTORY)
+    if profile_json:
+        profiler.write_json(Path(profile_json))
+        print(f" \tSaved profile JSON to {profile_json}")
+
+    if profile_trace:
+        profiler.write_chrome_trace(Path(profile_trace))
+        print(f" \tSaved Chrome trace to {profile_trace}")
+
+def _format_mb(num_bytes: int) -> str:
+    return f"{num_bytes / (1 << 20):.1f} MB"
+
+def _check_size_budgets(units: list, reports: dict, pools: dict) -> list[dict]:
+    """
+    Adds up the ROM and VRAM use of the units of each TOML and checks it against the TOML's budgets
+    :param units: The converted ConversionUnits
+    :param reports: Dictionary of unit name to its UnitReport
+    :param pools: Dictionary of build root to its PalettePool (the shared palettes count towards the ROM)
+    :return: A list with the usage (and budget) of each TOML
+    """
+    budgets = {}
+    for unit in units:
+        report = reports.get(unit.name)
+        if report is None:
+            continue
+
+        config = unit.config
+        entry = budgets.setdefault(str(config.root_dir), {
+            "root": str(config.root_dir),
+            "rom_used": 0,
+            "rom_budget": budget_bytes(config.rom_budget),
+            "vram_used": 0,
+            "vram_budget": budget_bytes(config.vram_budget),
+        })
+        entry["rom_used"] += report.rom_bytes
+        entry["vram_used"] += report.vram_bytes
+
+    for root_dir, pool in pools.items():
+        if str(root_dir) in budgets:
+            budgets[str(root_dir)]["rom_used"] += pool.palette_bytes()
+
+    for entry in budgets.values():
+        entry["rom_ok"] = entry["rom_budget"] is None or entry["rom_used"] <= entry["rom_budget"]
+        entry["vram_ok"] = entry["vram_budget"] is None or entry["vram_used"] <= entry["vram_budget"]
+
+    return list(budgets.values())
+
+def _output_budget_stats(budgets: list[dict]) -> bool:
+    """
+    Output the ROM and VRAM use of every TOML (and if it fits its budget)
+    :param budgets: The usage of each TOML from _check_size_budgets
+    :return: True if any budget was exceeded, False otherwise
+    """
+    exceeded = False
+    print("* Size Budgets... ")
+    for entry in budgets:
+        for kind in ("rom", "vram"):
+            used = entry[f"{kind}_used"]
+            budget = entry[f"{kind}_budget"]
+            usage = f"{entry['root']} {kind.upper()}: {used} bytes"
+            if budget is not None:
+                usage += f" / {budget} bytes ({used / budget * 100:.1f}%)"
+
+            if entry[f"{kind}_ok"]:
+                print(f" \t{usage}")
+            else:
+                print(f" \tERROR: {usage}, over budget by {used - budget} bytes")
+                exceeded = True
+
+    return exceeded
+
+def _write_build_report(report_path: str, reports: dict, budgets: list[dict], stats: ConversionStats,
+                        pools: dict, plans: list) -> None:
+    """
+    Saves the sizes of every converted unit (and the budgets) as JSON
+    :param report_path: Path of the JSON file
+    :param reports: Dictionary of unit name to its UnitReport
+    :param budgets: The usage of each TOML from _check_size_budgets
+    :param stats: The final conversion statistics
+    :param pools: Dictionary of build root to its PalettePool
+    :param plans: The VramPlan of every scene
+    :return: None
+    """
+    with open(report_path, "w") as file:
+        json.dump({
+            "units": [asdict(r) for r in reports.values()],
+            "totals": {
+                "rom_bytes": sum(r.rom_bytes for r in reports.values()),
+                "vram_bytes": sum(r.vram_bytes for r in reports.values()),
+                "build_time": sum(r.build_time for r in reports.values()),
+            },
+            "budgets": budgets,
+            "palette_pools": [{
+                "root": str(root_dir),
+                "name": pool.name,
+                "bg_banks": pool.bank_count("bg"),
+                "obj_banks": pool.bank_count("obj"),
+                "palette_bytes": pool.palette_bytes(),
+                "units": {name: {"layer": a.layer, "bank": a.bank} for name, a in pool.assignments.items()},
+                "lossy_units": pool.lossy_units,
+            } for root_dir, pool in pools.items()],
+            "vram_scenes": [{
+                "name": plan.scene,
+                "obj_mapping": plan.obj_mapping,
+                "bg_bytes": plan.bg_bytes,
+                "bg_capacity": plan.bg_capacity,
+                "obj_bytes": plan.obj_bytes,
+                "obj_capacity": plan.obj_capacity,
+                "units": {name: asdict(p) for name, p in plan.placements.items()},
+                "errors": plan.errors,
+            } for plan in plans],
+            "failed_units": stats.failed_conversion_names,
+        }, file, indent=2)
+
+    print(f" \tSaved build report to {report_path}")
+
+def _output_palette_pools(pools: dict) -> None:
+    """
+    Output how the palettes of each TOML were pooled
+    :param pools: Dictionary of build root to its PalettePool
+    :return: None
+    """
+    for pool in pools.values():
+        print(f"* Pooled {len(pool.assignments)} unit palettes into `{pool.name}`: "
+              f"{pool.bank_count('bg')} BG banks, {pool.bank_count('obj')} OBJ banks ({pool.palette_bytes()} bytes)")
+        if pool.lossy_units:
+            print(f" 	WARNING: Banks were full, these units use the closest colors: {', '.join(pool.lossy_units)}")
+
+def _output_vram_plan(plan) -> None:
+    """
+    Output where the units of a scene were placed in VRAM (or why they didn't fit)
+    :param plan: The VramPlan of the scene
+    :return: None
+    """
+    print(f"* Planned VRAM of scene `{plan.scene}`: BG {plan.bg_bytes}/{plan.bg_capacity} bytes, "
+          f"OBJ {plan.obj_bytes}/{plan.obj_capacity} bytes ({plan.obj_mapping.upper()} mapping)")
+    for placement in plan.placements.values():
+        where = f"charblock {placement.char_block}" if placement.layer == "bg" else "OBJ VRAM"
+        print(f" \t{placement.name}: tile {placement.tile_base} of {where} (0x{placement.address:05x}, "
+              f"{placement.size} bytes)")
+    for error in plan.errors:
+        print(f" \tERROR: {error}")
+
+def build_outputs(profile: bool = False, profile_json: str = None, profile_trace: str = None,
+                  profile_memory: bool = False, max_memory: int = None, report_path: str = None,
+                  unit_patterns: list[str] = None, stream: bool = False) -> bool:
+    """
+    Handler for finding all units (or the ones matching unit_patterns), converting them, and saving the output
+    :param profile: If the time spent in each stage of the conversion should be printed
+    :param profile_json: Path to save the stage timings as JSON (implies profile)
+    :param profile_trace: Path to save the stage timings as a Chrome trace (implies profile)
+    :param profile_memory: If the peak memory of each unit should be measured and printed (implies profile)
+    :param max_memory: Memory budget in bytes per unit, units going above it fail (None for no budget)
+    :param report_path: Path to save the JSON build report with every unit's sizes (None to skip)
+    :param unit_patterns: Names or globs (e.g. `enemy_*`) of the units to build (None for every unit), ROM/VRAM
+                          budgets are only checked when every unit is built
+    :param stream: If the units should be converted a metatile row at a time (units in a scene, or in sprite,
+                   animation, bitmap or palette bank mode are converted whole), units above max_memory are
+                   streamed without it when they can be
+    :return: True if the build went over a ROM/VRAM budget or a scene didn't fit in VRAM, False otherwise
+    """
+    if unit_patterns:
+        print(f"* Converting units matching `{'`, `'.join(unit_patterns)}` in {ROOT_DIRECTORY}")
+    else:
+        print(f"* Converting all units in {ROOT_DIRECTORY}")
+
+    show_profile = profile or profile_json or profile_trace or profile_memory
+    profiler = None
+    if show_profile or max_memory is not None:
+        profiler = enable_profiling(track_memory=profile_memory or max_memory is not None)
+
+    cache = None
+    if CACHE_DIRECTORY is not None:
+        cache = enable_conversion_cache(CACHE_DIRECTORY, CACHE_SIZE)
+
+    # Fetch all toml files (a targeted build only needs the projects of its units)
+    selected_names = None
+    if unit_patterns:
+        matches = _indexed_units(unit_patterns)
+        if not matches:
+            raise Pix2gbaError(f"No unit matches: `{'`, `'.join(unit_patterns)}`")
+        selected_names = set(matches)
+        build_paths = list(dict.fromkeys(location.toml_path.parent for locations in matches.values()
+                                         for location in locations))
+    else:
+        build_paths = _discover_build_roots()
 
     # Build units from toml
     potential_units = build_units(build_paths)
 
+    # Merge the auto-generated palettes of TOMLs that pool them (with every unit of the TOML, so a targeted
+    # build gets the same shared palettes as a full one)
+    pools = {}
+    if any(unit.config.palette_pool is not None for unit in potential_units):
+        with profile_unit("(palette pools)"):
+            pools = plan_palette_pools(potential_units)
+        _output_palette_pools(pools)
+
+    if selected_names is not None:
+        # A scene is placed in VRAM as a whole, so the other units of a selected unit's scene are built too
+        scene_mates = {(unit.config, name) for unit in potential_units
+                       if unit.name in selected_names and unit_scene(unit) is not None
+                       for name in unit_scene(unit).units}
+        potential_units = [unit for unit in potential_units
+                           if unit.name in selected_names or (unit.config, unit.name) in scene_mates]
+        print(f" \tSelected {len(potential_units)} units: {', '.join(unit.name for unit in potential_units)}")
+
     # Create statistics tracker
     stats = ConversionStats(
         total_conversions=len(potential_units),
         successful_conversions=0,
         failed_conversion_names =[]
     )
+    reports = {}
+
+    # Units of a scene are only emitted once the whole scene is placed in VRAM
+    prepared_units = {}
 
     # Process all units
     for unit in potential_units:
@@ -71,18 +375,161 @@ def build_outputs():
             stats.failed_conversion_names.append(unit.name)
             continue
 
-        # Increment success stat
-        stats.successful_conversions += 1
+        # Make sure the unit can fit in the memory budget before starting
+        scene = unit_scene(unit)
+        stream_unit = stream
+        if max_memory is not None:
+            unit_args = create_unit_args(unit)
+            streamable = can_stream(unit_args) and scene is None
+            if stream_unit and streamable:
+                estimate = estimate_streaming_memory(unit_args)
+            else:
+                estimate = estimate_conversion_memory(unit_args)
+                # Converting a metatile row at a time may fit where converting the whole image doesn't
+                if estimate > max_memory and streamable:
+                    estimate = estimate_streaming_memory(unit_args)
+                    stream_unit = True
+                    print(f" \t Streaming to stay within the --max-memory budget")
+            if estimate > max_memory:
+                print(f" \t ERROR: `{unit.name}` needs an estimated {_format_mb(estimate)}, "
+                      f"above the --max-memory budget of {_format_mb(max_memory)}\n")
+                stats.failed_conversion_names.append(unit.name)
+                continue
 
         # Send it to be converted
         print(f" \t Converting...")
-        convert_unit(unit)
+        report = UnitReport(name=unit.name)
+        start_time = time.perf_counter()
+        with profile_unit(unit.name) as record:
+            if scene is None:
+                failed = convert_unit(unit, report, pools.get(unit.config.root_dir), stream=stream_unit)
+            else:
+                args, prepared = prepare_unit(unit, pools.get(unit.config.root_dir))
+                failed = prepared is None
+        report.build_time = time.perf_counter() - start_time
+
+        if failed:
+            stats.failed_conversion_names.append(unit.name)
+            continue
+
+        # Fail the unit (and remove its output) if it went over the memory budget
+        if max_memory is not None:
+            peak = max(record.peak_traced, record.peak_rss)
+            if peak > max_memory:
+                print(f" \t ERROR: `{unit.name}` peaked at {_format_mb(peak)}, "
+                      f"above the --max-memory budget of {_format_mb(max_memory)}\n")
+                clean_unit(unit)
+                stats.failed_conversion_names.append(unit.name)
+                continue
+
+        if scene is not None:
+            prepared_units[unit.name] = (unit, report, args, prepared)
+            print(f" \t Waiting for the VRAM plan of `{scene.name}`.\n")
+            continue
+
+        # Increment success stat
+        stats.successful_conversions += 1
+        reports[unit.name] = report
 
         print(f" \t Done.\n")
 
+    # Place every scene in VRAM and emit its units with their tile indices offset
+    plans = []
+    scene_overflow = False
+    for config in dict.fromkeys(unit.config for unit in potential_units):
+        for scene in config.scenes:
+            members = {name: prepared_units.pop(name) for name in scene.units if name in prepared_units}
+            if selected_names is not None and not any(name in scene.units for name in selected_names):
+                continue
+            plan = plan_vram_scene(scene, config, {name: member[2:] for name, member in members.items()})
+            plans.append(plan)
+            print()
+            _output_vram_plan(plan)
+
+            # Nothing of a scene that doesn't fit is emitted
+            if plan.errors:
+                scene_overflow = True
+                stats.failed_conversion_names.extend(members)
+                continue
+
+            for name, (unit, report, args, prepared) in members.items():
+                args["tile_base"] = plan.placements[name].tile_base
+                with profile_unit(name):
+                    emit_conversion(args, prepared, report)
+                stats.successful_conversions += 1
+                reports[name] = report
+
     print()
     _output_conversion_stats(stats)
 
+    # Check the ROM/VRAM budgets of every TOML (they need every unit of the TOML, not only the selected ones)
+    budgets = _check_size_budgets(potential_units, reports, pools) if selected_names is None else []
+    budget_exceeded = False
+    if budgets:
+        print()
+        budget_exceeded = _output_budget_stats(budgets)
+
+    if report_path:
+        _write_build_report(report_path, reports, budgets, stats, pools, plans)
+
+    if profiler is not None:
+        if show_profile:
+            print()
+            _output_profile(profiler, profile_json, profile_trace)
+        disable_profiling()
+
+    if cache is not None:
+        disable_conversion_cache()
+        removed, _ = cache.prune()
+        print(f"\n* Conversion cache: {cache.hits} reused, {cache.misses} converted"
+              f"{f', {removed} old entries removed' if removed else ''} ({cache.directory})")
+
+    _save_caches()
+    return budget_exceeded or scene_overflow
+
+def watch_outputs(interval: float = 0.1) -> None:
+    """
+    Handler for building all units, then rebuilding the units whose sources (images, palette images or TOML)
+    change until interrupted. The process stays up so the parsed TOMLs, PNG headers and codec stay loaded.
+    :param interval: Seconds between two looks at the sources
+    :return: None
+    """
+    build_outputs()
+
+    watched = watched_sources(build_units(_discover_build_roots()))
+    snapshot = source_snapshot(watched)
+    print(f"\n* Watching {len(watched)} files for changes (Ctrl+C to stop)")
+
+    try:
+        while True:
+            time.sleep(interval)
+            new_snapshot = source_snapshot(watched)
+            changed = changed_sources(snapshot, new_snapshot)
+            snapshot = new_snapshot
+            if not changed:
+                continue
+
+            # A changed TOML can add, remove, rename or move units and sources, so its units are taken from
+            # what it defines now
+            toml_changed = any(source.name == "pix2gba.toml" for source in changed)
+            if toml_changed:
+                watched = watched_sources(build_units(_discover_build_roots()))
+
+            names = sorted(set().union(*(watched.get(source, set()) for source in changed)))
+            print(f"\n* Changed: {', '.join(source.name for source in changed)}")
+            if names:
+                try:
+                    # Unit names are matched as globs, escape them so only the exact units are rebuilt
+                    build_outputs(unit_patterns=[glob.escape(name) for name in names])
+                except Pix2gbaError as error:
+                    print(f"ERROR: {error}")
+
+            if toml_changed:
+                snapshot = source_snapshot(watched)
+                print(f"* Watching {len(watched)} files for changes (Ctrl+C to stop)")
+    except KeyboardInterrupt:
+        print("\n* Stopped watching")
+
 def clean_outputs():
     """
     Handler for removing all generated outputs
@@ -91,7 +538,7 @@ def clean_outputs():
     print(f"* Cleaning all units in {ROOT_DIRECTORY}")
 
     # Find all toml files
-    build_paths = discover_build_roots(ROOT_DIRECTORY)
+    build_paths = _discover_build_roots()
 
     # Find all units
     potential_units = build_units(build_paths)
@@ -100,18 +547,24 @@ def clean_outputs():
     for unit in potential_units:
         clean_unit(unit)
 
+    # Remove the shared palettes
+    for config in {unit.config for unit in potential_units}:
+        if config.palette_pool is not None:
+            clean_palette_pool(config)
+        clean_vram_scenes(config)
+
+    _save_caches()
+
 def view_output(img_name:str):
     """
     Handler for creating a window that shows what a unit will look like on a GBA
     :param img_name: Name of the unit to display
     :return: None
     """
-    # Get all reachable toml files
-    build_paths = discover_build_roots(ROOT_DIRECTORY)
-
-    # Find (and validate) the unit from all toml
-    found_unit = find_unit(build_paths, img_name)
+    # Find (and validate) the unit through the unit index
+    found_unit = _find_unit(img_name)
     validate_unit(found_unit)
+    _save_caches()
 
     # Create Vizual Data
     tile_data, pal_data = simulate_conversion(create_unit_args(found_unit))
@@ -121,6 +574,10 @@ def view_output(img_name:str):
     #if found_unit.dedupe:
     #    tile_data = dedupe_tiles(tile_data, found_unit.config.bpp)
 
+    # Qt is only needed for the window, `preview` works without it
+    from PySide6 import QtWidgets
+    from .visualizer import OutputWindow
+
     # Visualize!
     app = QtWidgets.QApplication()
     output_window = OutputWindow(tile_data, pal_data, found_unit.config.bpp, img.width, img.height, found_unit.metatile_width, found_unit.metatile_height)
@@ -128,6 +585,61 @@ def view_output(img_name:str):
     output_window.show()
     app.exec()
 
+def preview_outputs(img_name: str = None, sheet: bool = False, scale: int = 1, jobs: int = None) -> bool:
+    """
+    Handler for rendering what units will look like on a GBA to PNGs, without opening a window
+    :param img_name: Name of the unit to preview (None for every unit)
+    :param sheet: If the deduped tile sheet and the reconstruction from the tile mapping should be shown side by side
+    :param scale: Integer scale of the PNGs
+    :param jobs: Number of worker processes (None for one per CPU)
+    :return: True if a preview failed, False otherwise
+    """
+    if img_name is not None:
+        units = [_find_unit(img_name)]
+    else:
+        print(f"* Previewing all units in {ROOT_DIRECTORY}")
+        units = build_units(_discover_build_roots())
+
+    # Only valid units get converted
+    failed = [unit.name for unit in units if validate_unit(unit)]
+    units = [unit for unit in units if unit.name not in failed]
+    total = len(failed) + len(units)
+
+    # Pooled units are shown with their shared bank, pooled over every unit of their TOML like `make` does
+    pool_units = units if img_name is None else build_units([unit.config.root_dir for unit in units])
+    pools = {}
+    if any(unit.config.palette_pool is not None for unit in units):
+        pools = plan_palette_pools([unit for unit in pool_units if unit is not None], write=False)
+
+    jobs_args = []
+    for unit in units:
+        args = create_unit_args(unit)
+        if unit.config.root_dir in pools:
+            args = pool_unit_args(args, pools[unit.config.root_dir])
+        preview_path = Path(args["destination_path"]) / f"{args['image_name']}_preview.png"
+        jobs_args.append((unit.name, args, preview_path))
+
+    # Units are independent, render them in parallel
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(write_unit_preview, args, preview_path, sheet, scale)
+                   for _, args, preview_path in jobs_args]
+
+        # Results come back in unit order so the printed output stays readable
+        for (name, _, preview_path), future in zip(jobs_args, futures):
+            print(f"* \t Previewing {name}...")
+            unit_failed, log = future.result()
+            print(log, end="")
+            if unit_failed:
+                failed.append(name)
+            else:
+                print(f" \t Saved {preview_path}")
+
+    _save_caches()
+    print(f"* Previewed {total - len(failed)}/{total} units")
+    if failed:
+        print(f" \tFailed units: {', '.join(failed)}")
+    return len(failed) != 0
+
 def make_template():
     """
     Creates a template TOML in the project directory
@@ -146,7 +658,24 @@ def _output_verification_stats(stats: VerificationStats) -> None:
         "Null",
         "Image path does not exist",
         "Palette path does not exist",
-        "Metatile width and height must be >= 1"
+        "Metatile width and height must be >= 1",
+        "Palette banks must be between 1 and 16",
+        "Palette banks need 4bpp and an auto-generated palette",
+        "Layer must be `bg` or `obj`",
+        "Palette variant path does not exist",
+        "Palette variants can't be used with palette banks",
+        "Mode is not accepted",
+        "Sprite mode can't be used with dedupe, elide_empty or palette_banks",
+        "Bitmap mode must be 3, 4 or 5",
+        "Bitmap mode can't be used with dedupe, elide_empty, palette_banks, variants or in a scene",
+        "Frame width and height must be positive multiples of 8",
+        "Animation mode can't be used with elide_empty or palette_banks",
+        "Unit failed to convert",
+        "Input image is not a valid PNG",
+        "Palette image has more entries than the bpp allows",
+        "Bitmap image is bigger than the frame of its mode",
+        "Animation image is not made of whole frames",
+        "Indexed image has more palette entries than the palette holds"
     ]
     """
     Output the final stats of the verification process (how many failed and which ones)
@@ -166,16 +695,52 @@ def _output_verification_stats(stats: VerificationStats) -> None:
         print(" \tNo conversion units were found! Use `pix2gba template` to create a valid TOML file and place in "
               "directory with units")
 
-def verify_inputs():
+def _output_deep_verification(results: list) -> None:
+    """
+    Output the round trip results of every unit
+    :param results: The DeepVerification of every unit
+    :return: None
+    """
+    print("* Round Trip...")
+    for result in results:
+        if result.failed:
+            print(f" \t{result.name}: failed to convert")
+            for warning in result.warnings:
+                print(f" \t\t WARNING: {warning}")
+            continue
+
+        colors = f"{result.source_colors} colors"
+        if result.palette_colors is not None:
+            colors += f" for {result.palette_colors} palette entries"
+        print(f" \t{result.name} ({result.width}x{result.height}, {colors}): {result.mismatch_rate*100:.2f}% of "
+              f"pixels mismatched ({result.mismatched_pixels}/{result.width * result.height})")
+        for warning in result.warnings:
+            print(f" \t\t WARNING: {warning}")
+    print()
+
+def _deep_verify_args(unit, pool) -> tuple[dict, list]:
+    """
+    :param unit: The ConversionUnit
+    :param pool: PalettePool of the unit's config (None if its palettes aren't pooled)
+    :return: The conversion arguments of the unit and the palette memory it is shown with (None for its own palette)
+    """
+    args = create_unit_args(unit)
+    if pool is None or unit.name not in pool.assignments:
+        return args, None
+    return pool_unit_args(args, pool), pool.layer_palette(pool.assignments[unit.name].layer)
+
+def verify_inputs(deep: bool = False, jobs: int = None):
     """
     Handler for verifying all units in the TOML files can be converted successfully
+    :param deep: If every unit should also be converted in memory and decoded back to diff it against its source
+    :param jobs: Number of worker processes for the deep verification (None for one per CPU)
     :return:
     """
     print(f"* Verifying all units in {ROOT_DIRECTORY}")
 
     # Fetch all toml files
     print("*\t Verifying default configs...")
-    build_paths = discover_build_roots(ROOT_DIRECTORY)
+    build_paths = _discover_build_roots()
 
     # Build units from toml
     potential_units = build_units(build_paths)
@@ -188,6 +753,7 @@ def verify_inputs():
         failed_unit_names=[],
         unit_error_code=[]
     )
+    valid_units = []
 
     # Process all units
     for unit in potential_units:
@@ -206,23 +772,84 @@ def verify_inputs():
             print(f" \t Done.")
 
         stats.successful_units += 1
+        valid_units.append(unit)
 
         print()
 
+    # Round trip every valid unit, they are independent so they run in parallel (a scene's units are placed in
+    # VRAM together, so they go through one worker)
+    if deep and valid_units:
+        print("* Converting and decoding all valid units...")
+        pools = plan_palette_pools([unit for unit in potential_units if unit is not None], write=False)
+        scenes = {}
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            unit_futures = []
+            for unit in valid_units:
+                args, palette_memory = _deep_verify_args(unit, pools.get(unit.config.root_dir))
+                scene = unit_scene(unit)
+                if scene is None:
+                    unit_futures.append(executor.submit(deep_verify_unit, unit.name, args, palette_memory))
+                    continue
+                if (unit.config.root_dir, scene.name) not in scenes:
+                    scenes[(unit.config.root_dir, scene.name)] = (scene, unit.config, {}, {})
+                scene_args, palette_memories = scenes[(unit.config.root_dir, scene.name)][2:]
+                scene_args[unit.name] = args
+                palette_memories[unit.name] = palette_memory
+            scene_futures = [executor.submit(deep_verify_scene, *scene) for scene in scenes.values()]
+
+            verified = [future.result() for future in unit_futures]
+            for future in scene_futures:
+                verified += future.result()
+
+        results = []
+        for result, log in verified:
+            print(log, end="")
+            results.append(result)
+        print()
+
+        for result in results:
+            if result.failed:
+                stats.successful_units -= 1
+                stats.failed_unit_names.append(result.name)
+                stats.unit_error_code.append(15)
+        _output_deep_verification(results)
+
+    _save_caches()
     _output_verification_stats(stats)
 
+def _cache() -> ConversionCache:
+    return ConversionCache(CACHE_DIRECTORY or default_cache_directory(), CACHE_SIZE)
+
+def cache_stats() -> None:
+    """
+    Handler for showing what the conversion cache holds.
+    :return: None
+    """
+    stats = _cache().stats()
+    print(f"* Conversion cache in {stats.directory}")
+    print(f" \tEntries: {stats.entries}")
+    print(f" \tSize: {_format_mb(stats.total_bytes)} of {_format_mb(stats.max_bytes)}")
+
+def prune_cache() -> None:
+    """
+    Handler for removing the least recently used entries of the conversion cache until it fits its size.
+    :return: None
+    """
+    cache = _cache()
+    print(f"* Pruning the conversion cache in {cache.directory} to {_format_mb(cache.max_bytes)}")
+    removed, freed = cache.prune()
+    print(f" \tRemoved {removed} entries ({_format_mb(freed)})")
+
 def create_byte_data(img_name:str):
     """
     Handler for creating the raw byte data of the unit
     :param img_name: Name of the unit to create
     :return: None
     """
-    # Get all reachable toml files
-    build_paths = discover_build_roots(ROOT_DIRECTORY)
-
-    # Find (and validate) the unit from all toml
-    found_unit = find_unit(build_paths, img_name)
+    # Find (and validate) the unit through the unit index
+    found_unit = _find_unit(img_name)
     validate_unit(found_unit)
+    _save_caches()
 
     # Create Vizual Data
     tile_data, pal_data = simulate_conversion(create_unit_args(found_unit))
@@ -0,0 +1,76 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from .gba_utils import open_rgb_image, rgb888_array_to_rgb15
+
+
+@dataclass(frozen=True)
+class BitmapMode:
+    """
+    Frame size and pixel format of a GBA bitmap mode.
+
+    :param width: Width of the frame in pixels.
+    :param height: Height of the frame in pixels.
+    :param bpp: Bits per pixel (16 for RGB15 direct color, 8 for palette indices).
+    """
+    width: int
+    height: int
+    bpp: int
+
+
+BITMAP_MODES = {
+    3: BitmapMode(width=240, height=160, bpp=16),  # RGB15 direct color, one frame
+    4: BitmapMode(width=240, height=160, bpp=8),   # 8bpp indexed, two pages
+    5: BitmapMode(width=160, height=128, bpp=16),  # RGB15 direct color, two smaller pages
+}
+
+
+def bitmap_row_width(width: int, bpp: int) -> int:
+    """
+    Width rows of a bitmap are stored with. VRAM can't be written a byte at a time, so 8bpp rows are
+    padded to whole halfwords.
+    :param width: Width of the image in pixels
+    :param bpp: Bits per pixel of the bitmap
+    :return: The stored row width in pixels
+    """
+    if bpp == 8:
+        return width + (width & 1)
+    return width
+
+
+def _pack_words(pixels: np.ndarray) -> np.ndarray:
+    """
+    Packs a row major plane of pixels (uint8 or uint16) into little endian u32 words, padding the end with 0.
+    :param pixels: (height, width) array of pixels
+    :return: Array of u32 words
+    """
+    data = np.ascontiguousarray(pixels, dtype=pixels.dtype.newbyteorder("<")).view(np.uint8).ravel()
+    padding = -len(data) % 4
+    if padding:
+        data = np.concatenate([data, np.zeros(padding, dtype=np.uint8)])
+    return data.view("<u4")
+
+
+def create_direct_bitmap(img) -> np.ndarray:
+    """
+    Converts an image to RGB15 direct color in row major order (Mode 3 and 5).
+    :param img: Path to the input image (or the already loaded image)
+    :return: Array of u32 words, two pixels per word with the left pixel in the low halfword
+    """
+    pixels = np.asarray(open_rgb_image(img), dtype=np.uint8)
+    return _pack_words(rgb888_array_to_rgb15(pixels))
+
+
+def create_indexed_bitmap(indices: np.ndarray) -> np.ndarray:
+    """
+    Packs a plane of palette indices in row major order (Mode 4).
+    :param indices: (height, width) array of palette indices
+    :return: Array of u32 words, four pixels per word with the leftmost pixel in the lowest byte
+    """
+    height, width = indices.shape
+    row_width = bitmap_row_width(width, 8)
+
+    plane = np.zeros((height, row_width), dtype=np.uint8)
+    plane[:, :width] = indices
+    return _pack_words(plane)
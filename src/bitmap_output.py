@@ -0,0 +1,162 @@
+from datetime import datetime
+from PIL import Image as PILImage
+from .bitmap import bitmap_row_width
+from .tile_output import get_filename_from_path, palette_array, create_palette_png
+LoadedImage = PILImage.Image
+
+
+def _bitmap_name(arguments:dict) -> str:
+    return get_filename_from_path(arguments["image_path"])
+
+def create_bitmap_header_file(arguments:dict, image:LoadedImage, num_bytes:int, gba_palette:list,
+                              compressed_bytes:int = None) -> None:
+    """
+    Creates the header file for the bitmap output.
+    :param arguments: Command line arguments
+    :param image: The PIL image
+    :param num_bytes: Number of bytes of the (uncompressed) bitmap
+    :param gba_palette: The 256 color palette of a Mode 4 bitmap (None for direct color)
+    :param compressed_bytes: Number of bytes of the compressed bitmap (None if not compressed)
+    """
+    bitmap_mode = arguments["bitmap_mode"]
+    bpp = arguments["bpp"]
+    dest = arguments["destination_path"]
+    file_name = _bitmap_name(arguments)
+
+    row_width = bitmap_row_width(image.width, bpp)
+
+    # File header comments and include guard
+    file_str = "// " + file_name + "; Mode " + str(bitmap_mode) + " Bitmap"
+    file_str += "; Compressed with LZ77\n" if compressed_bytes is not None else "\n"
+    file_str += "#pragma once\n\n"
+
+    file_str += ("//======================================================================\n" +
+                 "//	" + file_name + ", " + str(row_width) + "pxl by " + str(image.height) + "pxl @ " + str(bpp) + "bpp\n" +
+                 "//\t+ Bitmap Mode     : " + str(bitmap_mode) + "\n" +
+                 "//\t+ Number of Bytes : " + str(num_bytes) + "\n")
+    if compressed_bytes is not None:
+        file_str += "//\t+ Compressed number of bytes   : " + str(compressed_bytes) + "\n"
+    else:
+        file_str += "//\t+ Number of U32   : " + str(num_bytes // 4) + "\n"
+    file_str += ("//\t" + str(datetime.now()) + "\n" +
+                 "//======================================================================\n\n")
+
+    file_str += ("/**\n" +
+                 " * @brief The bitmap mode (DISPCNT) " + file_name + " is made for. \n" +
+                 " * \n" +
+                 " */\n")
+    file_str += "#define " + file_name + "BitmapMode " + str(bitmap_mode) + "\n\n"
+
+    file_str += ("/**\n" +
+                 " * @brief The width (pixels per stored row) and height of " + file_name + ". \n" +
+                 " * \n" +
+                 " */\n")
+    file_str += "#define " + file_name + "Width " + str(row_width) + "\n"
+    file_str += "#define " + file_name + "Height " + str(image.height) + "\n\n"
+
+    file_str += ("/**\n" +
+                 " * @brief The number of bytes " + file_name + " occupies. \n" +
+                 " * \n" +
+                 " */\n")
+    file_str += "#define " + file_name + "BitmapLen " + str(num_bytes) + "\n\n"
+
+    if compressed_bytes is not None:
+        file_str += ("/**\n" +
+                     " * @brief The number of bytes in the compression stream for " + file_name + ". \n" +
+                     " * \n" +
+                     " */\n")
+        file_str += "#define " + file_name + "CompressedLen " + str(compressed_bytes) + "\n\n"
+        file_str += ("/**\n" +
+                     " * @brief The byte stream to decompress " + file_name + " to bitmap data. \n" +
+                     " * \n" +
+                     " */\n")
+        file_str += "extern const unsigned char " + file_name + "Compression[" + str(compressed_bytes) + "];\n"
+    else:
+        pixel_format = "rgb5 colors (2" if bpp == 16 else "Palette indices (4"
+        file_str += ("/**\n" +
+                     " * @brief The array of " + pixel_format + " packed into one uint) of " + file_name +
+                     " in row major order. \n" +
+                     " * \n" +
+                     " */\n")
+        file_str += "extern const unsigned int " + file_name + "Bitmap[" + str(num_bytes // 4) + "];\n"
+
+    # Mode 4 palette declarations if palette output is enabled
+    if gba_palette is not None and arguments["palette_included"]:
+        file_str += ("\n/**\n" +
+                     f" * @brief The number of bytes the Palette for {file_name} occupies. \n" +
+                     " * \n" +
+                     " */\n")
+        file_str += "#define " + file_name + "PalLen " + str(len(gba_palette) * 2) + "\n"
+
+        file_str += ("\n/**\n" +
+                     f" * @brief The array of rgb5 (short) numbers that create {file_name}'s Palette. \n" +
+                     " */\n")
+        file_str += "extern const unsigned short " + file_name + "Pal[" + str(len(gba_palette)) + "];\n"
+
+    new_file_name = f"{dest}/" if dest is not None else ""
+    new_file_name += file_name + ".h"
+    with open(new_file_name, "w") as file:
+        file.write(file_str)
+
+def create_bitmap_c_file(arguments:dict, bitmap_data:list, gba_palette:list, byte_data:bytes = None) -> None:
+    """
+    Creates the C file for the bitmap output.
+    :param arguments: Command line arguments
+    :param bitmap_data: The packed bitmap (uint32 hex strings)
+    :param gba_palette: The 256 color palette of a Mode 4 bitmap (None for direct color)
+    :param byte_data: The compressed bitmap (None if not compressed)
+    """
+    dest = arguments["destination_path"]
+    file_name = _bitmap_name(arguments)
+
+    if byte_data is not None:
+        file_str = ("const unsigned char " + file_name + "Compression[" + str(len(byte_data)) + "] "
+                    "__attribute__((aligned(4))) __attribute__((visibility(\"hidden\")))=\n{\n")
+        lines = [", ".join(f"0x{b:02X}" for b in byte_data[i:i + 8]) for i in range(0, len(byte_data), 8)]
+    else:
+        file_str = ("const unsigned int " + file_name + "Bitmap[" + str(len(bitmap_data)) + "] "
+                    "__attribute__((aligned(4))) __attribute__((visibility(\"hidden\")))=\n{\n")
+        lines = [", ".join(bitmap_data[i:i + 8]) for i in range(0, len(bitmap_data), 8)]
+
+    # Blank line after every 8 lines
+    for lc, line in enumerate(lines, start=1):
+        file_str += "\t" + line + ",\n"
+        if lc % 8 == 0:
+            file_str += "\n"
+    file_str += "};\n"
+
+    if gba_palette is not None and arguments["palette_included"]:
+        file_str += palette_array(f"{file_name}Pal", gba_palette, arguments["bpp"])
+
+    new_file_name = f"{dest}/" if dest is not None else ""
+    new_file_name += file_name + ".c"
+    with open(new_file_name, "w") as file:
+        file.write(file_str)
+
+def make_bitmap_output(arguments:dict, image:LoadedImage, bitmap_data:list, gba_palette:list,
+                       compressed_bytes:bytes = None) -> None:
+    """
+    Creates the output files of a bitmap unit that the user indicated as wanted
+    :param arguments: Dictionary of command line arguments
+    :param image: The loaded source image
+    :param bitmap_data: The packed bitmap (uint32 hex strings)
+    :param gba_palette: The 256 color palette of a Mode 4 bitmap (None for direct color)
+    :param compressed_bytes: The LZ77 compressed bitmap (None if not compressed)
+    :return: None
+    """
+    output_type = arguments["output_type"]
+
+    if output_type == "both" or output_type == "c":
+        create_bitmap_c_file(arguments, bitmap_data, gba_palette, compressed_bytes)
+
+    if output_type == "both" or output_type == "h":
+        create_bitmap_header_file(arguments, image, len(bitmap_data) * 4, gba_palette,
+                                  len(compressed_bytes) if compressed_bytes is not None else None)
+
+    if gba_palette is not None and arguments["generate_palette"]:
+        create_palette_png(
+            gba_pal=gba_palette,
+            dest=arguments["destination_path"],
+            file_path=arguments["image_path"],
+            bpp=arguments["bpp"]
+        )
@@ -1,21 +1,154 @@
 import argparse
+import sys
 from cgi import parse
+from pathlib import Path
 
-from .api import build_outputs, clean_outputs, make_template, view_output, verify_inputs, create_byte_data
+from . import api
+from .api import build_outputs, clean_outputs, make_template, view_output, verify_inputs, create_byte_data, \
+    preview_outputs, watch_outputs, cache_stats, prune_cache
+from .conversion_cache import default_cache_directory, DEFAULT_CACHE_SIZE
+from .profiler import parse_memory_size
+from .errors import Pix2gbaError
+from .daemon import default_socket_path, forward_to_daemon, serve
+
+# Commands a running daemon runs for the thin client ('view' opens a window and 'watch' never ends, so they stay local)
+FORWARDED_COMMANDS = ("make", "verify", "preview", "byte")
 
 def main():
     """
     Main entry point for pix2gba and uses the CLI arguments to choose the action.
+    Commands are forwarded to the daemon of the current directory when one is running.
+    """
+    argv = sys.argv[1:]
+    raw_args, _ = _create_parser().parse_known_args(argv)
+    if raw_args.command_name in FORWARDED_COMMANDS and not raw_args.no_daemon:
+        socket_path = Path(raw_args.socket) if raw_args.socket else default_socket_path(api.ROOT_DIRECTORY)
+        try:
+            exit_code = forward_to_daemon(argv, socket_path)
+        except Pix2gbaError as error:
+            print(f"ERROR: {error}")
+            exit(1)
+        if exit_code is not None:
+            exit(exit_code)
+
+    run_command_line(argv)
+
+def run_command_line(argv: list[str]) -> None:
+    """
+    Runs a command line in this process.
+    :param argv: The command line arguments (without `pix2gba`)
+    :return: None
+    """
+    parser = _create_parser()
+    raw_args, raw_extra = parser.parse_known_args(argv)
+
+    api.IGNORE_GLOBS = raw_args.ignore
+    api.NESTED_PROJECTS = raw_args.nested
+
+    api.CACHE_DIRECTORY = None
+    if raw_args.cache_dir is not None:
+        api.CACHE_DIRECTORY = Path(raw_args.cache_dir).expanduser()
+    elif raw_args.cache:
+        api.CACHE_DIRECTORY = default_cache_directory()
+    api.CACHE_SIZE = DEFAULT_CACHE_SIZE
+    if raw_args.cache_size is not None:
+        try:
+            api.CACHE_SIZE = parse_memory_size(raw_args.cache_size)
+        except ValueError:
+            print(f"ERROR: `--cache-size` is not a valid size: `{raw_args.cache_size}`")
+            exit(1)
+
+    # Library errors (missing units, invalid configs, ...) end the command with their message
+    try:
+        _run_command(parser, raw_args, raw_extra)
+    except Pix2gbaError as error:
+        print(f"ERROR: {error}")
+        exit(1)
+
+def _create_parser() -> argparse.ArgumentParser:
+    """
+    :return: The argument parser of every command
     """
     parser = argparse.ArgumentParser(description="Convert an Image (PNG, JPEG) to GBA-compatible tile data.")
 
     # Gather the first argument (starting command)
     parser.add_argument('command_name', type=str, help='Command of pix2gba to run')
-    raw_args, raw_extra = parser.parse_known_args()
 
+    # Profiling options (used by 'make')
+    parser.add_argument('--profile', action='store_true', help='Print the time spent in each conversion stage')
+    parser.add_argument('--profile-json', type=str, default=None, help='Save the stage timings as JSON to this path')
+    parser.add_argument('--profile-trace', type=str, default=None, help='Save the stage timings as a Chrome trace to this path')
+    parser.add_argument('--profile-memory', action='store_true', help='Also measure the peak memory of each unit')
+    parser.add_argument('--max-memory', type=str, default=None, help='Memory budget per unit (e.g. 512M, 2G), units above it are streamed when they can be')
+    parser.add_argument('--stream', action='store_true', help='Convert units a metatile row at a time to bound their memory (tiles mode without palette banks)')
+
+    # Report options (used by 'make')
+    parser.add_argument('--report', type=str, default=None, help='Save a JSON build report with the sizes of every unit')
+
+    # Preview options (used by 'preview')
+    parser.add_argument('--sheet', action='store_true', help='Show the deduped tile sheet next to the reconstruction from the tile mapping')
+    parser.add_argument('--scale', type=int, default=1, help='Integer scale of the preview PNGs')
+    parser.add_argument('--jobs', type=int, default=None, help='Number of units to convert in parallel for preview and verify --deep, or of daemon workers for serve (default: one per CPU)')
+
+    # Watch options (used by 'watch')
+    parser.add_argument('--interval', type=float, default=0.1, help='Seconds between two looks at the sources in watch mode')
+
+    # Discovery options (used by every command)
+    parser.add_argument('--ignore', action='append', default=[], metavar='GLOB', help='Skip directories matching this glob when looking for pix2gba.toml files (can be repeated)')
+    parser.add_argument('--nested', action='store_true', help='Also look for pix2gba.toml files below directories that have one')
+
+    # Verify options (used by 'verify')
+    parser.add_argument('--deep', action='store_true', help='Also convert every unit in memory and diff the decoded output against its source')
+
+    # Conversion cache options (used by 'make', 'watch' and 'cache')
+    parser.add_argument('--cache', action='store_true', help='Reuse conversions from a content addressed cache shared by every checkout (~/.cache/pix2gba)')
+    parser.add_argument('--cache-dir', type=str, default=None, help='Directory of the conversion cache (implies --cache)')
+    parser.add_argument('--cache-size', type=str, default=None, help='Size the conversion cache is pruned down to (e.g. 512M, 2G, default 1G)')
+
+    # Daemon options (used by 'serve' and the commands forwarded to it)
+    parser.add_argument('--socket', type=str, default=None, help='Unix socket of the daemon (default: .pix2gba/daemon.sock in the current directory)')
+    parser.add_argument('--no-daemon', action='store_true', help='Run the command in this process even if a daemon is running')
+    return parser
+
+def _run_command(parser: argparse.ArgumentParser, raw_args: argparse.Namespace, raw_extra: list[str]) -> None:
+    """
+    Runs the command picked on the command line.
+    :param parser: The argument parser (for printing the help)
+    :param raw_args: The parsed arguments
+    :param raw_extra: The positional arguments after the command (unit names)
+    """
     # 'make' is for running the conversing on all the toml units
     if raw_args.command_name == 'make':
-        build_outputs()
+        max_memory = None
+        if raw_args.max_memory is not None:
+            try:
+                max_memory = parse_memory_size(raw_args.max_memory)
+            except ValueError:
+                print(f"ERROR: `--max-memory` is not a valid size: `{raw_args.max_memory}`")
+                exit(1)
+
+        budget_exceeded = build_outputs(
+            profile=raw_args.profile,
+            profile_json=raw_args.profile_json,
+            profile_trace=raw_args.profile_trace,
+            profile_memory=raw_args.profile_memory,
+            max_memory=max_memory,
+            report_path=raw_args.report,
+            unit_patterns=raw_extra or None,
+            stream=raw_args.stream
+        )
+
+        # Fail the build when a ROM/VRAM budget was exceeded or a scene did not fit in VRAM
+        if budget_exceeded:
+            exit(1)
+
+    # 'watch' builds everything, then rebuilds the units whose images, palettes or TOML change
+    elif raw_args.command_name == 'watch':
+        if raw_args.interval <= 0:
+            print(f"ERROR: `--interval` must be above 0: `{raw_args.interval}`")
+            exit(1)
+
+        watch_outputs(interval=raw_args.interval)
 
     # 'clean' removes all the generated units
     elif raw_args.command_name == 'clean':
@@ -43,9 +176,30 @@ def main():
 
         view_output(raw_extra[0])
 
+    # 'preview' renders what the units will look like on the GBA to PNGs, without a window
+    elif raw_args.command_name == 'preview':
+        # Make sure at most one unit is given
+        if len(raw_extra) > 1:
+            print("ERROR: `preview` takes at most one unit name")
+            parser.print_help()
+            exit(1)
+
+        if raw_args.scale < 1:
+            print(f"ERROR: `--scale` must be at least 1: `{raw_args.scale}`")
+            exit(1)
+
+        preview_failed = preview_outputs(
+            img_name=raw_extra[0] if raw_extra else None,
+            sheet=raw_args.sheet,
+            scale=raw_args.scale,
+            jobs=raw_args.jobs
+        )
+        if preview_failed:
+            exit(1)
+
     # 'verify' checks that all units can be converted and outputs the errors
     elif raw_args.command_name == 'verify':
-        verify_inputs()
+        verify_inputs(deep=raw_args.deep, jobs=raw_args.jobs)
 
     # 'byte' outputs the raw byte data of the given unit
     elif raw_args.command_name == 'byte':
@@ -64,6 +218,25 @@ def main():
 
         create_byte_data(raw_extra[0])
 
+    # 'cache' shows or prunes the conversion cache
+    elif raw_args.command_name == 'cache':
+        if len(raw_extra) != 1 or raw_extra[0] not in ('stats', 'prune'):
+            print("ERROR: `cache` takes `stats` or `prune`")
+            parser.print_help()
+            exit(1)
+
+        if raw_extra[0] == 'stats':
+            cache_stats()
+        else:
+            prune_cache()
+
+    # 'serve' keeps worker processes (and their caches) up and runs the commands and conversions sent over a socket
+    elif raw_args.command_name == 'serve':
+        if raw_args.jobs is not None and raw_args.jobs < 1:
+            print(f"ERROR: `--jobs` must be at least 1: `{raw_args.jobs}`")
+            exit(1)
+
+        serve(Path(raw_args.socket) if raw_args.socket else default_socket_path(api.ROOT_DIRECTORY), jobs=raw_args.jobs)
 
 
 if __name__ == "__main__":
@@ -1,23 +1,40 @@
-from os import write
 from pathlib import Path
-from .tile_output import create_tile_data
-from .deduper import dedupe_tiles
 import ctypes
 import struct
 from PIL import Image as PILImage
 from datetime import datetime
+from .tile_creator import padded_size
+from .progress import log_progress
+from .tile_output import has_tile_mapping, tile_mapping_declaration, tile_mapping_array, \
+    pool_bank_declaration, variant_palette_declarations, palette_array, sprite_obj_declarations, sprite_obj_array, \
+    obj_palette_bank, animation_declarations, animation_arrays
 LoadedImage = PILImage.Image
 
-lib = ctypes.CDLL("./bin/lz77.so")
+# The LZ77 codec library, loaded on first use so units without compression never need it
+_lz77_lib = None
 
-lib.GBA_LZ77CompressBound.argtypes = [ctypes.c_size_t]
-lib.GBA_LZ77CompressBound.restype  = ctypes.c_size_t
+def _load_lz77_lib() -> ctypes.CDLL:
+    """
+    Loads the LZ77 codec shared library (once) and declares its function signatures
+    :return: The loaded library
+    """
+    global _lz77_lib
+    if _lz77_lib is not None:
+        return _lz77_lib
+
+    lib = ctypes.CDLL("./bin/lz77.so")
+
+    lib.GBA_LZ77CompressBound.argtypes = [ctypes.c_size_t]
+    lib.GBA_LZ77CompressBound.restype  = ctypes.c_size_t
+
+    lib.GBA_LZ77Compress.argtypes = [
+        ctypes.POINTER(ctypes.c_ubyte), ctypes.c_size_t,
+        ctypes.POINTER(ctypes.c_ubyte), ctypes.c_size_t
+    ]
+    lib.GBA_LZ77Compress.restype = ctypes.c_ssize_t
 
-lib.GBA_LZ77Compress.argtypes = [
-    ctypes.POINTER(ctypes.c_ubyte), ctypes.c_size_t,
-    ctypes.POINTER(ctypes.c_ubyte), ctypes.c_size_t
-]
-lib.GBA_LZ77Compress.restype = ctypes.c_ssize_t
+    _lz77_lib = lib
+    return lib
 
 
 def gba_lz77_compress(data: bytes) -> bytes:
@@ -32,6 +49,8 @@ def gba_lz77_compress(data: bytes) -> bytes:
     elif not isinstance(data, (bytes, bytearray)):
         data = bytes(data)
 
+    lib = _load_lz77_lib()
+
     in_len = len(data)
     in_buf = (ctypes.c_ubyte * in_len).from_buffer_copy(data)
 
@@ -46,21 +65,26 @@ def gba_lz77_compress(data: bytes) -> bytes:
         raise RuntimeError(f"GBA_LZ77Compress failed: {n}")
     return bytes(out_py[:n])
 
-def create_compressed_header_file(arguments:dict, image:LoadedImage, compressed_bytes:int, gba_palette:list) -> None:
+def create_compressed_header_file(arguments:dict, image:LoadedImage, compressed_bytes:int, gba_palette:list,
+                                  variant_palettes:list = None, tile_count:int = None, objs:list = None,
+                                  deltas:list = None) -> None:
     """
     Creates the header file for the tile output.
     :param arguments: Command line arguments
     :param image: The PIL image
     :param compressed_bytes: Number of bytes the compressed image occupies
     :param gba_palette: The 2^bpp wide palette for the image (palette that will be in the GBA)
+    :param variant_palettes: The (name, palette) of every palette variant (None if there are none)
+    :param tile_count: Number of tiles in the tile data after deduping/eliding (None if every tile is kept)
+    :param objs: The SpriteObjs of the unit (None if not in sprite mode)
+    :param deltas: The DeltaRuns of every frame transition (None if not in animation mode)
     """
     # Extract needed data
     meta_w = arguments["meta_width"]
     meta_h = arguments["meta_height"]
     bpp = arguments["bpp"]
 
-    img_w = image.width
-    img_h = image.height
+    img_w, img_h = padded_size(image.width, image.height, meta_w, meta_h)
 
     dest = arguments["destination_path"]
     file_path = arguments["image_path"]
@@ -71,15 +95,18 @@ def create_compressed_header_file(arguments:dict, image:LoadedImage, compressed_
 
     # Data Size Calc
     num_pxl = img_w * img_h
-    num_bits = num_pxl * bpp
-    num_bytes = num_bits // 8
-    num_u32 = num_bytes // 4
 
     # Num Tiles Calc
     num_tiles = num_pxl // (8*8)
 
+    # Only the kept tiles are compressed
+    stored_tiles = tile_count if tile_count is not None else num_tiles
+    num_bytes = stored_tiles * 8 * bpp
+
     # Comments and stuff
-    if arguments["dedupe"]:
+    if arguments.get("elide_empty"):
+        file_str = "// " + file_name + " on " + pal_name + " Palette; Compressed with LZ77; Empty Tiles Elided\n"
+    elif arguments["dedupe"]:
         file_str = "// " + file_name + " on " + pal_name + " Palette; Compressed with LZ77; Deduped\n"
     else:
         file_str = "// " + file_name + " on " + pal_name + " Palette; Compressed with LZ77\n"
@@ -116,6 +143,17 @@ def create_compressed_header_file(arguments:dict, image:LoadedImage, compressed_
                  " */\n")
     file_str += "extern const unsigned char "  + file_name + "Compression[" + str(compressed_bytes) + "];\n"
 
+    if has_tile_mapping(arguments):
+        file_str += tile_mapping_declaration(file_name, num_tiles, arguments, gba_palette)
+
+    if objs is not None:
+        file_str += sprite_obj_declarations(file_name, objs)
+
+    if deltas is not None:
+        file_str += animation_declarations(file_name, meta_w * meta_h, deltas)
+
+    file_str += pool_bank_declaration(file_name, arguments)
+
     # Do the declaration for palette if included
     if arguments["palette_included"]:
         file_str += ("\n/**\n" +
@@ -128,19 +166,27 @@ def create_compressed_header_file(arguments:dict, image:LoadedImage, compressed_
                      " */\n")
         file_str += "extern const unsigned short " + file_name + "Pal[" + str(len(gba_palette)) + "];\n"
 
+    if variant_palettes:
+        file_str += variant_palette_declarations(file_name, variant_palettes, bpp)
+
     new_file_name = f"{dest}/" if dest is not None else ""
     new_file_name += file_name + ".h"
     with open(new_file_name, "w") as file:
         file.write(file_str)
 
-def create_compressed_c_file(arguments:dict, image:LoadedImage, gba_palette:list, byte_data:bytes) -> None:
+def create_compressed_c_file(arguments:dict, image:LoadedImage, gba_palette:list, byte_data:bytes,
+                             tile_mapping:list = None, variant_palettes:list = None, objs:list = None,
+                             deltas:list = None) -> None:
     """
     Creates the C file for the tile output.
     :param arguments: Command line arguments
     :param image: The PIL image
-    :param conversion_table: Dictionary of rgb24 colors to rgb15 colors (native GBA color)
     :param gba_palette: The 2^bpp wide palette for the image (palette that will be in the GBA)
     :param byte_data: The byte data
+    :param tile_mapping: The screen entry of every tile (None if not deduped and without palette banks)
+    :param variant_palettes: The (name, palette) of every palette variant (None if there are none)
+    :param objs: The SpriteObjs of the unit (None if not in sprite mode)
+    :param deltas: The DeltaRuns of every frame transition (None if not in animation mode)
     """
     # Extract needed data
     bpp    = arguments["bpp"]
@@ -169,60 +215,70 @@ def create_compressed_c_file(arguments:dict, image:LoadedImage, gba_palette:list
 
     file_str += "};\n"
 
+    if tile_mapping is not None:
+        file_str += tile_mapping_array(file_name, tile_mapping)
+
+    if objs is not None:
+        file_str += sprite_obj_array(file_name, objs, bpp, obj_palette_bank(arguments))
+
+    if deltas is not None:
+        file_str += animation_arrays(file_name, deltas)
+
     if arguments["palette_included"]:
-        file_str += (f"\nconst unsigned short {file_name}Pal[{2**bpp}] "
-                     f"__attribute__((aligned(2))) __attribute__((visibility(\"hidden\")))= \n{{\n")
-        for i in range(0, len(gba_palette), 8):
-            # Take a slice of 8 elements
-            line = gba_palette[i:i + 8]
-            line = (f"0x{n:04x}" for n in line)
-            file_str += "\t" + (", ".join(line)) + ",\n"
-        file_str = file_str[0:file_str.rfind(',')]
+        file_str += palette_array(f"{file_name}Pal", gba_palette, bpp)
 
-        file_str += "\n};\n"
+    for variant_name, palette in variant_palettes or []:
+        file_str += palette_array(f"{file_name}_{variant_name}Pal", palette, bpp)
 
     new_file_name = f"{dest}/" if dest is not None else ""
     new_file_name += file_name + ".c"
     with open(new_file_name, "w") as file:
         file.write(file_str)
 
-def make_compress_output(arguments:dict, conversion_table:dict, gba_palette:list) -> None:
+def compress_tile_data(tile_data:list) -> bytes:
     """
-    Makes the compressed output (.h and .c) of the tiles for the unit
-    :param arguments: The options for outputting the unit
-    :param conversion_table: The conversion table of rgb888 to rgb555
-    :param gba_palette: The 2^bpp wide palette for the image (palette that will be in the GBA)
-    :return: None
+    Packs the tile words into little endian bytes and compresses them with LZ77
+    :param tile_data: The packed tile data (uint32 hex strings)
+    :return: The compressed byte stream
     """
-    meta_w = arguments["meta_width"]
-    meta_h = arguments["meta_height"]
-    bpp = arguments["bpp"]
-    file_path = arguments["image_path"]
-
-    print(f" \t Compressing...")
-
-    # Create the uncompressed data and make byte data
-
-    if arguments["dedupe"]:
-        raw_array = create_tile_data(file_path, conversion_table, meta_w, meta_h, bpp, True)
-        raw_array, tile_mapping = dedupe_tiles(raw_array, bpp)
-        raw_array = [int(s, 16) for s in raw_array]
-
-    else:
-        raw_array = create_tile_data(file_path, conversion_table, meta_w, meta_h, bpp, False)
+    raw_array = [int(s, 16) for s in tile_data]
+    return compress_tile_bytes(struct.pack("<%dI" % len(raw_array), *raw_array))
 
-    byte_array = struct.pack("<%dI" % len(raw_array), *raw_array)
+def compress_tile_bytes(byte_array:bytes) -> bytes:
+    """
+    Compresses packed tile data with LZ77
+    :param byte_array: The tile words as little endian bytes
+    :return: The compressed byte stream
+    """
+    log_progress(f" \t Compressing...")
 
     # Run compression algorithm
     compressed_bytes = gba_lz77_compress(byte_array)
 
-    print(f" \t\t Compressed from {len(raw_array) * 4} bytes to {len(compressed_bytes)} bytes!")
+    log_progress(f" \t\t Compressed from {len(byte_array)} bytes to {len(compressed_bytes)} bytes!")
 
-    # Load in image
-    img = PILImage.open(arguments["image_path"]).convert("RGB")
+    return compressed_bytes
 
+def make_compress_output(arguments:dict, image:LoadedImage, compressed_bytes:bytes, gba_palette:list,
+                         tile_mapping:list = None, variant_palettes:list = None, tile_count:int = None,
+                         objs:list = None, deltas:list = None) -> None:
+    """
+    Makes the compressed output (.h and .c) of the tiles for the unit
+    :param arguments: The options for outputting the unit
+    :param image: The loaded source image
+    :param compressed_bytes: The LZ77 compressed tile data
+    :param gba_palette: The 2^bpp wide palette for the image (palette that will be in the GBA)
+    :param tile_mapping: The screen entry of every tile (None if not deduped and without palette banks)
+    :param variant_palettes: The (name, palette) of every palette variant (None if there are none)
+    :param tile_count: Number of tiles that were compressed (None if every tile of the image is kept)
+    :param objs: The SpriteObjs of the unit (None if not in sprite mode)
+    :param deltas: The DeltaRuns of every frame transition (None if not in animation mode)
+    :return: None
+    """
     # Create the header file
-    create_compressed_header_file(arguments, img, len(compressed_bytes), gba_palette)
+    create_compressed_header_file(arguments, image, len(compressed_bytes), gba_palette, variant_palettes, tile_count,
+                                  objs, deltas)
 
     # Create the C file
-    create_compressed_c_file(arguments, img, gba_palette, compressed_bytes)
\ No newline at end of file
+    create_compressed_c_file(arguments, image, gba_palette, compressed_bytes, tile_mapping, variant_palettes, objs,
+                             deltas)
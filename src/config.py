@@ -1,9 +1,20 @@
 import toml
 import os
+from fnmatch import fnmatch
 
-from .units import ConversionConfig, ConversionUnit
+from .units import ConversionConfig, ConversionUnit, UnitReport, VramScene
 from pathlib import Path
-from .converter import run_conversion, clean_conversion
+from .converter import run_conversion, clean_conversion, try_prepare_conversion, PreparedConversion
+from .streaming import can_stream, run_streaming_conversion
+from .tile_creator import padded_size
+from .profiler import parse_memory_size
+from .multi_palette import MAX_PALETTE_BANKS
+from .palette_pool import POOL_LAYERS, PalettePool, plan_palette_pool, pool_unit_args, write_palette_pool
+from .bitmap import BITMAP_MODES
+from .png_header import read_png_header
+from .file_cache import FileCache
+from .errors import Pix2gbaError
+from .vram_planner import BG_CHARBLOCKS, OBJ_MAPPINGS, VramPlan, VramRequest, plan_scene, write_vram_header
 
 ACCEPTED_OUTPUT_TYPES = [
     "both",
@@ -11,6 +22,13 @@ ACCEPTED_OUTPUT_TYPES = [
     "h"
 ]
 
+ACCEPTED_UNIT_MODES = [
+    "tiles",
+    "sprite",
+    "bitmap",
+    "animation"
+]
+
 TOML_CONFIG_ARGUMENTS = [
     "bpp",
     "transparent",
@@ -18,6 +36,15 @@ TOML_CONFIG_ARGUMENTS = [
     "destination"
 ]
 
+SIZE_BUDGET_ARGUMENTS = [
+    "rom_budget",
+    "vram_budget"
+]
+
+TOML_OPTIONAL_CONFIG_ARGUMENTS = SIZE_BUDGET_ARGUMENTS + [
+    "palette_pool"
+]
+
 TOML_UNIT_ARGUMENTS = [
     "name",
     "metatile_width",
@@ -29,6 +56,39 @@ TOML_UNIT_ARGUMENTS = [
     "dedupe"
 ]
 
+TOML_OPTIONAL_UNIT_ARGUMENTS = [
+    "palette_banks",
+    "layer",
+    "variants",
+    "elide_empty",
+    "mode",
+    "bitmap_mode",
+    "frame_width",
+    "frame_height"
+]
+
+TOML_SCENE_ARGUMENTS = [
+    "name",
+    "units"
+]
+
+# Directories discovery never goes into (VCS data, dependencies, caches and common build output)
+DEFAULT_IGNORE_GLOBS = [
+    ".git",
+    ".hg",
+    ".svn",
+    ".pix2gba",
+    "node_modules",
+    "__pycache__",
+    ".venv",
+    "venv",
+    "build",
+    "dist"
+]
+
+# File in the project root with extra ignore globs (one per line, `#` starts a comment)
+IGNORE_FILE = ".pix2gbaignore"
+
 RED = "\033[31m"
 RESET = "\033[0m"
 
@@ -41,25 +101,84 @@ def _print_red(message: str) -> None:
     print(RED + message + RESET)
 
 
-def discover_build_roots(root: Path) -> list[Path]:
+def read_ignore_file(root: Path) -> list[str]:
+    """
+    Reads the ignore globs of a project.
+    :param root: Root directory of the project
+    :return: The globs in the root's .pix2gbaignore (empty if there is none)
+    """
+    try:
+        with open(root / IGNORE_FILE, "r") as file:
+            lines = [line.split("#", 1)[0].strip() for line in file]
+    except OSError:
+        return []
+    return [line.rstrip("/") for line in lines if line]
+
+def _is_ignored(name: str, relative: str, ignore_globs: list[str]) -> bool:
+    # Globs match either the directory's name or its path from the project root
+    return any(fnmatch(name, glob) or fnmatch(relative, glob) for glob in ignore_globs)
+
+def discover_build_roots(root: Path, ignore_globs: list[str] = (), nested: bool = False) -> list[Path]:
     """
-    Recursively searches for directories containing a pix2gba.toml file.
+    Searches for directories containing a pix2gba.toml file, skipping ignored directories.
     :param root: Root directory to begin the search from.
+    :param ignore_globs: Globs of directories to skip on top of DEFAULT_IGNORE_GLOBS and the root's .pix2gbaignore.
+    :param nested: If directories below a pix2gba.toml should be searched for more projects.
     :return: A list of directories that contain a pix2gba.toml file.
     """
     root = root.resolve()
+    ignore_globs = DEFAULT_IGNORE_GLOBS + read_ignore_file(root) + list(ignore_globs)
     results: list[Path] = []
 
-    toml_file = root / "pix2gba.toml"
-    if toml_file.is_file():
-        return [root]
+    # Iterative walk with os.scandir (the entry types come with the listing, no stat per entry)
+    pending = [root]
+    while pending:
+        directory = pending.pop()
+        if (directory / "pix2gba.toml").is_file():
+            results.append(directory)
+            if not nested:
+                continue
+
+        try:
+            with os.scandir(directory) as entries:
+                subdirectories = [entry for entry in entries if entry.is_dir(follow_symlinks=False)]
+        except OSError:
+            continue
 
-    for entry in root.iterdir():
-        if entry.is_dir():
-            results.extend(discover_build_roots(entry))
+        for entry in sorted(subdirectories, key=lambda e: e.name, reverse=True):
+            relative = Path(entry.path).relative_to(root).as_posix()
+            if not _is_ignored(entry.name, relative, ignore_globs):
+                pending.append(Path(entry.path))
 
     return results
 
+# Parsed pix2gba.toml files by resolved path, with the mtime and size of the file they were read from
+_toml_cache = FileCache(toml.load)
+
+def read_toml(toml_file: Path) -> dict:
+    """
+    Gets the parsed data of a TOML, parsing it only if it changed since it was last parsed.
+    :param toml_file: Path to the pix2gba.toml
+    :return: The parsed TOML data
+    """
+    return _toml_cache.get(toml_file)
+
+def load_toml_cache(cache_path: Path) -> None:
+    """
+    Loads the TOMLs parsed by earlier runs.
+    :param cache_path: Path of the JSON cache
+    :return: None
+    """
+    _toml_cache.load(cache_path)
+
+def save_toml_cache(cache_path: Path) -> None:
+    """
+    Saves the parsed TOMLs for the next run (only if new TOMLs were parsed).
+    :param cache_path: Path of the JSON cache
+    :return: None
+    """
+    _toml_cache.save(cache_path)
+
 def _build_config(toml_data, root_dir:Path) -> ConversionConfig:
     """
     Builds a ConversionConfig object from parsed TOML data.
@@ -86,6 +205,27 @@ def _build_config(toml_data, root_dir:Path) -> ConversionConfig:
 
         root_dir=root_dir,
         output_dir=Path(toml_data["general"]["destination"]),
+
+        rom_budget=toml_data["general"].get("rom_budget", None),
+        vram_budget=toml_data["general"].get("vram_budget", None),
+        palette_pool=toml_data["general"].get("palette_pool", None),
+        scenes=tuple(_build_scene(scene) for scene in toml_data.get("scene", [])),
+    )
+
+def _build_scene(scene_data) -> VramScene:
+    """
+    Builds a VramScene from a scene entry in the TOML configuration.
+    :param scene_data: Dictionary describing a single scene.
+    :return: A populated VramScene instance (None if arguments are missing).
+    """
+    if any(setting not in scene_data for setting in TOML_SCENE_ARGUMENTS):
+        return None
+
+    return VramScene(
+        name=scene_data["name"],
+        units=tuple(scene_data["units"]),
+        obj_mapping=scene_data.get("obj_mapping", "1d"),
+        charblocks=tuple(scene_data.get("charblocks", range(BG_CHARBLOCKS)))
     )
 
 def _build_unit(element_data, config:ConversionConfig) -> ConversionUnit:
@@ -113,7 +253,15 @@ def _build_unit(element_data, config:ConversionConfig) -> ConversionUnit:
         palette_include=element_data["palette_include"],
         generate_palette=element_data["generate_palette"],
         compress=element_data["compress"],
-        dedupe=element_data["dedupe"]
+        dedupe=element_data["dedupe"],
+        palette_banks=element_data.get("palette_banks", 0),
+        layer=element_data.get("layer", "bg"),
+        variants=tuple(element_data.get("variants", [])),
+        elide_empty=element_data.get("elide_empty", 0),
+        mode=element_data.get("mode", "tiles"),
+        bitmap_mode=element_data.get("bitmap_mode", 3),
+        frame_width=element_data.get("frame_width", 0),
+        frame_height=element_data.get("frame_height", 0)
     )
 
 def _is_power_of_two(n):
@@ -136,6 +284,18 @@ def _is_hex(s):
     except Exception:
         return False
 
+def budget_bytes(budget) -> int:
+    """
+    Converts a ROM/VRAM budget from the TOML (int of bytes or a size string like "96K") to bytes.
+    :param budget: The budget value from the config
+    :return: The budget in bytes (None if there is no budget)
+    """
+    if budget is None:
+        return None
+    if isinstance(budget, int):
+        return budget
+    return parse_memory_size(str(budget))
+
 def _validate_config(config: ConversionConfig) -> bool:
     """
     Validates a ConversionConfig for correctness and consistency.
@@ -169,6 +329,47 @@ def _validate_config(config: ConversionConfig) -> bool:
             )
             return True
 
+    for budget_name in SIZE_BUDGET_ARGUMENTS:
+        budget = getattr(config, budget_name)
+        try:
+            size = budget_bytes(budget)
+        except ValueError:
+            size = -1
+        if size is not None and size <= 0:
+            _print_red(f" \t ERROR: `{budget_name}` is not a positive size (e.g. 65536 or \"96K\"): `{budget}`")
+            return True
+
+    if config.palette_pool is not None:
+        if not str(config.palette_pool).isidentifier():
+            _print_red(f" \t ERROR: `palette_pool` must be a valid C identifier: `{config.palette_pool}`")
+            return True
+        if config.bpp != 4:
+            _print_red(f" \t ERROR: `palette_pool` needs a 4bpp config (bpp is {config.bpp})")
+            return True
+
+    scene_units = set()
+    for scene in config.scenes:
+        if scene is None:
+            _print_red(f" \t ERROR: Scene is missing arguments (needs `{'`, `'.join(TOML_SCENE_ARGUMENTS)}`)")
+            return True
+        if not str(scene.name).isidentifier():
+            _print_red(f" \t ERROR: Scene name must be a valid C identifier: `{scene.name}`")
+            return True
+        if scene.obj_mapping not in OBJ_MAPPINGS:
+            _print_red(f" \t ERROR: Scene `{scene.name}` OBJ mapping must be `1d` or `2d`: `{scene.obj_mapping}`")
+            return True
+        if not scene.charblocks or any(block not in range(BG_CHARBLOCKS) for block in scene.charblocks):
+            _print_red(f" \t ERROR: Scene `{scene.name}` charblocks must be between 0 and {BG_CHARBLOCKS - 1}: "
+                       f"`{list(scene.charblocks)}`")
+            return True
+
+        # Each unit's mapping is offset for one place in VRAM
+        repeated = scene_units & set(scene.units)
+        if repeated:
+            _print_red(f" \t ERROR: Units can only be in one scene: `{'`, `'.join(sorted(repeated))}`")
+            return True
+        scene_units |= set(scene.units)
+
     return False
 
 def build_units(build_roots: list[Path]) -> list[ConversionUnit]:
@@ -181,7 +382,7 @@ def build_units(build_roots: list[Path]) -> list[ConversionUnit]:
 
     for build_root in build_roots:
         toml_file = build_root / "pix2gba.toml"
-        toml_data = toml.load(toml_file)
+        toml_data = read_toml(toml_file)
         potential_units = len(toml_data["unit"])
 
         config = _build_config(toml_data, build_root)
@@ -190,6 +391,12 @@ def build_units(build_roots: list[Path]) -> list[ConversionUnit]:
             _print_red(f"\t Config not valid, abandoning {potential_units} potential units")
             continue
 
+        unit_names = {element.get("name") for element in toml_data["unit"]}
+        for scene in config.scenes:
+            missing_units = [name for name in scene.units if name not in unit_names]
+            if missing_units:
+                _print_red(f"\t WARNING: Scene `{scene.name}` lists units not in the TOML: `{'`, `'.join(missing_units)}`")
+
         for element in toml_data["unit"]:
             unit = _build_unit(element, config)
             build_units.append(unit)
@@ -223,6 +430,88 @@ def validate_unit(unit: ConversionUnit) -> int:
         )
         return 3
 
+    if unit.palette_banks:
+        if not 1 <= unit.palette_banks <= MAX_PALETTE_BANKS:
+            _print_red(f" \t ERROR: Palette banks must be between 1 and {MAX_PALETTE_BANKS}: `{unit.palette_banks}`\n")
+            return 4
+        if unit.config.bpp != 4 or unit.palette_path != "":
+            _print_red(" \t ERROR: Palette banks need a 4bpp config and an auto-generated palette (`palette = \"\"`)\n")
+            return 5
+
+    if unit.layer not in POOL_LAYERS:
+        _print_red(f" \t ERROR: Layer must be `bg` or `obj`: `{unit.layer}`\n")
+        return 6
+
+    for variant in unit.variants:
+        if not Path(variant).exists():
+            _print_red(f" \t ERROR: Palette variant path does not exist: `{variant}`\n")
+            return 7
+    if unit.variants and unit.palette_banks:
+        _print_red(" \t ERROR: Palette variants can't be used with palette banks\n")
+        return 8
+
+    if unit.mode not in ACCEPTED_UNIT_MODES:
+        _print_red(f" \t ERROR: Mode is not accepted (acceptable are `{'`, `'.join(ACCEPTED_UNIT_MODES)}`): `{unit.mode}`\n")
+        return 9
+    if unit.mode == "sprite" and (unit.dedupe or unit.elide_empty or unit.palette_banks):
+        _print_red(" \t ERROR: Sprite mode can't be used with dedupe, elide_empty or palette_banks\n")
+        return 10
+
+    if unit.mode == "bitmap":
+        if unit.bitmap_mode not in BITMAP_MODES:
+            _print_red(f" \t ERROR: Bitmap mode must be 3, 4 or 5: `{unit.bitmap_mode}`\n")
+            return 11
+        if unit.dedupe or unit.elide_empty or unit.palette_banks or unit.variants or unit_scene(unit) is not None:
+            _print_red(" \t ERROR: Bitmap mode can't be used with dedupe, elide_empty, palette_banks, variants or "
+                       "in a scene\n")
+            return 12
+
+    if unit.mode == "animation":
+        if unit.frame_width <= 0 or unit.frame_height <= 0 or unit.frame_width % 8 or unit.frame_height % 8:
+            _print_red(f" \t ERROR: Frame width/height must be positive multiples of 8: "
+                       f"fw=`{unit.frame_width}`, fh=`{unit.frame_height}`\n")
+            return 13
+        if unit.elide_empty or unit.palette_banks:
+            _print_red(" \t ERROR: Animation mode can't be used with elide_empty or palette_banks\n")
+            return 14
+
+    # Header only checks (IHDR/PLTE), so impossible units fail before any pixel is decoded
+    header = read_png_header(img_path)
+    if header is None:
+        _print_red(f" \t ERROR: Input image is not a valid PNG: `{img_path}`\n")
+        return 16
+
+    # Palette images hold one entry per pixel (only PNGs are checked here, other formats fail when converted)
+    palette_bpp = BITMAP_MODES[unit.bitmap_mode].bpp if unit.mode == "bitmap" else unit.config.bpp
+    for palette_path in ((unit.palette_path,) if unit.palette_path != "" else ()) + unit.variants:
+        palette_header = read_png_header(palette_path)
+        if palette_header is not None and palette_header.width * palette_header.height > (1 << palette_bpp):
+            _print_red(f" \t ERROR: Palette image has more entries than {palette_bpp}bpp allows "
+                       f"({palette_header.width * palette_header.height} > {1 << palette_bpp}): `{palette_path}`\n")
+            return 17
+
+    # Without a palette image an indexed image's own palette is used, so it has to fit too (the bit depth caps
+    # how many PLTE entries the pixels can index)
+    palette_capacity = 16 * unit.palette_banks if unit.palette_banks else 1 << palette_bpp
+    indexed_entries = min(header.palette_size, 1 << header.bit_depth)
+    if unit.palette_path == "" and header.color_type == 3 and indexed_entries > palette_capacity:
+        _print_red(f" \t ERROR: Indexed image has more palette entries than the palette holds "
+                   f"({indexed_entries} > {palette_capacity}): `{img_path}`\n")
+        return 20
+
+    if unit.mode == "bitmap":
+        bitmap_mode = BITMAP_MODES[unit.bitmap_mode]
+        if header.width > bitmap_mode.width or header.height > bitmap_mode.height:
+            _print_red(f" \t ERROR: {header.width}x{header.height} image is bigger than the {bitmap_mode.width}x"
+                       f"{bitmap_mode.height} frame of Mode {unit.bitmap_mode}\n")
+            return 18
+
+    if unit.mode == "animation":
+        if header.width % unit.frame_width or header.height % unit.frame_height:
+            _print_red(f" \t ERROR: {header.width}x{header.height} image is not made of whole "
+                       f"{unit.frame_width}x{unit.frame_height} frames\n")
+            return 19
+
     return 0
 
 def create_unit_args(unit: ConversionUnit) -> dict:
@@ -258,19 +547,135 @@ def create_unit_args(unit: ConversionUnit) -> dict:
         "destination_path": unit.config.output_dir,
         "output_type": unit.config.output_type,
         "compress": unit.compress,
-        "dedupe": unit.dedupe
+        "dedupe": unit.dedupe,
+        "palette_banks": unit.palette_banks,
+        "layer": unit.layer,
+        "variants": [Path(variant) for variant in unit.variants],
+        "elide_empty": unit.elide_empty,
+        "mode": unit.mode,
+        "bitmap_mode": unit.bitmap_mode,
+        "frame_width": unit.frame_width,
+        "frame_height": unit.frame_height
     }
 
     return args
 
-def convert_unit(unit: ConversionUnit):
+def plan_palette_pools(units: list[ConversionUnit], write: bool = True) -> dict[Path, PalettePool]:
+    """
+    Pools the auto-generated palettes of every config with a `palette_pool` into shared banks and writes the
+    shared palette files.
+    :param units: The ConversionUnits of every build root.
+    :param write: If the shared palette files should be written.
+    :return: Dictionary of build root to its PalettePool.
+    """
+    pooled_args: dict[Path, list[dict]] = {}
+    configs = {}
+    for unit in units:
+        config = unit.config
+        if (config.palette_pool is None or unit.palette_path != "" or unit.palette_banks or unit.variants
+                or unit.mode == "bitmap"):
+            continue
+
+        # Invalid units are reported when they are converted
+        args = create_unit_args(unit)
+        if not args["image_path"].exists() or unit.layer not in POOL_LAYERS:
+            continue
+
+        pooled_args.setdefault(config.root_dir, []).append(args)
+        configs[config.root_dir] = config
+
+    pools = {}
+    for root_dir, unit_args in pooled_args.items():
+        config = configs[root_dir]
+        pool = plan_palette_pool(config.palette_pool, unit_args)
+        if write:
+            write_palette_pool(pool, config.output_dir, config.output_type)
+        pools[root_dir] = pool
+
+    return pools
+
+def convert_unit(unit: ConversionUnit, report: UnitReport = None, pool: PalettePool = None,
+                 stream: bool = False) -> bool:
     """
     Executes the conversion process for a single unit.
     :param unit: ConversionUnit to convert.
-    :return: None
+    :param report: UnitReport to fill with the output sizes (None to skip).
+    :param pool: PalettePool of the unit's config (None if its palettes aren't pooled).
+    :param stream: Whether to convert the unit a metatile row at a time (if its mode allows it).
+    :return: True if the conversion failed, False otherwise
+    """
+    args = create_unit_args(unit)
+    if pool is not None:
+        args = pool_unit_args(args, pool)
+    if stream and can_stream(args):
+        return run_streaming_conversion(args, report)
+    return run_conversion(args, report)
+
+def prepare_unit(unit: ConversionUnit, pool: PalettePool = None) -> tuple[dict, PreparedConversion]:
+    """
+    Converts a unit without creating its output (used when the unit's place in VRAM is planned first).
+    :param unit: ConversionUnit to convert.
+    :param pool: PalettePool of the unit's config (None if its palettes aren't pooled).
+    :return: The conversion arguments and the PreparedConversion (None if the conversion failed)
     """
     args = create_unit_args(unit)
-    run_conversion(args)
+    if pool is not None:
+        args = pool_unit_args(args, pool)
+    return args, try_prepare_conversion(args)
+
+def unit_scene(unit: ConversionUnit) -> VramScene:
+    """
+    :param unit: ConversionUnit to look up
+    :return: The VramScene the unit is in (None if it isn't in one)
+    """
+    for scene in unit.config.scenes:
+        if unit.name in scene.units:
+            return scene
+    return None
+
+def plan_vram_scene(scene: VramScene, config: ConversionConfig, prepared_units: dict,
+                    write: bool = True) -> VramPlan:
+    """
+    Places the prepared units of a scene in VRAM and writes the scene's header when everything fits.
+    :param scene: The VramScene to plan.
+    :param config: ConversionConfig of the scene.
+    :param prepared_units: Dictionary of unit name to its (arguments, PreparedConversion).
+    :param write: If the scene's header should be written.
+    :return: The VramPlan of the scene (check its errors, nothing is written if there are any).
+    """
+    requests = []
+    for name in scene.units:
+        if name not in prepared_units:
+            continue
+        args, prepared = prepared_units[name]
+        bpp = args["bpp"]
+        width, height = padded_size(prepared.image.width, prepared.image.height, args["meta_width"],
+                                    args["meta_height"])
+
+        layer = "obj" if args["mode"] == "sprite" else args["layer"]
+        row_major = (args["mode"] == "tiles" and not args["dedupe"] and not args["elide_empty"]
+                     and args["meta_width"] == 1 and args["meta_height"] == 1)
+
+        # Animations only keep the frame being shown in VRAM
+        tile_count = prepared.tile_count(bpp)
+        if prepared.deltas is not None:
+            tile_count = (args["frame_width"] // 8) * (args["frame_height"] // 8)
+        requests.append(VramRequest(
+            name=name,
+            layer=layer,
+            bpp=bpp,
+            tile_count=tile_count,
+            tiles_x=width // 8,
+            tiles_y=height // 8,
+            row_major=row_major,
+            reserve_empty=bool(args["elide_empty"])
+        ))
+
+    plan = plan_scene(scene.name, requests, scene.obj_mapping, scene.charblocks)
+    if write and not plan.errors:
+        write_vram_header(plan, config.output_dir)
+
+    return plan
 
 def clean_unit(unit: ConversionUnit):
     """
@@ -299,6 +704,46 @@ def clean_unit(unit: ConversionUnit):
 
     clean_conversion(args)
 
+def clean_palette_pool(config: ConversionConfig) -> None:
+    """
+    Removes the shared palette files of a config.
+    :param config: ConversionConfig with a `palette_pool`.
+    :return: None
+    """
+    for suffix in (".h", ".c"):
+        pool_file = Path(config.output_dir) / (config.palette_pool + suffix)
+        if pool_file.exists():
+            os.remove(pool_file)
+
+def clean_vram_scenes(config: ConversionConfig) -> None:
+    """
+    Removes the VRAM layout headers of a config's scenes.
+    :param config: ConversionConfig with scenes.
+    :return: None
+    """
+    for scene in config.scenes:
+        scene_file = Path(config.output_dir) / (scene.name + ".h")
+        if scene_file.exists():
+            os.remove(scene_file)
+
+def load_unit(toml_file: Path, position: int) -> ConversionUnit:
+    """
+    Builds a single unit straight from its TOML (without looking at the other projects).
+    :param toml_file: Path of the pix2gba.toml defining the unit.
+    :param position: Index of the unit's entry in the TOML's `[[unit]]` list.
+    :return: The ConversionUnit.
+    """
+    toml_data = read_toml(toml_file)
+
+    config = _build_config(toml_data, toml_file.parent)
+    if config is None or _validate_config(config):
+        raise Pix2gbaError(f"Config not valid: `{toml_file}`")
+
+    unit = _build_unit(toml_data["unit"][position], config)
+    if unit is None:
+        raise Pix2gbaError(f"Unit {position} of `{toml_file}` is missing arguments")
+    return unit
+
 def find_unit(build_roots: list[Path], unit_name:str) -> ConversionUnit:
     """
     Finds and returns a ConversionUnit by name.
@@ -308,15 +753,8 @@ def find_unit(build_roots: list[Path], unit_name:str) -> ConversionUnit:
     """
     for build_root in build_roots:
         toml_file = build_root / "pix2gba.toml"
-        toml_data = toml.load(toml_file)
-
-        config = _build_config(toml_data, build_root)
-        if _validate_config(config):
-            exit(1)
-
-        for element in toml_data["unit"]:
+        for position, element in enumerate(read_toml(toml_file)["unit"]):
             if element["name"] == unit_name:
-                return _build_unit(element, config)
+                return load_unit(toml_file, position)
 
-    _print_red(f" \t ERROR: Unit does not exist: `{unit_name}`")
-    exit(1)
+    raise Pix2gbaError(f"Unit does not exist: `{unit_name}`")
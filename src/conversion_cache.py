@@ -0,0 +1,299 @@
+import hashlib
+import io
+import json
+import os
+from dataclasses import dataclass, asdict
+from importlib.metadata import version, PackageNotFoundError
+from pathlib import Path
+
+import numpy as np
+
+from .animation import DeltaRun
+from .multi_palette import PaletteBanks
+from .sprite_slicer import SpriteObj
+from .tile_creator import hex_to_words, words_to_hex
+
+# Default size the cache is pruned down to
+DEFAULT_CACHE_SIZE = 1 << 30
+
+# Bumped when the stored entries change shape, so older entries are never read
+CACHE_FORMAT = 1
+
+# Conversion arguments that change what a conversion makes (files are hashed by content, not by path)
+CACHED_ARGUMENTS = [
+    "meta_width", "meta_height", "bpp", "transparent", "compress", "dedupe", "palette_banks", "layer",
+    "elide_empty", "mode", "bitmap_mode", "frame_width", "frame_height", "pool_bank", "pool_palette"
+]
+
+
+def _source_version() -> str:
+    """
+    Stands in for the version when running from a source checkout, so checkouts with different converter code
+    never share entries.
+    :return: `source-` and the hash of the package's source files
+    """
+    digest = hashlib.sha256()
+    package_dir = Path(__file__).parent
+    for path in sorted(package_dir.glob("*.py")) + sorted(package_dir.glob("*.cpp")):
+        digest.update(path.name.encode())
+        digest.update(path.read_bytes())
+    return f"source-{digest.hexdigest()[:16]}"
+
+
+try:
+    PIX2GBA_VERSION = version("pix2gba")
+except PackageNotFoundError:
+    PIX2GBA_VERSION = _source_version()
+
+
+@dataclass(frozen=True)
+class CachedImage:
+    """
+    Stands in for the source image of a cached conversion (the emitters only need its size).
+
+    :param width: Width of the source image in pixels.
+    :param height: Height of the source image in pixels.
+    """
+    width: int
+    height: int
+
+
+@dataclass(frozen=True)
+class CacheStats:
+    """
+    What a conversion cache directory holds.
+
+    :param directory: The cache directory.
+    :param entries: Number of cached conversions.
+    :param total_bytes: Size of every cached conversion.
+    :param max_bytes: Size the cache is pruned down to.
+    """
+    directory: Path
+    entries: int
+    total_bytes: int
+    max_bytes: int
+
+
+def default_cache_directory() -> Path:
+    """
+    :return: `pix2gba` in the user's cache directory ($XDG_CACHE_HOME, or ~/.cache)
+    """
+    return Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "pix2gba"
+
+
+def _hash_file(digest, path) -> None:
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+
+
+class ConversionCache:
+    """
+    Content addressed store of finished conversions, shared by every checkout using the same directory.
+    Entries are keyed by the hash of the image, palette and variant files, the unit settings and the pix2gba
+    version, and the least recently used ones are removed when the directory grows above its size.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int = DEFAULT_CACHE_SIZE) -> None:
+        """
+        :param directory: Directory of the cache (created when the first entry is stored)
+        :param max_bytes: Size the cache is pruned down to
+        """
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, args: dict) -> str:
+        """
+        :param args: Conversion arguments of the unit (after the mode overrides)
+        :return: The hash of everything the conversion depends on (None if the image isn't a file)
+        """
+        if args.get("image") is not None or args.get("image_path") is None:
+            return None
+
+        digest = hashlib.sha256()
+        settings = {name: args.get(name) for name in CACHED_ARGUMENTS}
+        settings["version"] = PIX2GBA_VERSION
+        settings["format"] = CACHE_FORMAT
+        settings["pool_palette"] = [int(color) for color in settings["pool_palette"] or []]
+        # Variant names are made from the unit's name
+        if args.get("variants"):
+            settings["image_name"] = args["image_name"]
+            settings["variants"] = [Path(variant).stem for variant in args["variants"]]
+        digest.update(json.dumps(settings, sort_keys=True).encode())
+
+        for path in [args["image_path"], args.get("palette_path")] + list(args.get("variants", [])):
+            digest.update(b"\0file\0")
+            if path is not None:
+                _hash_file(digest, path)
+        return digest.hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.npz"
+
+    def load(self, key: str) -> dict:
+        """
+        Gets a cached conversion, marking it as recently used.
+        :param key: The hash of the conversion
+        :return: The fields of the PreparedConversion (None if it isn't cached or can't be read)
+        """
+        entry_path = self._entry_path(key)
+        try:
+            with np.load(entry_path) as entry:
+                arrays = {name: entry[name] for name in entry.files}
+            os.utime(entry_path)
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            return None
+
+        meta = json.loads(arrays.pop("meta").tobytes())
+        banks = None
+        if meta["banks"] is not None:
+            banks = PaletteBanks(
+                palette=arrays["banks_palette"].tolist(),
+                indices=arrays["banks_indices"],
+                tile_banks=arrays["banks_tile_banks"],
+                **meta["banks"]
+            )
+
+        self.hits += 1
+        return {
+            "image": CachedImage(**meta["image"]),
+            "gba_palette": arrays["palette"].tolist() if "palette" in arrays else None,
+            "tile_data": words_to_hex(arrays["tiles"]),
+            "tile_mapping": arrays["mapping"].tolist() if "mapping" in arrays else None,
+            "raw_words": meta["raw_words"],
+            "banks": banks,
+            "variant_palettes": [(name, palette) for name, palette in meta["variant_palettes"]],
+            "objs": [SpriteObj(**obj) for obj in meta["objs"]] if meta["objs"] is not None else None,
+            "compressed_bytes": arrays["compressed"].tobytes() if "compressed" in arrays else None,
+            "elided_tiles": meta["elided_tiles"],
+            "deltas": [[DeltaRun(**run) for run in runs] for runs in meta["deltas"]]
+                      if meta["deltas"] is not None else None
+        }
+
+    def store(self, key: str, prepared) -> None:
+        """
+        Stores a finished conversion (written to a temporary file first, so readers never see half an entry).
+        :param key: The hash of the conversion
+        :param prepared: The PreparedConversion
+        :return: None
+        """
+        arrays = {"tiles": hex_to_words(prepared.tile_data)}
+        if prepared.gba_palette is not None:
+            arrays["palette"] = np.asarray(prepared.gba_palette, dtype=np.uint16)
+        if prepared.tile_mapping is not None:
+            arrays["mapping"] = np.asarray(prepared.tile_mapping, dtype=np.uint16)
+        if prepared.compressed_bytes is not None:
+            arrays["compressed"] = np.frombuffer(bytes(prepared.compressed_bytes), dtype=np.uint8)
+
+        banks = prepared.banks
+        if banks is not None:
+            arrays["banks_palette"] = np.asarray(banks.palette, dtype=np.uint16)
+            arrays["banks_indices"] = banks.indices
+            arrays["banks_tile_banks"] = banks.tile_banks
+
+        meta = {
+            "image": {"width": prepared.image.width, "height": prepared.image.height},
+            "raw_words": prepared.raw_words,
+            "banks": {"bank_colors": [int(colors) for colors in banks.bank_colors], "lossy_tiles": int(banks.lossy_tiles)}
+                     if banks is not None else None,
+            "variant_palettes": [[name, [int(color) for color in palette]]
+                                 for name, palette in prepared.variant_palettes],
+            "objs": [asdict(obj) for obj in prepared.objs] if prepared.objs is not None else None,
+            "elided_tiles": prepared.elided_tiles,
+            "deltas": [[asdict(run) for run in runs] for runs in prepared.deltas]
+                      if prepared.deltas is not None else None
+        }
+        arrays["meta"] = np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8)
+
+        entry_path = self._entry_path(key)
+        try:
+            entry_path.parent.mkdir(parents=True, exist_ok=True)
+            buffer = io.BytesIO()
+            np.savez(buffer, **arrays)
+            temp_path = entry_path.with_suffix(f".{os.getpid()}.tmp")
+            temp_path.write_bytes(buffer.getvalue())
+            os.replace(temp_path, entry_path)
+        except OSError:
+            # A read-only or full cache only loses the speed up
+            pass
+
+    def _entries(self) -> list[tuple[str, os.stat_result]]:
+        entries = []
+        if not self.directory.is_dir():
+            return entries
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".npz"):
+                    entries.append((entry.path, entry.stat()))
+        return entries
+
+    def stats(self) -> CacheStats:
+        """
+        :return: The CacheStats of the directory
+        """
+        entries = self._entries()
+        return CacheStats(self.directory, len(entries), sum(stat.st_size for _, stat in entries), self.max_bytes)
+
+    def prune(self, max_bytes: int = None) -> tuple[int, int]:
+        """
+        Removes the least recently used entries until the cache fits its size.
+        :param max_bytes: Size to prune down to (default: the cache's size)
+        :return: Tuple of the number of entries removed and the bytes freed
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = sorted(self._entries(), key=lambda entry: entry[1].st_mtime_ns)
+        total_bytes = sum(stat.st_size for _, stat in entries)
+
+        removed = freed = 0
+        for path, stat in entries:
+            if total_bytes <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            try:
+                os.rmdir(os.path.dirname(path))
+            except OSError:
+                # The shard still has entries
+                pass
+            total_bytes -= stat.st_size
+            removed += 1
+            freed += stat.st_size
+        return removed, freed
+
+
+_active_cache: ConversionCache = None
+
+
+def enable_conversion_cache(directory: Path, max_bytes: int = DEFAULT_CACHE_SIZE) -> ConversionCache:
+    """
+    Turns on the conversion cache for every following conversion.
+    :param directory: Directory of the cache
+    :param max_bytes: Size the cache is pruned down to
+    :return: The now active ConversionCache
+    """
+    global _active_cache
+    _active_cache = ConversionCache(directory, max_bytes)
+    return _active_cache
+
+
+def disable_conversion_cache() -> None:
+    """
+    Turns off the conversion cache.
+    :return: None
+    """
+    global _active_cache
+    _active_cache = None
+
+
+def active_conversion_cache() -> ConversionCache:
+    """
+    :return: The active ConversionCache (None if the cache is off)
+    """
+    return _active_cache
@@ -1,57 +1,703 @@
 # gba_converter/converter.py
 import os
+import re
+import numpy as np
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from PIL import Image as PILImage
 
-from .palette import extract_palette_img, palette_from_img, create_conversion_table
-from .tile_output import make_output
-from .tile_creator import create_tile_data
-from .compress_output import make_compress_output
+from .palette import extract_palette_img, palette_from_img, create_conversion_table, palette_from_indexed_img, \
+    remap_indexed_img, extract_variant_palette
+from .tile_output import make_output, palette_array_size, bg_pool_bank, TILE_MAPPING_ENTRY_BYTES
+from .tile_creator import create_tile_data, create_tile_data_from_indices, create_index_plane, order_tiles, \
+    words_to_hex
+from .deduper import dedupe_tiles, elide_empty_tiles, EMPTY_TILE
+from .compress_output import make_compress_output, compress_tile_data
+from .gba_utils import open_rgb_image
+from .multi_palette import create_palette_banks, PaletteBanks
+from .sprite_slicer import create_sprite_tiles
+from .animation import frame_deltas
+from .bitmap import BITMAP_MODES, create_direct_bitmap, create_indexed_bitmap
+from .bitmap_output import make_bitmap_output
+from .profiler import stage
+from .units import UnitReport
+from .errors import Pix2gbaError, ConversionError, InvalidOptionsError
+from .progress import log_progress
+from .conversion_cache import active_conversion_cache
 
-def run_conversion(args: dict) -> bool:
+def decode_unit_image(args: dict):
     """
-    Main conversion workflow.
+    Decodes the source image of a unit.
+    :param args: Conversion arguments of the unit (`image` holds the image when it is given in memory)
+    :return: The loaded image
+    """
+    with stage("decode") as record:
+        img = args.get("image")
+        if img is None:
+            img = PILImage.open(args["image_path"])
+            img.load()
+        record.items = img.width * img.height
+    return img
 
-    :param args: Namespace from argparse.
+def create_unit_tile_data(args: dict):
+    """
+    Decodes the source image, creates its palette and packs it into tile data. Indexed images whose palette
+    already fits take a fast path that packs the raw indices and skips the color matching.
+    :param args: Conversion arguments of the unit
+    :return: The loaded image, the GBA palette, the tile data and the PaletteBanks (None if the unit doesn't use
+             palette banks)
+    :raises ConversionError: If the palette image can't be used
     """
 
-    # Step 1: Create GBA palette
-    #print("* Extracting Palette...")
-    if args["palette_path"]:
-        gba_palette = extract_palette_img(
-            filename=args["palette_path"],
-            bpp=args["bpp"],
-            transparent=args["transparent"]
-        )
-        if gba_palette is None:
-            return True
-    else:
-        gba_palette = palette_from_img(
-            filename=args["image_path"],
+    # Step 1: Decode the source image once for every following stage
+    img = decode_unit_image(args)
+
+    meta_w = args["meta_width"]
+    meta_h = args["meta_height"]
+    bpp = args["bpp"]
+    transparent = args["transparent"]
+
+    # Multi-palette mode: every tile gets the 16 color bank that holds its colors
+    if args.get("palette_banks"):
+        with stage("palette") as record:
+            banks = create_palette_banks(open_rgb_image(img), transparent, args["palette_banks"])
+            record.items = len(banks.palette)
+        _print_bank_packing(banks, bpp)
+
+        with stage("tile_packing") as record:
+            tile_data = create_tile_data_from_indices(banks.indices, meta_w, meta_h, bpp)
+            record.items = len(tile_data) // (2*bpp)
+
+        return img, banks.palette, tile_data, banks
+
+    img, gba_palette, index_remap, conversion_table = create_unit_palette(args, img)
+
+    # Indexed fast path: the pixels already are palette indices
+    if index_remap is not None:
+        log_progress(" \t Indexed image, using its palette indices directly")
+        with stage("tile_packing") as record:
+            indices = index_remap[np.asarray(img)]
+            tile_data = create_tile_data_from_indices(indices, meta_w, meta_h, bpp)
+            record.items = len(tile_data) // (2*bpp)
+
+        return img, gba_palette, tile_data, None
+
+    # Step 4: Pack the pixels into tile data
+    with stage("tile_packing") as record:
+        tile_data = create_tile_data(img, conversion_table, meta_w, meta_h, bpp)
+        record.items = len(tile_data) // (2*bpp)
+
+    return img, gba_palette, tile_data, None
+
+def create_unit_palette(args: dict, img):
+    """
+    Creates the GBA palette of a unit and what its pixels are converted with. Indexed images whose palette
+    already fits skip the color matching.
+    :param args: Conversion arguments of the unit
+    :param img: The decoded source image
+    :return: The image (converted to RGB if needed), the GBA palette, the remap of the image's own indices (None
+             if not indexed) and the conversion table (None if the indices are remapped)
+    :raises ConversionError: If the palette image can't be used
+    """
+    transparent = args["transparent"]
+
+    # Step 2: Create GBA palette (indexed images try to use their own indices)
+    index_remap = None
+    with stage("palette") as record:
+        if args.get("pool_palette") is not None:
+            # The palette was planned for the whole TOML
+            gba_palette = args["pool_palette"]
+            if img.mode == "P":
+                index_remap = remap_indexed_img(img, gba_palette, transparent)
+        elif args["palette_path"]:
+            gba_palette = extract_palette_img(
+                filename=args["palette_path"],
+                bpp=args["bpp"],
+                transparent=transparent
+            )
+            if img.mode == "P":
+                index_remap = remap_indexed_img(img, gba_palette, transparent)
+        elif img.mode == "P":
+            gba_palette, index_remap = palette_from_indexed_img(img, args["bpp"], transparent)
+
+        # Everything else goes through color matching
+        if index_remap is None:
+            img = open_rgb_image(img)
+            if not args["palette_path"] and args.get("pool_palette") is None:
+                gba_palette = palette_from_img(
+                    filename=img,
+                    bpp=args["bpp"],
+                    transparent=transparent
+                )
+        record.items = len(gba_palette)
+
+    if index_remap is not None:
+        return img, gba_palette, index_remap, None
+
+    # Step 3: Create conversion table (pooled palettes share the one made for their bank)
+    conversion_table = args.get("pool_conversion_table")
+    if conversion_table is None:
+        with stage("conversion_table") as record:
+            conversion_table = create_conversion_table(
+                input_img=img,
+                gba_palette=gba_palette,
+            )
+            record.items = len(conversion_table)
+
+    return img, gba_palette, None, conversion_table
+
+def create_unit_bitmap(args: dict):
+    """
+    Converts the whole source image into row major bitmap data for its bitmap mode (no tiles or metatiles).
+    :param args: Conversion arguments of the unit (`bpp` is the bitmap mode's)
+    :return: The loaded image, the palette (None for direct color) and the bitmap data as uint32 hex strings
+    :raises InvalidOptionsError: If the image doesn't fit the mode
+    :raises ConversionError: If the palette image can't be used
+    """
+    bitmap_mode = BITMAP_MODES[args["bitmap_mode"]]
+
+    img = decode_unit_image(args)
+    if img.width > bitmap_mode.width or img.height > bitmap_mode.height:
+        raise InvalidOptionsError(f"{img.width}x{img.height} image is bigger than the {bitmap_mode.width}x"
+                                  f"{bitmap_mode.height} frame of Mode {args['bitmap_mode']}")
+
+    # Mode 3 and 5: every pixel is its own RGB15 color
+    if bitmap_mode.bpp == 16:
+        with stage("bitmap_packing") as record:
+            words = create_direct_bitmap(img)
+            record.items = img.width * img.height
+        return img, None, words_to_hex(words)
+
+    # Mode 4: indices into one 256 color palette
+    img, gba_palette, index_remap, conversion_table = create_unit_palette(args, img)
+
+    with stage("bitmap_packing") as record:
+        if index_remap is not None:
+            indices = index_remap[np.asarray(img)]
+        else:
+            indices = create_index_plane(img, conversion_table)
+        words = create_indexed_bitmap(indices)
+        record.items = img.width * img.height
+
+    return img, gba_palette, words_to_hex(words)
+
+def create_variant_palettes(args: dict, gba_palette: list) -> list[tuple[str, list]]:
+    """
+    Extracts the palettes of the unit's color variants (they reuse the unit's tiles, only the palette changes).
+    :param args: Conversion arguments of the unit
+    :param gba_palette: The palette of the unit
+    :return: List of (variant name, palette)
+    :raises ConversionError: If a variant doesn't fit the palette
+    """
+    variant_palettes = []
+    for variant_path in args.get("variants", []):
+        palette = extract_variant_palette(
+            filename=variant_path,
             bpp=args["bpp"],
-            transparent=args["transparent"]
+            transparent=args["transparent"],
+            base_path=args["palette_path"],
+            base_size=len(gba_palette)
         )
+        # `<unit>_red.png` becomes the `red` variant
+        variant_name = Path(variant_path).stem
+        if variant_name.startswith(args["image_name"] + "_"):
+            variant_name = variant_name[len(args["image_name"]) + 1:]
+        variant_palettes.append((re.sub(r"\W", "_", variant_name), palette))
+
+    return variant_palettes
+
+def _print_bank_packing(banks: PaletteBanks, bpp: int) -> None:
+    """
+    Prints how well the tiles' colors were packed into the palette banks.
+    :param banks: The PaletteBanks of the unit
+    :param bpp: Bits per pixel of the tile data
+    :return: None
+    """
+    num_tiles = banks.tile_banks.size
+    used_colors = sum(banks.bank_colors)
+    log_progress(f" \t Packed {num_tiles} tiles into {len(banks.bank_colors)} palette banks ({used_colors} colors, "
+                 f"{used_colors / (15 * len(banks.bank_colors)) * 100:.1f}% of the banks filled)")
+    log_progress(f" \t\t Colors per bank: {', '.join(str(c) for c in banks.bank_colors)}")
+    if banks.lossy_tiles:
+        log_progress(f" \t\t {banks.lossy_tiles} tiles didn't fit in a bank and use the closest colors")
+
+    tile_bytes = num_tiles * 8 * bpp
+    log_progress(f" \t\t {tile_bytes} bytes of tiles at {bpp}bpp instead of {num_tiles * 64} bytes at 8bpp")
+
+def slice_sprite_tiles(tile_data: list, img, bpp: int) -> tuple[list, list]:
+    """
+    Slices a sprite (packed with 1x1 metatiles) into hardware OBJs.
+    :param tile_data: The packed tile data (uint32 hex strings) in row major tile order
+    :param img: The source image
+    :param bpp: The number of bits per pixel into a palette
+    :return: The tile data of the OBJs (one OBJ after another) and the SpriteObjs
+    """
+    tiles_x, tiles_y = -(-img.width // 8), -(-img.height // 8)
+    words = np.array([int(h, 16) for h in tile_data], dtype=np.uint32).reshape(-1, 2*bpp)
+
+    obj_words, objs = create_sprite_tiles(words, tiles_x, tiles_y, bpp)
+    log_progress(f" \t Sliced into {len(objs)} OBJs using {len(obj_words)} tiles ({len(words)} tiles without slicing)")
+
+    return words_to_hex(obj_words.ravel()), objs
+
+def create_frame_deltas(tile_mapping: list, frame_tiles: int, unique_tiles: int, bpp: int) -> list:
+    """
+    Finds the tiles that change between every two frames of an animation and prints how much that saves.
+    :param tile_mapping: Deduped tile of every slot of every frame
+    :param frame_tiles: Number of tiles in one frame
+    :param unique_tiles: Number of tiles left after deduping across the frames
+    :param bpp: The number of bits per pixel into a palette
+    :return: The DeltaRuns of every frame transition
+    """
+    deltas = frame_deltas(tile_mapping, frame_tiles)
+
+    changed = sum(run.count for runs in deltas for run in runs)
+    runs = sum(len(transition) for transition in deltas)
+    log_progress(f" \t {len(deltas)} frames of {frame_tiles} tiles share {unique_tiles} unique tiles")
+    log_progress(f" \t\t {changed / len(deltas):.1f} tiles ({changed * 8 * bpp // len(deltas)} bytes, "
+                 f"{runs / len(deltas):.1f} DMA runs) change per frame on average instead of {frame_tiles} "
+                 f"({frame_tiles * 8 * bpp} bytes)")
+
+    return deltas
+
+def compose_tile_mapping(tile_mapping: list, dedupe_mapping: list) -> list:
+    """
+    Applies the dedupe mapping on top of the mapping made when eliding empty tiles.
+    :param tile_mapping: Kept tile of every tile (-1 for elided tiles, None if no tiles were elided)
+    :param dedupe_mapping: Unique tile of every kept tile
+    :return: The tile of every original tile in the final tile data (EMPTY_TILE for elided tiles)
+    """
+    if tile_mapping is None:
+        return dedupe_mapping
+
+    return [EMPTY_TILE if index < 0 else dedupe_mapping[index] for index in tile_mapping]
+
+def bank_tile_mapping(banks: PaletteBanks, tile_mapping: list, meta_w: int, meta_h: int) -> list:
+    """
+    Adds the palette bank of every tile to the tile mapping (GBA screen entry, bank in bits 12-15).
+    :param banks: The PaletteBanks of the unit
+    :param tile_mapping: Tile index of every tile (None if not deduped)
+    :param meta_w: Number of tiles one meta tile's width consists of
+    :param meta_h: Number of tiles one meta tile's height consists of
+    :return: The screen entry of every tile in tile stream order
+    """
+    tile_banks = order_tiles(banks.tile_banks, meta_w, meta_h)
+    if tile_mapping is None:
+        tile_mapping = range(len(tile_banks))
+
+    if len(tile_banks) > 1024:
+        log_progress(f" \t WARNING: {len(tile_banks)} tiles don't fit the 10 bit tile index of a screen entry")
+
+    return [int(index) | (int(bank) << 12) for index, bank in zip(tile_mapping, tile_banks)]
+
+def pool_tile_mapping(pool_bank: int, tile_mapping: list, tile_count: int) -> list:
+    """
+    Adds the pooled palette bank of a BG to its tile mapping (GBA screen entry, bank in bits 12-15).
+    :param pool_bank: The unit's bank in the palette pool
+    :param tile_mapping: Tile index of every tile (None if not deduped or elided)
+    :param tile_count: Number of tiles in the tile data
+    :return: The screen entry of every tile in tile stream order
+    """
+    if tile_mapping is None:
+        tile_mapping = range(tile_count)
+
+    return [index | (pool_bank << 12) for index in tile_mapping]
+
+# Rough bytes used per pixel / per packed u32 word by each part of the pipeline
+_DECODE_BYTES_PER_PIXEL = 8     # Decoded image plus its RGB (and padded) copy
+_WORD_BYTES = 67                # One "0x%08x" string object and its list slot
+_DEDUPE_WORD_BYTES = 150        # Integer copies, per tile lists and the re-formatted strings
+_COMPRESS_WORD_BYTES = 50       # Integer copy, the packed bytes and the ctypes buffers
+_EMIT_WORD_BYTES = 24           # The C source text of a word (built by concatenation)
+
+def estimate_conversion_memory(args: dict) -> int:
+    """
+    Estimates the peak memory converting a unit needs, only reading the image header.
+    :param args: Conversion arguments of the unit
+    :return: The estimate in bytes
+    """
+    with PILImage.open(args["image_path"]) as img:
+        width, height = img.size
+
+    num_pxl = width * height
+    num_u32 = num_pxl * args["bpp"] // 32
+
+    word_bytes = _WORD_BYTES + _EMIT_WORD_BYTES
+    if args["dedupe"]:
+        word_bytes += _DEDUPE_WORD_BYTES
+    if args["compress"]:
+        word_bytes += _COMPRESS_WORD_BYTES
+
+    return num_pxl * _DECODE_BYTES_PER_PIXEL + num_u32 * word_bytes
+
+def fill_report(report: UnitReport, args: dict, raw_words: int, tile_words: int, mapping_size: int,
+                compressed_bytes: bytes, gba_palette: list, banks: PaletteBanks, variant_palettes: list) -> None:
+    """
+    Records the sizes of the converted data of a unit.
+    :param report: The UnitReport to fill
+    :param args: Conversion arguments of the unit
+    :param raw_words: Number of u32 words of tile data before deduping
+    :param tile_words: Number of u32 words of the (possibly deduped) tile data
+    :param mapping_size: Number of entries of the tile mapping (0 if not deduped and without palette banks)
+    :param compressed_bytes: The compressed stream (None if not compressed)
+    :param gba_palette: The palette of the unit
+    :param banks: The PaletteBanks of the unit (None if it doesn't use palette banks)
+    :param variant_palettes: The (name, palette) of every palette variant
+    :return: None
+    """
+    words_per_tile = 2 * args["bpp"]
+
+    report.bpp = args["bpp"]
+    report.raw_bytes = raw_words * 4
+    report.tile_count = raw_words // words_per_tile
+    report.deduped_tile_count = tile_words // words_per_tile
+    report.tile_bytes = tile_words * 4
+    report.compressed_bytes = len(compressed_bytes) if compressed_bytes is not None else 0
+    report.palette_size = len(gba_palette)
+    report.palette_bytes = 2 * max(1 << args["bpp"], len(gba_palette)) if args["palette_included"] else 0
+    report.mapping_size = mapping_size
+    report.mapping_bytes = TILE_MAPPING_ENTRY_BYTES * report.mapping_size
+    report.variant_count = len(variant_palettes)
+    report.palette_bytes += sum(2 * palette_array_size(p, args["bpp"]) for _, p in variant_palettes)
+    if banks is not None:
+        report.palette_banks = len(banks.bank_colors)
+        report.lossy_tiles = banks.lossy_tiles
+
+    tiles_rom = report.compressed_bytes if compressed_bytes is not None else report.tile_bytes
+    report.rom_bytes = tiles_rom + report.palette_bytes + report.mapping_bytes
+    report.vram_bytes = report.tile_bytes
+
+@dataclass(frozen=False)
+class PreparedConversion:
+    """
+    Tile data of a unit that is ready to be emitted (everything the conversion makes before the output files).
+
+    :param image: The source image.
+    :param gba_palette: The palette of the unit.
+    :param tile_data: The final (elided, deduped) tile data as uint32 hex strings.
+    :param tile_mapping: Screen entry of every tile (None if there is no mapping).
+    :param raw_words: Number of u32 words of tile data before eliding and deduping.
+    :param banks: The PaletteBanks of the unit (None if it doesn't use palette banks).
+    :param variant_palettes: The (name, palette) of every palette variant.
+    :param objs: The SpriteObjs of the unit (None if not in sprite mode).
+    :param compressed_bytes: The compressed tile data (None if not compressed).
+    :param elided_tiles: Number of fully transparent tiles dropped.
+    :param deltas: The DeltaRuns of every frame transition (None if not in animation mode).
+    """
+    image: object
+    gba_palette: list
+    tile_data: list
+    tile_mapping: list
+    raw_words: int
+    banks: PaletteBanks = None
+    variant_palettes: list = field(default_factory=list)
+    objs: list = None
+    compressed_bytes: bytes = None
+    elided_tiles: int = 0
+    deltas: list = None
+
+    def tile_count(self, bpp: int) -> int:
+        return len(self.tile_data) // (2*bpp)
+
+def offset_tile_mapping(tile_mapping: list, tile_base: int, reserve_empty: bool = False) -> list:
+    """
+    Moves the tile index of every screen entry by where the unit's tiles are placed in VRAM.
+    :param tile_mapping: Screen entry of every tile
+    :param tile_base: Index of the unit's first tile in its charblock (or OBJ VRAM)
+    :param reserve_empty: If the mapping uses the reserved empty tile index (elided tiles)
+    :return: The offset screen entries (empty tiles keep the reserved index)
+    :raises Pix2gbaError: If a tile index goes past the 10 bits of a screen entry (or onto the empty tile index)
+    """
+    max_index = EMPTY_TILE - 1 if reserve_empty else EMPTY_TILE
+    offset = []
+    for entry in tile_mapping:
+        index = entry & 0x3FF
+        if reserve_empty and index == EMPTY_TILE:
+            offset.append(entry)
+            continue
+        # An overflowing index would carry into the flip bits (10-11) of the screen entry
+        if index + tile_base > max_index:
+            raise Pix2gbaError(f"Tile index {index} placed at tile {tile_base} goes past the last tile index "
+                               f"(0x{max_index:03x}) of a screen entry")
+        offset.append((entry & ~0x3FF) | (index + tile_base))
+    return offset
+
+def _mode_args(args: dict) -> dict:
+    # Sprites are sliced from single tiles
+    if args.get("mode") == "sprite":
+        return dict(args, meta_width=1, meta_height=1)
+
+    # Every frame is one metatile, so the tile stream goes frame after frame, deduped across the frames
+    if args.get("mode") == "animation":
+        return dict(args, meta_width=args["frame_width"] // 8, meta_height=args["frame_height"] // 8, dedupe=True)
+
+    # Bitmaps aren't tiled and have the bit depth of their mode
+    if args.get("mode") == "bitmap":
+        return dict(args, meta_width=1, meta_height=1, bpp=BITMAP_MODES[args["bitmap_mode"]].bpp)
+    return args
 
-    # Step 2: Create conversion table
-    #print("* Creating Color Conversion Table...")
-    conversion_table = create_conversion_table(
-        input_img=args["image_path"],
+def _prepare_bitmap(args: dict) -> PreparedConversion:
+    """
+    Converts a bitmap unit and compresses it if asked.
+    :param args: Conversion arguments of the unit
+    :return: The PreparedConversion
+    """
+    img, gba_palette, bitmap_data = create_unit_bitmap(args)
+
+    compressed_bytes = None
+    if args["compress"]:
+        with stage("compression") as record:
+            record.items = len(bitmap_data) * 4
+            compressed_bytes = compress_tile_data(bitmap_data)
+
+    return PreparedConversion(
+        image=img,
         gba_palette=gba_palette,
+        tile_data=bitmap_data,
+        tile_mapping=None,
+        raw_words=len(bitmap_data),
+        compressed_bytes=compressed_bytes
     )
 
-    # Step 3: Generate .h and/or .c output
-    #print("* Generating C/Header Output...")
-    if args["compress"]:
-        make_compress_output(
-            arguments=args,
-            conversion_table=conversion_table,
-            gba_palette=gba_palette
-        )
+def prepare_conversion(args: dict) -> PreparedConversion:
+    """
+    Runs every step of the conversion besides creating the output files (or reuses the result from the
+    conversion cache when it is on).
+    :param args: Conversion arguments of the unit
+    :return: The PreparedConversion
+    :raises InvalidOptionsError: If the unit's settings don't fit its image
+    :raises ConversionError: If the unit can't be converted
+    """
+
+    args = _mode_args(args)
+
+    cache = active_conversion_cache()
+    key = None
+    if cache is not None:
+        with stage("cache"):
+            key = cache.key(args)
+            cached = cache.load(key) if key is not None else None
+        if cached is not None:
+            log_progress(f" \t Reusing the cached conversion")
+            return PreparedConversion(**cached)
+
+    if args.get("mode") == "bitmap":
+        prepared = _prepare_bitmap(args)
     else:
-        make_output(
-            arguments=args,
-            conversion_table=conversion_table,
-            gba_palette=gba_palette
-        )
+        prepared = _prepare_tiles(args)
+
+    if key is not None:
+        with stage("cache"):
+            cache.store(key, prepared)
+    return prepared
+
+def try_prepare_conversion(args: dict) -> PreparedConversion:
+    """
+    prepare_conversion for the command line: prints why a unit can't be converted instead of raising.
+    :param args: Conversion arguments of the unit
+    :return: The PreparedConversion (None if the conversion failed)
+    """
+    try:
+        return prepare_conversion(args)
+    except (ConversionError, InvalidOptionsError) as error:
+        print(f" \t ERROR: {error}")
+        return None
+
+def _prepare_tiles(args: dict) -> PreparedConversion:
+    """
+    Converts a tiled unit (tiles, sprite or animation mode).
+    :param args: Conversion arguments of the unit
+    :return: The PreparedConversion
+    """
+    # Steps 1 to 4: Decode, create the palette and pack the tile data
+    img, gba_palette, tile_data, banks = create_unit_tile_data(args)
+
+    # Palette swaps of the unit only need their palettes
+    variant_palettes = []
+    if args.get("variants"):
+        with stage("palette") as record:
+            variant_palettes = create_variant_palettes(args, gba_palette)
+            record.items = len(variant_palettes)
+        log_progress(f" \t Reusing the tiles for {len(variant_palettes)} palette variants")
+
+    bpp = args["bpp"]
+    raw_words = len(tile_data)
+
+    # Cover the sprite with the fewest OBJs and tiles
+    objs = None
+    if args.get("mode") == "sprite":
+        with stage("sprite_slicing") as record:
+            record.items = raw_words // (2*bpp)
+            tile_data, objs = slice_sprite_tiles(tile_data, img, bpp)
+
+    # Step 5: Drop the fully transparent tiles
+    tile_mapping = None
+    elided_tiles = 0
+    if args.get("elide_empty"):
+        with stage("elide") as record:
+            record.items = len(tile_data) // (2*bpp)
+            tile_data, tile_mapping = elide_empty_tiles(tile_data, bpp, -1 if args["dedupe"] else EMPTY_TILE)
+        elided_tiles = (raw_words - len(tile_data)) // (2*bpp)
+
+    # Step 6: Remove duplicate tiles
+    if args["dedupe"]:
+        with stage("dedupe") as record:
+            record.items = len(tile_data) // (2*bpp)
+            tile_data, dedupe_mapping = dedupe_tiles(tile_data, bpp)
+        tile_mapping = compose_tile_mapping(tile_mapping, dedupe_mapping)
+
+    # Elided tiles point at the last tile index, so the kept tiles have to stay below it
+    if args.get("elide_empty") and len(tile_data) // (2*bpp) > EMPTY_TILE:
+        raise ConversionError(f"{len(tile_data) // (2*bpp)} tiles are left after eliding, at most {EMPTY_TILE} fit "
+                              f"below the reserved empty tile index (0x{EMPTY_TILE:03x})")
+
+    # The tiles to copy between every two frames
+    deltas = None
+    if args.get("mode") == "animation":
+        deltas = create_frame_deltas(tile_mapping, args["meta_width"] * args["meta_height"], len(tile_data) // (2*bpp),
+                                     bpp)
+
+    # The palette bank of every tile goes in the tile mapping
+    if banks is not None:
+        tile_mapping = bank_tile_mapping(banks, tile_mapping, args["meta_width"], args["meta_height"])
+    elif bg_pool_bank(args) is not None:
+        tile_mapping = pool_tile_mapping(bg_pool_bank(args), tile_mapping, len(tile_data) // (2*bpp))
+
+    # Step 7: Compress the tile data
+    compressed_bytes = None
+    if args["compress"]:
+        with stage("compression") as record:
+            record.items = len(tile_data) * 4
+            compressed_bytes = compress_tile_data(tile_data)
+
+    return PreparedConversion(
+        image=img,
+        gba_palette=gba_palette,
+        tile_data=tile_data,
+        tile_mapping=tile_mapping,
+        raw_words=raw_words,
+        banks=banks,
+        variant_palettes=variant_palettes,
+        objs=objs,
+        compressed_bytes=compressed_bytes,
+        elided_tiles=elided_tiles,
+        deltas=deltas
+    )
+
+def placed_tile_mapping(args: dict, prepared: PreparedConversion) -> tuple[list, list]:
+    """
+    Bakes the unit's place in VRAM into its tile indices (an animation's mapping indexes its ROM tiles, so it
+    isn't moved).
+    :param args: Conversion arguments of the unit (after the mode's overrides, `tile_base` is its first tile)
+    :param prepared: The PreparedConversion of the unit
+    :return: The screen entries and the SpriteObjs that are emitted (None if the unit has none)
+    """
+    tile_mapping = prepared.tile_mapping
+    objs = prepared.objs
+
+    tile_base = args.get("tile_base", 0)
+    if tile_base:
+        if tile_mapping is not None and prepared.deltas is None:
+            tile_mapping = offset_tile_mapping(tile_mapping, tile_base, bool(args.get("elide_empty")))
+        if objs is not None:
+            objs = [replace(obj, tile=obj.tile + tile_base) for obj in objs]
+    return tile_mapping, objs
+
+def emit_conversion(args: dict, prepared: PreparedConversion, report: UnitReport = None) -> None:
+    """
+    Creates the output files of a prepared unit.
+    :param args: Conversion arguments of the unit (`tile_base` offsets the mapping and OBJs when it is set)
+    :param prepared: The PreparedConversion of the unit
+    :param report: UnitReport to fill with the sizes of the output (None to skip)
+    :return: None
+    """
+    args = _mode_args(args)
+    if args.get("mode") == "bitmap":
+        with stage("emission") as record:
+            make_bitmap_output(args, prepared.image, prepared.tile_data, prepared.gba_palette, prepared.compressed_bytes)
+            record.items = len(prepared.tile_data)
+        if report is not None:
+            _fill_bitmap_report(report, args, prepared)
+        return
+
+    bpp = args["bpp"]
+    tile_data = prepared.tile_data
+    tile_mapping, objs = placed_tile_mapping(args, prepared)
+    compressed_bytes = prepared.compressed_bytes
+    tile_base = args.get("tile_base", 0)
+
+    # Step 8: Generate .h and/or .c output
+    with stage("emission") as record:
+        if args["compress"]:
+            make_compress_output(
+                arguments=args,
+                image=prepared.image,
+                compressed_bytes=compressed_bytes,
+                gba_palette=prepared.gba_palette,
+                tile_mapping=tile_mapping,
+                variant_palettes=prepared.variant_palettes,
+                tile_count=prepared.tile_count(bpp),
+                objs=objs,
+                deltas=prepared.deltas
+            )
+        else:
+            make_output(
+                arguments=args,
+                image=prepared.image,
+                tile_data=tile_data,
+                tile_mapping=tile_mapping,
+                gba_palette=prepared.gba_palette,
+                variant_palettes=prepared.variant_palettes,
+                objs=objs,
+                deltas=prepared.deltas
+            )
+        record.items = len(tile_data) if compressed_bytes is None else len(compressed_bytes)
+
+    if report is not None:
+        fill_report(report, args, prepared.raw_words, len(tile_data),
+                    len(tile_mapping) if tile_mapping is not None else 0, compressed_bytes, prepared.gba_palette,
+                    prepared.banks, prepared.variant_palettes)
+        report.elided_tile_count = prepared.elided_tiles
+        report.obj_count = len(objs) if objs is not None else 0
+        report.tile_base = tile_base
+        if prepared.deltas is not None:
+            report.frame_count = len(prepared.deltas)
+            report.delta_tiles = sum(run.count for runs in prepared.deltas for run in runs)
+            report.vram_bytes = args["meta_width"] * args["meta_height"] * 8 * bpp
+
+def _fill_bitmap_report(report: UnitReport, args: dict, prepared: PreparedConversion) -> None:
+    """
+    Records the sizes of the converted data of a bitmap unit.
+    :param report: The UnitReport to fill
+    :param args: Conversion arguments of the unit
+    :param prepared: The PreparedConversion of the unit
+    :return: None
+    """
+    report.bpp = args["bpp"]
+    report.raw_bytes = report.tile_bytes = len(prepared.tile_data) * 4
+    report.compressed_bytes = len(prepared.compressed_bytes) if prepared.compressed_bytes is not None else 0
+    if prepared.gba_palette is not None:
+        report.palette_size = len(prepared.gba_palette)
+        if args["palette_included"]:
+            report.palette_bytes = 2 * palette_array_size(prepared.gba_palette, args["bpp"])
+
+    data_rom = report.compressed_bytes if prepared.compressed_bytes is not None else report.tile_bytes
+    report.rom_bytes = data_rom + report.palette_bytes
+    report.vram_bytes = report.tile_bytes
+
+def run_conversion(args: dict, report: UnitReport = None) -> bool:
+    """
+    Main conversion workflow.
+
+    :param args: Namespace from argparse.
+    :param report: UnitReport to fill with the sizes of the output (None to skip)
+    :return: True if the conversion failed, False otherwise
+    """
+    prepared = try_prepare_conversion(args)
+    if prepared is None:
+        return True
 
+    emit_conversion(args, prepared, report)
     return False
 
 
@@ -71,37 +717,13 @@ def clean_conversion(args: dict) -> None:
     if os.path.exists(f"{output_path}/{image_name}_palette.png"):
         os.remove(f"{output_path}/{image_name}_palette.png")
 
-def simulate_conversion(args: dict) -> tuple[list, list]:
-    # Step 1: Create GBA palette
-    if args["palette_path"]:
-        gba_palette = extract_palette_img(
-            filename=args["palette_path"],
-            bpp=args["bpp"],
-            transparent=args["transparent"]
-        )
-        if gba_palette is None:
-            exit(1)
-    else:
-        gba_palette = palette_from_img(
-            filename=args["image_path"],
-            bpp=args["bpp"],
-            transparent=args["transparent"]
-        )
-
-    # Step 2: Create conversion table
-    conversion_table = create_conversion_table(
-        input_img=args["image_path"],
-        gba_palette=gba_palette,
-    )
-
-    # Step 3: Generate tile data
-    meta_w = args["meta_width"]
-    meta_h = args["meta_height"]
-    bpp = args["bpp"]
+    # Clear preview files
+    if os.path.exists(f"{output_path}/{image_name}_preview.png"):
+        os.remove(f"{output_path}/{image_name}_preview.png")
 
-    file_path = args["image_path"]
-
-    final_array = create_tile_data(file_path, conversion_table, meta_w, meta_h, bpp)
+def simulate_conversion(args: dict) -> tuple[list, list]:
+    # Step 1: Create the GBA palette and tile data
+    img, gba_palette, final_array, _ = create_unit_tile_data(args)
 
-    # Step 4: Return the tile data and the palette data
+    # Step 2: Return the tile data and the palette data
     return final_array, gba_palette
@@ -0,0 +1,283 @@
+import io
+import json
+import os
+import socket
+import struct
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout, redirect_stderr
+from dataclasses import asdict, fields
+from pathlib import Path
+
+import numpy as np
+
+from .animation import DeltaRun
+from .errors import Pix2gbaError, ConversionError, InvalidOptionsError
+from .library import ConvertOptions, ConvertResult, convert_image
+from .sprite_slicer import SpriteObj
+
+SOCKET_NAME = "daemon.sock"
+
+# Every message is the length of its JSON header (4 bytes, big endian), the header, then `payload_bytes` of payload
+HEADER_LENGTH = struct.Struct(">I")
+
+# Arrays of a ConvertResult sent as payload sections, with their dtypes
+RESULT_ARRAYS = {"tiles": "<u4", "palette": "<u2", "mapping": "<u2"}
+
+
+def default_socket_path(root: Path) -> Path:
+    """
+    :param root: Root directory of the projects
+    :return: Path of the daemon's socket for the root
+    """
+    return root / ".pix2gba" / SOCKET_NAME
+
+
+def _recv_exactly(connection: socket.socket, size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size:
+        chunk = connection.recv(min(size - len(data), 1 << 20))
+        if not chunk:
+            raise ConnectionError("Connection closed in the middle of a message")
+        data += chunk
+    return bytes(data)
+
+
+def send_message(connection: socket.socket, header: dict, payload: bytes = b"") -> None:
+    """
+    Sends a JSON header and its binary payload.
+    :param connection: The connected socket
+    :param header: The JSON header (`payload_bytes` is set to the length of the payload)
+    :param payload: The binary payload
+    :return: None
+    """
+    encoded = json.dumps(dict(header, payload_bytes=len(payload))).encode()
+    connection.sendall(HEADER_LENGTH.pack(len(encoded)) + encoded + payload)
+
+
+def recv_message(connection: socket.socket) -> tuple[dict, bytes]:
+    """
+    Receives a JSON header and its binary payload.
+    :param connection: The connected socket
+    :return: Tuple of the header and the payload
+    """
+    header_length = HEADER_LENGTH.unpack(_recv_exactly(connection, HEADER_LENGTH.size))[0]
+    header = json.loads(_recv_exactly(connection, header_length))
+    return header, _recv_exactly(connection, header.get("payload_bytes", 0))
+
+
+def _convert_request(options: dict, image_bytes: bytes) -> tuple[dict, bytes]:
+    """
+    Converts an image sent to the daemon (runs in a worker).
+    :param options: The fields of the ConvertOptions
+    :param image_bytes: The encoded image
+    :return: Tuple of the response header and the payload (the result's arrays, then its compressed tiles)
+    """
+    try:
+        if "palette" in options and options["palette"] is not None:
+            options["palette"] = tuple(options["palette"])
+        result = convert_image(image_bytes, ConvertOptions(**options))
+    except TypeError as error:
+        # Unknown option names
+        return {"ok": False, "type": "InvalidOptionsError", "error": str(error)}, b""
+    except Pix2gbaError as error:
+        return {"ok": False, "type": type(error).__name__, "error": str(error)}, b""
+
+    sections = {}
+    payload = bytearray()
+    for name in RESULT_ARRAYS:
+        array = getattr(result, name)
+        if array is not None:
+            sections[name] = len(array.tobytes())
+            payload += array.tobytes()
+    if result.compressed is not None:
+        sections["compressed"] = len(result.compressed)
+        payload += result.compressed
+
+    header = {
+        "ok": True,
+        "width": result.width,
+        "height": result.height,
+        "bpp": result.bpp,
+        "sections": sections,
+        "objs": [asdict(obj) for obj in result.objs] if result.objs is not None else None,
+        "deltas": [[asdict(run) for run in runs] for runs in result.deltas] if result.deltas is not None else None,
+        "log": result.log
+    }
+    return header, bytes(payload)
+
+
+def _command_request(argv: list[str], cwd: str) -> tuple[dict, bytes]:
+    """
+    Runs a command line sent to the daemon (runs in a worker).
+    :param argv: The command line arguments (without `pix2gba`)
+    :param cwd: Directory the command was run from
+    :return: Tuple of the response header (with the command's exit code and output) and an empty payload
+    """
+    from . import api
+    from .cli import run_command_line
+
+    os.chdir(cwd)
+    api.ROOT_DIRECTORY = Path(cwd)
+
+    output = io.StringIO()
+    exit_code = 0
+    with redirect_stdout(output), redirect_stderr(output):
+        try:
+            run_command_line(argv)
+        except SystemExit as error:
+            exit_code = error.code if isinstance(error.code, int) else (0 if error.code is None else 1)
+    return {"ok": True, "exit_code": exit_code, "output": output.getvalue()}, b""
+
+
+def _handle_connection(connection: socket.socket, pool: ProcessPoolExecutor) -> None:
+    """
+    Answers the requests of one client until it disconnects.
+    :param connection: The client's socket
+    :param pool: The warm worker pool
+    :return: None
+    """
+    with connection:
+        while True:
+            try:
+                header, payload = recv_message(connection)
+            except (ConnectionError, ValueError):
+                return
+
+            op = header.get("op")
+            try:
+                if op == "ping":
+                    response = {"ok": True, "pid": os.getpid()}, b""
+                elif op == "convert":
+                    response = pool.submit(_convert_request, header.get("options", {}), payload).result()
+                elif op == "command":
+                    response = pool.submit(_command_request, header.get("argv", []), header.get("cwd", ".")).result()
+                else:
+                    response = {"ok": False, "type": "InvalidRequest", "error": f"Unknown request: `{op}`"}, b""
+            except Exception as error:
+                # A crashed worker (or anything unexpected) fails the request, not the daemon
+                response = {"ok": False, "type": type(error).__name__, "error": str(error)}, b""
+
+            try:
+                send_message(connection, *response)
+            except OSError:
+                return
+
+
+def daemon_running(socket_path: Path) -> bool:
+    """
+    :param socket_path: Path of the daemon's socket
+    :return: Whether a daemon answers on the socket
+    """
+    if not socket_path.exists():
+        return False
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.connect(str(socket_path))
+            send_message(connection, {"op": "ping"})
+            return recv_message(connection)[0].get("ok", False)
+    except (OSError, ValueError):
+        return False
+
+
+def serve(socket_path: Path, jobs: int = None) -> None:
+    """
+    Serves conversions over a Unix socket until interrupted. Requests run in a pool of worker processes that stay
+    up, so their parsed TOMLs, PNG headers and nearest color tables are reused by the next requests.
+    :param socket_path: Path of the socket to listen on
+    :param jobs: Number of worker processes (default: one per CPU)
+    :return: None
+    """
+    if daemon_running(socket_path):
+        raise Pix2gbaError(f"A daemon is already running on {socket_path}")
+
+    # The socket of a daemon that didn't stop cleanly
+    socket_path.parent.mkdir(parents=True, exist_ok=True)
+    if socket_path.exists():
+        socket_path.unlink()
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool, socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(str(socket_path))
+        server.listen()
+        print(f"* Serving on {socket_path} with {jobs or os.cpu_count()} workers (Ctrl+C to stop)")
+
+        try:
+            while True:
+                connection, _ = server.accept()
+                threading.Thread(target=_handle_connection, args=(connection, pool), daemon=True).start()
+        except KeyboardInterrupt:
+            print("\n* Stopped serving")
+        finally:
+            socket_path.unlink(missing_ok=True)
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _request(socket_path: Path, header: dict, payload: bytes = b"") -> tuple[dict, bytes]:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(str(socket_path))
+        send_message(connection, header, payload)
+        return recv_message(connection)
+
+
+def forward_to_daemon(argv: list[str], socket_path: Path) -> int:
+    """
+    Runs a command line in the daemon and prints its output.
+    :param argv: The command line arguments (without `pix2gba`)
+    :param socket_path: Path of the daemon's socket
+    :return: The command's exit code (None if no daemon is running, the command should run locally)
+    """
+    if not socket_path.exists():
+        return None
+    try:
+        header, _ = _request(socket_path, {"op": "command", "argv": argv, "cwd": os.getcwd()})
+    except (OSError, ValueError):
+        return None
+    if not header.get("ok"):
+        raise Pix2gbaError(f"Daemon failed to run the command: {header.get('error')}")
+
+    print(header["output"], end="")
+    return header["exit_code"]
+
+
+def convert_with_daemon(image_bytes: bytes, options: ConvertOptions = ConvertOptions(),
+                        socket_path: Path = None) -> ConvertResult:
+    """
+    Converts an encoded image in a running daemon (same result as `convert_image`).
+    :param image_bytes: The bytes of an encoded image (PNG, ...)
+    :param options: How the image is converted
+    :param socket_path: Path of the daemon's socket (default: the one of the current directory)
+    :return: The ConvertResult
+    :raises ConversionError: If the daemon can't be reached or the image can't be converted
+    """
+    socket_path = socket_path or default_socket_path(Path.cwd())
+    option_values = {field.name: getattr(options, field.name) for field in fields(options)}
+    try:
+        header, payload = _request(socket_path, {"op": "convert", "options": option_values}, bytes(image_bytes))
+    except (OSError, ValueError) as error:
+        raise ConversionError(f"Daemon could not be reached on {socket_path}: {error}") from error
+
+    if not header.get("ok"):
+        if header.get("type") == "InvalidOptionsError":
+            raise InvalidOptionsError(header["error"])
+        raise ConversionError(header["error"])
+
+    # The payload sections are in the order the daemon wrote them
+    arrays = {}
+    offset = 0
+    for name, size in header["sections"].items():
+        data = payload[offset:offset + size]
+        arrays[name] = bytes(data) if name == "compressed" else np.frombuffer(data, dtype=RESULT_ARRAYS[name]).copy()
+        offset += size
+
+    return ConvertResult(
+        width=header["width"],
+        height=header["height"],
+        bpp=header["bpp"],
+        tiles=arrays["tiles"],
+        palette=arrays.get("palette"),
+        mapping=arrays.get("mapping"),
+        compressed=arrays.get("compressed"),
+        objs=[SpriteObj(**obj) for obj in header["objs"]] if header["objs"] is not None else None,
+        deltas=[[DeltaRun(**run) for run in runs] for runs in header["deltas"]] if header["deltas"] is not None else None,
+        log=header["log"]
+    )
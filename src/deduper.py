@@ -1,79 +1,64 @@
+import numpy as np
 
-def _hash_list(l: list):
-    result = 17
-    for i in range(len(l)):
-        result = result * 31 + l[i]
+from .progress import log_progress
 
-    return result
+# Tile index the mapping uses for elided (fully transparent) tiles, the highest index a screen entry can hold
+EMPTY_TILE = 0x3FF
 
-def _compare_lists(l1: list, l2: list)-> bool:
+def dedupe_tiles(hex_list: list, bpp: int)-> tuple[list[hex], list[int]]:
     """
-    Checks if two lists are the same value wise
-    :param l1: List 1
-    :param l2: List 2
-    :return: True if the same, False is different
+    Removes duplicate 8x8 tiles from the tile data, keeping the first copy of every tile in the order they appear.
+    :param hex_list: The packed tile data (uint32 hex strings)
+    :param bpp: The number of bits per pixel into a palette
+    :return: The tile data of the unique tiles and the mapping from every original tile to its unique tile
     """
-    for i in range(len(l1)):
-        if l1[i] != l2[i]:
-            return False
-
-    return True
-
-def dedupe_tiles(hex_list: list, bpp: int)-> tuple[list[hex], list[int]]:
-    print(" \t Deduping...")
+    log_progress(" \t Deduping...")
     # 1. Split of stream of hex to tile
-    int_list = [int(h, 16) for h in hex_list]
+    words = np.array([int(h, 16) for h in hex_list], dtype=np.uint32)
+    tiles = words.reshape(-1, 2*bpp)
+    if len(tiles) == 0:
+        return [], []
 
-    tile_list = []
-    hex_tile_list = []
-    temp_tile = []
-    for i in range(len(int_list)):
-        if i % (2*bpp) == 0 and i != 0:
-            tile_list.append(temp_tile)
-            temp_tile = []
+    # 2. Find the unique tiles and which unique tile every tile is
+    _, first_index, inverse = np.unique(tiles, axis=0, return_index=True, return_inverse=True)
 
-        temp_tile.append(int_list[i])
-    tile_list.append(temp_tile)
+    # 3. Number the unique tiles in the order they first appear
+    order = np.argsort(first_index)
+    unique_id = np.empty_like(order)
+    unique_id[order] = np.arange(len(order))
+    tile_mapping = unique_id[inverse.ravel()].tolist()
 
-    # 2. Hash all tiles into single value
-    hash_list = [_hash_list(l) for l in tile_list]
+    log_progress(f" \t\t Deduped from {len(tiles)} to {len(order)} tiles!")
 
-    # 3. Compare the values and eliminate duplicates and create tile mapping
-    tile_mapping = []
-    lookup_table = {}
-    unique_tiles = 0
-    for i in range(len(hash_list)):
-        entry = hash_list[i]
-        # If not in the lut then is a unique entry
-        if entry not in lookup_table:
-            lookup_table[entry] = [i]
-            tile_mapping.append(unique_tiles)
-            unique_tiles += 1
-        # If there is a collision, compare with all in that bucket for uniqueness
-        else:
-            found_match = False
-            for index in lookup_table[entry]:
-                # If the current list matches one in the bucket then isn't unique
-                if _compare_lists(tile_list[i], tile_list[index]):
-                    found_match = True
-                    tile_mapping.append(index)
-                    break
+    # 4. Go through each kept tile and add data to final array
+    final_list = ["0x{:08x}".format(i) for i in tiles[first_index[order]].ravel().tolist()]
 
-            # If here then the list is unique to all others in the hash
-            if not found_match:
-                lookup_table[entry].append(i)
-                tile_mapping.append(i)
-                unique_tiles += 1
+    return final_list, tile_mapping
 
+def elide_empty_tiles(hex_list: list, bpp: int, empty_index: int = EMPTY_TILE) -> tuple[list[hex], list[int]]:
+    """
+    Drops the tiles that are fully transparent (every pixel is palette index 0) from the tile data.
+    :param hex_list: The packed tile data (uint32 hex strings)
+    :param bpp: The number of bits per pixel into a palette
+    :param empty_index: Index the mapping gives dropped tiles (-1 keeps them apart from kept tile 1023 when the
+                        mapping is composed further)
+    :return: The tile data of the kept tiles and the mapping from every original tile to its kept tile
+             (empty_index for dropped tiles)
+    """
+    log_progress(" \t Eliding empty tiles...")
+    words = np.array([int(h, 16) for h in hex_list], dtype=np.uint32)
+    tiles = words.reshape(-1, 2*bpp)
 
-    print(f" \t\t Deduped from {len(tile_list)} to {len(lookup_table.values())} tiles!")
+    # A tile is empty when all of its packed indices are 0
+    kept = tiles.any(axis=1)
+    kept_count = int(kept.sum())
 
-    # 4. Go through each kept tile and add data to final array
-    final_list = []
-    for entry in lookup_table.values():
-        for tile_id in entry:
-            final_list.extend(tile_list[tile_id])
+    tile_mapping = np.full(len(tiles), empty_index, dtype=np.int64)
+    tile_mapping[kept] = np.arange(kept_count)
+
+    saved_bytes = (len(tiles) - kept_count) * 8 * bpp
+    log_progress(f" \t\t Elided {len(tiles) - kept_count} of {len(tiles)} tiles ({saved_bytes} bytes of VRAM saved)!")
 
-    final_list = ["0x{:08x}".format(i) for i in final_list]
+    final_list = [h for h, keep in zip(hex_list, np.repeat(kept, 2*bpp)) if keep]
 
-    return final_list, tile_mapping
\ No newline at end of file
+    return final_list, tile_mapping.tolist()
@@ -0,0 +1,352 @@
+import io
+from contextlib import redirect_stdout
+from dataclasses import dataclass
+
+import numpy as np
+from PIL import Image as PILImage
+
+from .bitmap import bitmap_row_width
+from .config import plan_vram_scene
+from .converter import _mode_args, try_prepare_conversion, placed_tile_mapping, PreparedConversion
+from .deduper import EMPTY_TILE
+from .errors import ConversionError
+from .gba_utils import rgb888_array_to_rgb15, open_rgb_image
+from .palette import extract_palette_img, indexed_img_colors, RGB15_COLORS
+from .png_header import read_png_header
+from .tile_creator import hex_to_words, order_tiles, padded_size
+from .tile_output import obj_palette_bank
+from .units import VramScene, ConversionConfig
+
+
+@dataclass(frozen=True)
+class DeepVerification:
+    """
+    What `verify --deep` found out about a unit.
+
+    :param name: Name of the unit.
+    :param width: Width of the source image in pixels.
+    :param height: Height of the source image in pixels.
+    :param source_colors: Number of RGB15 colors the source uses (the transparent color excluded).
+    :param palette_colors: Number of colors the unit's palette can hold (None for direct color bitmaps).
+    :param mismatched_pixels: Number of decoded pixels that differ from the RGB15 quantized source.
+    :param warnings: Problems that don't stop the conversion.
+    :param failed: If the unit failed to convert.
+    """
+    name: str
+    width: int
+    height: int
+    source_colors: int
+    palette_colors: int
+    mismatched_pixels: int
+    warnings: tuple
+    failed: bool
+
+    @property
+    def mismatch_rate(self) -> float:
+        return self.mismatched_pixels / max(1, self.width * self.height)
+
+
+def _palette_capacity(args: dict) -> int:
+    """
+    :param args: Conversion arguments of the unit (after the mode's overrides)
+    :return: Number of colors (besides the transparent one) the unit's palette holds (None for direct color)
+    """
+    if args["bpp"] == 16:
+        return None
+    if args.get("palette_banks"):
+        return 15 * args["palette_banks"]
+    return (1 << args["bpp"]) - 1
+
+
+def _header_warnings(args: dict, header) -> list[str]:
+    """
+    Checks the image size against the unit's metatiles (validation already rejected sizes that can't be converted).
+    :param args: Conversion arguments of the unit (after the mode's overrides)
+    :param header: The PngHeader of the source image
+    :return: The warnings
+    """
+    if args.get("mode") in ("bitmap", "animation"):
+        return []
+
+    block_w, block_h = args["meta_width"] * 8, args["meta_height"] * 8
+    if header.width % block_w or header.height % block_h:
+        return [f"{header.width}x{header.height} image is not a multiple of the {block_w}x{block_h} metatile size, "
+                f"it is padded with transparent pixels"]
+    return []
+
+
+def source_rgb15(args: dict) -> np.ndarray:
+    """
+    Reads the source image the way the conversion sees it: entries of an indexed image that are transparent (tRNS)
+    or the transparent color itself become the transparent color.
+    :param args: Conversion arguments of the unit
+    :return: (height, width) array of the RGB15 color of every pixel
+    """
+    with PILImage.open(args["image_path"]) as img:
+        img.load()
+        if img.mode == "P":
+            colors = np.asarray(indexed_img_colors(img, args["transparent"]), dtype=np.int64)
+            # Indices past the end of the PLTE read as black
+            colors = np.concatenate([colors, np.zeros(256 - len(colors), dtype=np.int64)])
+            return colors[np.asarray(img)]
+        return rgb888_array_to_rgb15(np.asarray(open_rgb_image(img), dtype=np.uint8))
+
+
+def _tile_pixels(words: np.ndarray, bpp: int) -> np.ndarray:
+    """
+    :param words: uint32 array of packed tiles
+    :param bpp: The number of bits per pixel into a palette
+    :return: (tiles, 8, 8) array of the palette index of every pixel of every tile
+    """
+    data = np.asarray(words, dtype="<u4").view(np.uint8)
+    if bpp == 4:
+        # Leftmost pixel in the low nibble
+        data = np.stack([data & 0xF, data >> 4], axis=-1)
+    return data.reshape(-1, 8, 8).astype(np.int64)
+
+
+def _palette_colors(indices: np.ndarray, banks: np.ndarray, bpp: int, palette_memory: list,
+                    transparent: int) -> np.ndarray:
+    """
+    Looks up the color every pixel is shown with.
+    :param indices: Array of palette indices
+    :param banks: Array of the palette bank of every pixel (ignored at 8bpp)
+    :param bpp: The number of bits per pixel into a palette
+    :param palette_memory: The palette memory the unit is shown with (16 entries per bank)
+    :param transparent: The RGB15 value of the transparent color
+    :return: Array of RGB15 colors (-1 where the palette memory has no entry)
+    """
+    lookup = indices + banks * 16 if bpp == 4 else indices
+    palette = np.asarray(palette_memory, dtype=np.int64)
+
+    colors = np.full(lookup.shape, -1, dtype=np.int64)
+    in_palette = lookup < len(palette)
+    colors[in_palette] = palette[lookup[in_palette]]
+
+    # Palette index 0 is never drawn, whatever its color
+    colors[indices == 0] = transparent
+    return colors
+
+
+def decode_emitted_tiles(args: dict, prepared: PreparedConversion, palette_memory: list) -> np.ndarray:
+    """
+    Rebuilds a tiled unit from what it emits: its final tiles placed through its screen entries (tile index,
+    flips and palette bank, with the unit's place in VRAM) or its OBJs.
+    :param args: Conversion arguments of the unit (after the mode's overrides)
+    :param prepared: The PreparedConversion of the unit
+    :param palette_memory: The palette memory the unit is shown with (16 entries per bank)
+    :return: (height, width) array of the RGB15 color of every pixel (-1 where no tile or color can be read)
+    """
+    bpp = args["bpp"]
+    meta_w, meta_h = args["meta_width"], args["meta_height"]
+    width, height = prepared.image.width, prepared.image.height
+    round_width, round_height = padded_size(width, height, meta_w, meta_h)
+    tiles_x, tiles_y = round_width // 8, round_height // 8
+
+    tiles = _tile_pixels(hex_to_words(prepared.tile_data), bpp)
+    tile_mapping, objs = placed_tile_mapping(args, prepared)
+    tile_base = args.get("tile_base", 0)
+
+    grid = np.zeros((tiles_y, tiles_x, 8, 8), dtype=np.int64)
+    # OBJs get their bank from outside the tile data
+    grid_banks = np.full((tiles_y, tiles_x), obj_palette_bank(args), dtype=np.int64)
+    unreadable = np.zeros((tiles_y, tiles_x), dtype=bool)
+
+    if objs is not None:
+        # OBJ tile indices count 32 byte units, an 8bpp tile takes two
+        for obj in objs:
+            first = (obj.tile - tile_base) // (bpp // 4)
+            for row in range(obj.height):
+                for col in range(obj.width):
+                    y, x = obj.y // 8 + row, obj.x // 8 + col
+                    tile = first + row * obj.width + col
+                    if y >= tiles_y or x >= tiles_x:
+                        continue
+                    if 0 <= tile < len(tiles):
+                        grid[y, x] = tiles[tile]
+                    else:
+                        unreadable[y, x] = True
+    else:
+        # Where every tile of the stream goes in the image
+        slots = order_tiles(np.arange(tiles_y * tiles_x).reshape(tiles_y, tiles_x), meta_w, meta_h)
+        if tile_mapping is None:
+            entries = np.arange(len(slots), dtype=np.int64)
+            base = 0
+        else:
+            entries = np.asarray(tile_mapping, dtype=np.int64)[:len(slots)]
+            slots = slots[:len(entries)]
+            # An animation's mapping indexes its ROM tiles, it isn't moved
+            base = tile_base if prepared.deltas is None else 0
+
+        index = entries & 0x3FF
+        tile = index - base
+        empty = index == EMPTY_TILE if args.get("elide_empty") else np.zeros(len(entries), dtype=bool)
+        found = ~empty & (tile >= 0) & (tile < len(tiles))
+
+        pixels = np.zeros((len(entries), 8, 8), dtype=np.int64)
+        pixels[found] = tiles[tile[found]]
+        hflip = (entries >> 10) & 1 == 1
+        vflip = (entries >> 11) & 1 == 1
+        pixels[hflip] = pixels[hflip][:, :, ::-1]
+        pixels[vflip] = pixels[vflip][:, ::-1, :]
+
+        ys, xs = np.divmod(slots, tiles_x)
+        grid[ys, xs] = pixels
+        unreadable[ys, xs] = ~(found | empty)
+        # OBJs only have a bank in their mapping with palette banks, pooled ones use <unit>PalBank
+        if tile_mapping is not None and (args["layer"] == "bg" or args.get("palette_banks")):
+            grid_banks[ys, xs] = entries >> 12
+
+    indices = grid.transpose(0, 2, 1, 3).reshape(round_height, round_width)
+    banks = np.repeat(np.repeat(grid_banks, 8, axis=0), 8, axis=1)
+    colors = _palette_colors(indices, banks, bpp, palette_memory, args["transparent"])
+    colors[np.repeat(np.repeat(unreadable, 8, axis=0), 8, axis=1)] = -1
+    return colors[:height, :width]
+
+
+def decode_emitted_bitmap(args: dict, prepared: PreparedConversion) -> np.ndarray:
+    """
+    Rebuilds a bitmap unit from the bitmap data it emits.
+    :param args: Conversion arguments of the unit (after the mode's overrides)
+    :param prepared: The PreparedConversion of the unit
+    :return: (height, width) array of the RGB15 color of every pixel (-1 where the palette has no entry)
+    """
+    width, height = prepared.image.width, prepared.image.height
+    data = hex_to_words(prepared.tile_data).astype("<u4").view(np.uint8)
+    if args["bpp"] == 16:
+        return data.view("<u2")[:width * height].reshape(height, width).astype(np.int64)
+
+    row_width = bitmap_row_width(width, 8)
+    indices = data[:row_width * height].reshape(height, row_width)[:, :width].astype(np.int64)
+    palette = np.asarray(prepared.gba_palette, dtype=np.int64)
+    colors = np.full(indices.shape, -1, dtype=np.int64)
+    in_palette = indices < len(palette)
+    colors[in_palette] = palette[indices[in_palette]]
+    return colors
+
+
+def _source_checks(args: dict) -> dict:
+    """
+    Reads the source image and checks it against the unit's settings (before converting it).
+    :param args: Conversion arguments of the unit
+    :return: The source's RGB15 plane, size, color count, the palette capacity and the warnings
+    """
+    mode_args = _mode_args(args)
+
+    # Cheap checks first: the header gives the size, the histogram the colors
+    header = read_png_header(args["image_path"])
+    warnings = _header_warnings(mode_args, header)
+    source = source_rgb15(args)
+    histogram = np.bincount(source.ravel(), minlength=RGB15_COLORS)
+    histogram[args["transparent"]] = 0
+    source_colors = int(np.count_nonzero(histogram))
+
+    capacity = _palette_capacity(mode_args)
+    if capacity is not None and source_colors > capacity:
+        warnings.append(f"{source_colors} colors don't fit in a palette of {capacity}, some are approximated")
+
+    if capacity is not None and args["palette_path"]:
+        try:
+            palette = extract_palette_img(args["palette_path"], mode_args["bpp"], args["transparent"])
+        except ConversionError:
+            # The conversion reports why the palette image can't be used
+            palette = None
+        if palette is not None:
+            missing = np.setdiff1d(np.flatnonzero(histogram), palette).size
+            if missing:
+                warnings.append(f"{missing} colors of the image are not in the palette `{args['palette_path']}`")
+
+    return {
+        "source": source,
+        "width": header.width,
+        "height": header.height,
+        "source_colors": source_colors,
+        "capacity": capacity,
+        "warnings": warnings
+    }
+
+
+def _round_trip(name: str, args: dict, prepared: PreparedConversion, palette_memory: list,
+                checks: dict) -> DeepVerification:
+    """
+    Decodes what a prepared unit emits and diffs it against its source.
+    :param name: Name of the unit
+    :param args: Conversion arguments of the unit (`tile_base` is its place in VRAM when it is in a scene)
+    :param prepared: The PreparedConversion of the unit (None if the conversion failed)
+    :param palette_memory: The palette memory the unit is shown with (None for the unit's own palette)
+    :param checks: What _source_checks found
+    :return: The DeepVerification
+    """
+    width, height = checks["width"], checks["height"]
+    if prepared is None:
+        return DeepVerification(name, width, height, checks["source_colors"], checks["capacity"], width * height,
+                                tuple(checks["warnings"]), True)
+
+    args = _mode_args(args)
+    if args.get("mode") == "bitmap":
+        decoded = decode_emitted_bitmap(args, prepared)
+    else:
+        decoded = decode_emitted_tiles(args, prepared,
+                                       palette_memory if palette_memory is not None else prepared.gba_palette)
+
+    # Both sides compared in RGB15, the precision the GBA has
+    mismatched = int(np.count_nonzero(checks["source"] != decoded))
+
+    return DeepVerification(name, width, height, checks["source_colors"], checks["capacity"], mismatched,
+                            tuple(checks["warnings"]), False)
+
+
+def deep_verify_unit(name: str, args: dict, palette_memory: list = None) -> tuple[DeepVerification, str]:
+    """
+    Converts a unit in memory, decodes what it emits (tiles, tile mapping and palette) back into pixels and diffs
+    them against the RGB15 quantized source (safe to run in a worker process).
+    :param name: Name of the unit
+    :param args: Conversion arguments of the unit (with its pooled palette when it is pooled)
+    :param palette_memory: The palette memory the unit is shown with (None for the unit's own palette)
+    :return: The DeepVerification and everything the conversion printed
+    """
+    log = io.StringIO()
+    with redirect_stdout(log):
+        checks = _source_checks(args)
+        prepared = try_prepare_conversion(args)
+
+    return _round_trip(name, args, prepared, palette_memory, checks), log.getvalue()
+
+
+def deep_verify_scene(scene: VramScene, config: ConversionConfig, unit_args: dict,
+                      palette_memories: dict) -> list[tuple[DeepVerification, str]]:
+    """
+    Deep verifies the units of a scene with the tile indices they get from the scene's VRAM plan (safe to run in a
+    worker process, nothing is written).
+    :param scene: The VramScene
+    :param config: ConversionConfig of the scene
+    :param unit_args: Dictionary of unit name to its conversion arguments
+    :param palette_memories: Dictionary of unit name to the palette memory it is shown with (None for its own)
+    :return: The DeepVerification and the conversion's output of every unit
+    """
+    logs = {}
+    checks = {}
+    prepared_units = {}
+    for name, args in unit_args.items():
+        log = io.StringIO()
+        with redirect_stdout(log):
+            checks[name] = _source_checks(args)
+            prepared = try_prepare_conversion(args)
+        logs[name] = log
+        if prepared is not None:
+            prepared_units[name] = (args, prepared)
+
+    plan = plan_vram_scene(scene, config, prepared_units, write=False)
+
+    results = []
+    for name, args in unit_args.items():
+        prepared = prepared_units[name][1] if name in prepared_units else None
+        if plan.errors:
+            # Nothing of a scene that doesn't fit is emitted
+            checks[name]["warnings"].extend(f"Scene `{scene.name}`: {error}" for error in plan.errors)
+            prepared = None
+        elif prepared is not None:
+            args = dict(args, tile_base=plan.placements[name].tile_base)
+        results.append((_round_trip(name, args, prepared, palette_memories.get(name), checks[name]),
+                        logs[name].getvalue()))
+    return results
@@ -0,0 +1,17 @@
+class Pix2gbaError(Exception):
+    """
+    Error pix2gba reports to the user (a missing unit, an invalid config, ...), the command line prints its
+    message and exits with code 1.
+    """
+
+
+class InvalidOptionsError(Pix2gbaError, ValueError):
+    """
+    Conversion options that can't be used (or don't fit the image).
+    """
+
+
+class ConversionError(Pix2gbaError):
+    """
+    Image that can't be decoded or converted.
+    """
@@ -0,0 +1,75 @@
+import json
+import os
+from pathlib import Path
+from typing import Callable
+
+
+class FileCache:
+    """
+    Caches what was parsed from files by resolved path, reusing it while the file's mtime and size don't change.
+    The cache can be saved as JSON so the next command doesn't parse the files again.
+    """
+
+    def __init__(self, parse: Callable, to_json: Callable = None, from_json: Callable = None) -> None:
+        """
+        :param parse: Parses a file (gets its Path), the result is what gets cached
+        :param to_json: Converts a parsed value (never None) to something JSON can save (default: as is)
+        :param from_json: Converts a saved value back (default: as is)
+        """
+        self.parse = parse
+        self.to_json = to_json or (lambda value: value)
+        self.from_json = from_json or (lambda value: value)
+        self.entries: dict[str, dict] = {}
+        self.changed = False
+
+    def get(self, path):
+        """
+        Gets the parsed value of a file, parsing it only if it changed since it was last parsed.
+        :param path: Path to the file
+        :return: The parsed value (None if the file is missing or the parser returned None)
+        """
+        path = Path(path).resolve()
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        key = str(path)
+        cached = self.entries.get(key)
+        if cached is not None and cached["mtime_ns"] == stat.st_mtime_ns and cached["size"] == stat.st_size:
+            return self.from_json(cached["value"]) if cached["value"] is not None else None
+
+        value = self.parse(path)
+        self.entries[key] = {
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "value": self.to_json(value) if value is not None else None
+        }
+        self.changed = True
+        return value
+
+    def load(self, cache_path: Path) -> None:
+        """
+        Loads the values parsed by earlier runs.
+        :param cache_path: Path of the JSON cache
+        :return: None
+        """
+        try:
+            with open(cache_path, "r") as file:
+                self.entries.update(json.load(file))
+        except (OSError, ValueError):
+            # No cache yet (or a broken one), the files get parsed again
+            pass
+
+    def save(self, cache_path: Path) -> None:
+        """
+        Saves the parsed values for the next run (only if something new was parsed).
+        :param cache_path: Path of the JSON cache
+        :return: None
+        """
+        if not self.changed:
+            return
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(cache_path, "w") as file:
+            json.dump(self.entries, file)
+        self.changed = False
@@ -1,4 +1,5 @@
 import numpy as np
+from PIL import Image as PILImage
 
 def rgb24_to_rgb15(color: tuple[int, int, int]) -> int:
     """
@@ -14,6 +15,20 @@ def rgb24_to_rgb15(color: tuple[int, int, int]) -> int:
     return gba_val
 
 
+def rgb888_array_to_rgb15(pixels: np.ndarray) -> np.ndarray:
+    """
+    Vectorized rgb24_to_rgb15 over an array of pixels.
+    :param pixels: uint8 array with the RGB channels as the last axis (e.g. (height, width, 3))
+    :return: uint16 array of RGB15 colors with the channel axis removed
+    """
+    pixels = pixels.astype(np.uint16)
+    r = pixels[..., 0] >> 3
+    g = pixels[..., 1] >> 3
+    b = pixels[..., 2] >> 3
+
+    return (b << 10) | (g << 5) | r
+
+
 def rgb888_to_hex(color: tuple[int, int, int]) -> str:
     """
     :param color: tuple[int, int, int]
@@ -67,6 +82,18 @@ def rgb15_to_rgb888(color15: int) -> tuple[int, int, int]:
     return r8, g8, b8
 
 
+def rgb15_array_to_rgb888(colors: np.ndarray) -> np.ndarray:
+    """
+    Vectorized rgb15_to_rgb888 over an array of colors.
+    :param colors: Integer array of RGB15 colors
+    :return: uint8 array with a new last axis holding the RGB channels
+    """
+    colors = np.asarray(colors, dtype=np.uint32)
+    channels = np.stack([colors & 0x1F, (colors >> 5) & 0x1F, (colors >> 10) & 0x1F], axis=-1)
+
+    return (channels * 255 // 31).astype(np.uint8)
+
+
 def unpack_gba_color(c: int) -> np.ndarray:
     """
     :param c: int
@@ -76,3 +103,15 @@ def unpack_gba_color(c: int) -> np.ndarray:
     g = (c >> 5) & 0x1F
     b = (c >> 10) & 0x1F
     return np.array([r, g, b], dtype=np.int16)
+
+
+def open_rgb_image(source) -> PILImage.Image:
+    """
+    Opens an image in RGB format, images that are already loaded are converted in place of being re-read.
+    :param source: Path to an image file or a loaded PIL image
+    :return: The RGB PIL image
+    """
+    if isinstance(source, PILImage.Image):
+        return source if source.mode == "RGB" else source.convert("RGB")
+
+    return PILImage.open(source).convert("RGB")
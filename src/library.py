@@ -0,0 +1,233 @@
+import io
+from dataclasses import dataclass
+
+import numpy as np
+from PIL import Image as PILImage, UnidentifiedImageError
+
+from .bitmap import BITMAP_MODES
+from .config import ACCEPTED_UNIT_MODES
+from .converter import prepare_conversion
+from .errors import ConversionError, InvalidOptionsError
+from .multi_palette import MAX_PALETTE_BANKS
+from .palette import swap_transparent_color
+from .progress import progress_sink
+from .tile_creator import hex_to_words
+
+
+@dataclass(frozen=True)
+class ConvertOptions:
+    """
+    How an image is converted (the settings of a TOML unit that don't deal with files).
+
+    :param bpp: Bits per pixel of the tiles (4 or 8).
+    :param transparent: RGB15 color that is transparent (always palette index 0).
+    :param meta_width: Width of a metatile in tiles.
+    :param meta_height: Height of a metatile in tiles.
+    :param palette: RGB15 colors of the palette to use (None to generate it from the image).
+    :param compress: Whether to LZ77 compress the tiles.
+    :param dedupe: Whether to drop duplicate tiles (adds a tile mapping).
+    :param elide_empty: Whether to drop fully transparent tiles (adds a tile mapping).
+    :param palette_banks: Max number of 16 color palettes the tiles are split over (0 for a single palette).
+    :param mode: How the image is output (`tiles`, `sprite`, `bitmap` or `animation`).
+    :param bitmap_mode: Bitmap mode (3, 4 or 5) in `bitmap` mode.
+    :param frame_width: Width of one frame (pixels) in `animation` mode.
+    :param frame_height: Height of one frame (pixels) in `animation` mode.
+    """
+    bpp: int = 4
+    transparent: int = 0x5D53
+    meta_width: int = 1
+    meta_height: int = 1
+    palette: tuple = None
+    compress: bool = False
+    dedupe: bool = False
+    elide_empty: bool = False
+    palette_banks: int = 0
+    mode: str = "tiles"
+    bitmap_mode: int = 3
+    frame_width: int = 0
+    frame_height: int = 0
+
+
+@dataclass(frozen=True)
+class ConvertResult:
+    """
+    Everything a conversion made, as little endian arrays ready to be copied to the GBA (`.tobytes()`).
+
+    :param width: Width of the source image in pixels.
+    :param height: Height of the source image in pixels.
+    :param bpp: Bits per pixel of the tiles (16 for direct color bitmaps).
+    :param tiles: The packed tiles (or bitmap) as u32 words.
+    :param palette: The RGB15 palette (None for direct color bitmaps).
+    :param mapping: The screen entry of every tile (None if there is no tile mapping).
+    :param compressed: The LZ77 compressed tiles (None if not compressed).
+    :param objs: The SpriteObjs in `sprite` mode (None otherwise).
+    :param deltas: The DeltaRuns of every frame transition in `animation` mode (None otherwise).
+    :param log: What the conversion reported (the messages the command line prints).
+    """
+    width: int
+    height: int
+    bpp: int
+    tiles: np.ndarray
+    palette: np.ndarray
+    mapping: np.ndarray
+    compressed: bytes
+    objs: list
+    deltas: list
+    log: str
+
+    @property
+    def tile_count(self) -> int:
+        return len(self.tiles) // (2 * self.bpp)
+
+
+def _load_image(image) -> PILImage.Image:
+    """
+    :param image: A PIL image, a uint8 array ((height, width) gray, (height, width, 3) RGB or (height, width, 4)
+                  RGBA) or the bytes of an encoded image (PNG, ...)
+    :return: The loaded PIL image
+    """
+    if isinstance(image, PILImage.Image):
+        image.load()
+        return image
+
+    if isinstance(image, np.ndarray):
+        if image.dtype != np.uint8 or image.ndim not in (2, 3) or (image.ndim == 3 and image.shape[2] not in (3, 4)):
+            raise InvalidOptionsError(f"Image arrays must be uint8 (height, width), (height, width, 3) or "
+                                      f"(height, width, 4): got {image.dtype} {image.shape}")
+        return PILImage.fromarray(image)
+
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        try:
+            img = PILImage.open(io.BytesIO(bytes(image)))
+            img.load()
+        except (UnidentifiedImageError, OSError) as error:
+            raise ConversionError(f"Image data could not be decoded: {error}") from error
+        return img
+
+    raise TypeError(f"Image must be a PIL image, a NumPy array or bytes: got {type(image).__name__}")
+
+
+def _validate_options(options: ConvertOptions, img: PILImage.Image) -> None:
+    """
+    Rejects options that can't be converted (the checks `validate_unit` does on TOML units).
+    :param options: The conversion options
+    :param img: The loaded image
+    :return: None
+    """
+    if options.mode not in ACCEPTED_UNIT_MODES:
+        raise InvalidOptionsError(f"Mode is not accepted (acceptable are `{'`, `'.join(ACCEPTED_UNIT_MODES)}`): "
+                                  f"`{options.mode}`")
+
+    if options.mode == "bitmap":
+        if options.bitmap_mode not in BITMAP_MODES:
+            raise InvalidOptionsError(f"Bitmap mode must be 3, 4 or 5: `{options.bitmap_mode}`")
+        if options.dedupe or options.elide_empty or options.palette_banks:
+            raise InvalidOptionsError("Bitmap mode can't be used with dedupe, elide_empty or palette_banks")
+        bitmap_mode = BITMAP_MODES[options.bitmap_mode]
+        if img.width > bitmap_mode.width or img.height > bitmap_mode.height:
+            raise InvalidOptionsError(f"{img.width}x{img.height} image is bigger than the {bitmap_mode.width}x"
+                                      f"{bitmap_mode.height} frame of Mode {options.bitmap_mode}")
+    elif options.bpp not in (4, 8):
+        raise InvalidOptionsError(f"Bits per pixel must be 4 or 8: `{options.bpp}`")
+
+    if options.meta_width < 1 or options.meta_height < 1:
+        raise InvalidOptionsError(f"Meta tile width/height must be greater than or equal to 1: "
+                                  f"mw=`{options.meta_width}`, mh=`{options.meta_height}`")
+
+    if options.palette_banks:
+        if not 1 <= options.palette_banks <= MAX_PALETTE_BANKS:
+            raise InvalidOptionsError(f"Palette banks must be between 1 and {MAX_PALETTE_BANKS}: "
+                                      f"`{options.palette_banks}`")
+        if options.bpp != 4 or options.palette is not None:
+            raise InvalidOptionsError("Palette banks need 4bpp and a generated palette (`palette=None`)")
+
+    if options.mode == "sprite" and (options.dedupe or options.elide_empty or options.palette_banks):
+        raise InvalidOptionsError("Sprite mode can't be used with dedupe, elide_empty or palette_banks")
+
+    if options.mode == "animation":
+        if options.frame_width <= 0 or options.frame_height <= 0 or options.frame_width % 8 or options.frame_height % 8:
+            raise InvalidOptionsError(f"Frame width/height must be positive multiples of 8: "
+                                      f"fw=`{options.frame_width}`, fh=`{options.frame_height}`")
+        if options.elide_empty or options.palette_banks:
+            raise InvalidOptionsError("Animation mode can't be used with elide_empty or palette_banks")
+        if img.width % options.frame_width or img.height % options.frame_height:
+            raise InvalidOptionsError(f"{img.width}x{img.height} image is not made of whole "
+                                      f"{options.frame_width}x{options.frame_height} frames")
+
+
+def _options_palette(options: ConvertOptions) -> list:
+    """
+    :param options: The conversion options
+    :return: The palette of the options with the transparent color swapped to index 0 (None to generate it)
+    :raises InvalidOptionsError: If the palette doesn't fit 2^bpp entries once the transparent color is in it
+    """
+    if options.palette is None:
+        return None
+
+    palette_bpp = BITMAP_MODES[options.bitmap_mode].bpp if options.mode == "bitmap" else options.bpp
+    palette = swap_transparent_color([int(color) for color in options.palette], options.transparent)
+    if len(palette) > (1 << palette_bpp):
+        raise InvalidOptionsError(f"Palette has more entries than {palette_bpp}bpp allows with the transparent "
+                                  f"color at index 0 ({len(palette)} > {1 << palette_bpp})")
+    return palette
+
+
+def convert_image(image, options: ConvertOptions = ConvertOptions()) -> ConvertResult:
+    """
+    Converts an image in memory: nothing is read from or written to disk and nothing is printed (safe to call from
+    several threads at once).
+    :param image: A PIL image, a uint8 NumPy array or the bytes of an encoded image (PNG, ...)
+    :param options: How the image is converted
+    :return: The ConvertResult
+    :raises InvalidOptionsError: If the options can't be used (or don't fit the image)
+    :raises ConversionError: If the image can't be decoded or converted
+    """
+    img = _load_image(image)
+    _validate_options(options, img)
+
+    # A palette given in memory takes the same path as a pooled one
+    palette = _options_palette(options)
+
+    args = {
+        "image": img,
+        "image_path": None,
+        "image_name": "image",
+
+        "meta_width": options.meta_width,
+        "meta_height": options.meta_height,
+        "bpp": options.bpp,
+        "transparent": options.transparent,
+
+        "palette_path": None,
+        "pool_palette": palette,
+
+        "compress": options.compress,
+        "dedupe": options.dedupe,
+        "palette_banks": options.palette_banks,
+        "layer": "bg",
+        "variants": [],
+        "elide_empty": options.elide_empty,
+        "mode": options.mode,
+        "bitmap_mode": options.bitmap_mode,
+        "frame_width": options.frame_width,
+        "frame_height": options.frame_height
+    }
+
+    # The progress messages the command line prints are kept in the result
+    log = io.StringIO()
+    with progress_sink(lambda message: print(message, file=log)):
+        prepared = prepare_conversion(args)
+
+    bpp = BITMAP_MODES[options.bitmap_mode].bpp if options.mode == "bitmap" else options.bpp
+    return ConvertResult(
+        width=img.width,
+        height=img.height,
+        bpp=bpp,
+        tiles=hex_to_words(prepared.tile_data).astype("<u4"),
+        palette=np.asarray(prepared.gba_palette, dtype="<u2") if prepared.gba_palette is not None else None,
+        mapping=np.asarray(prepared.tile_mapping, dtype="<u2") if prepared.tile_mapping is not None else None,
+        compressed=bytes(prepared.compressed_bytes) if prepared.compressed_bytes is not None else None,
+        objs=prepared.objs,
+        deltas=prepared.deltas,
+        log=log.getvalue()
+    )
@@ -0,0 +1,173 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from .gba_utils import open_rgb_image, rgb888_array_to_rgb15
+from .palette import median_cut, nearest_colors, pack_rgb15_array, unpack_rgb15_array
+
+# Max number of 16 color palettes (banks) the GBA has per layer
+MAX_PALETTE_BANKS = 16
+
+# Colors per bank (index 0 of every bank is the transparent color)
+BANK_COLORS = 15
+
+
+@dataclass(frozen=True)
+class PaletteBanks:
+    """
+    Result of splitting a 4bpp image over several 16 color palettes.
+
+    :param palette: The banks' palettes one after another (16 RGB15 entries per bank).
+    :param indices: (height, width) plane of indices into each tile's own bank.
+    :param tile_banks: (tiles_y, tiles_x) bank of every 8x8 tile.
+    :param bank_colors: Number of colors (besides transparent) each bank uses.
+    :param lossy_tiles: Number of tiles whose colors didn't all fit in their bank.
+    """
+    palette: list
+    indices: np.ndarray
+    tile_banks: np.ndarray
+    bank_colors: list
+    lossy_tiles: int
+
+
+def _tile_color_sets(rgb15: np.ndarray, transparent: int) -> tuple[list, np.ndarray]:
+    """
+    Finds the set of colors each 8x8 tile uses (without the transparent color).
+    :param rgb15: (height, width) plane of RGB15 colors (multiples of 8)
+    :param transparent: The RGB15 value of the transparent color
+    :return: The color set of every tile (row major) and the (tiles, 64) array of every tile's pixels
+    """
+    height, width = rgb15.shape
+    tiles = rgb15.reshape(height // 8, 8, width // 8, 8).transpose(0, 2, 1, 3).reshape(-1, 64)
+
+    # Sorting each tile puts equal colors next to each other so the unique ones are where the value changes
+    sorted_tiles = np.sort(tiles, axis=1)
+    starts = np.ones_like(sorted_tiles, dtype=bool)
+    starts[:, 1:] = sorted_tiles[:, 1:] != sorted_tiles[:, :-1]
+
+    color_sets = []
+    for row, mask in zip(sorted_tiles, starts):
+        colors = row[mask]
+        color_sets.append(frozenset(int(c) for c in colors if c != transparent))
+
+    return color_sets, tiles
+
+
+def assign_banks(color_sets: list, max_banks: int) -> tuple[list, list[set]]:
+    """
+    Greedily packs the tiles' color sets into at most `max_banks` banks of 15 colors. Biggest sets are placed
+    first, each into the bank it grows the least while staying within 15 colors; sets that fit nowhere go to
+    the bank they grow the least, which then has to be quantized.
+    :param color_sets: Color set of every tile
+    :param max_banks: Max number of banks
+    :return: The bank of every tile and the colors of every bank
+    """
+    unique_sets = sorted(set(color_sets), key=lambda c: (-len(c), sorted(c)))
+    banks: list[set] = []
+    set_bank = {}
+
+    for colors in unique_sets:
+        best_bank, best_growth = -1, None
+        for b, bank in enumerate(banks):
+            growth = len(colors - bank)
+            if len(bank) + growth <= BANK_COLORS and (best_growth is None or growth < best_growth):
+                best_bank, best_growth = b, growth
+                if growth == 0:
+                    break
+
+        if best_bank < 0 and len(banks) < max_banks:
+            banks.append(set())
+            best_bank = len(banks) - 1
+        elif best_bank < 0:
+            # No bank has room, use the one it grows the least (the bank gets quantized back down later)
+            best_bank = min(range(len(banks)), key=lambda b: len(colors - banks[b]))
+
+        banks[best_bank] |= colors
+        set_bank[colors] = best_bank
+
+    return [set_bank[c] for c in color_sets], banks
+
+
+def reduce_bank(colors: list, counts: dict) -> list:
+    """
+    Quantizes a bank down to 15 colors (only needed when the tiles' colors didn't fit in the banks).
+    :param colors: The colors of the bank
+    :param counts: Number of pixels using each color
+    :return: At most 15 colors
+    """
+    if len(colors) <= BANK_COLORS:
+        return colors
+
+    color_array = np.array(colors)
+    weights = np.array([counts[c] for c in colors], dtype=np.float64)
+    centers = median_cut(unpack_rgb15_array(color_array), weights, BANK_COLORS)
+
+    reduced = []
+    for color in pack_rgb15_array(centers):
+        if int(color) not in reduced:
+            reduced.append(int(color))
+    return reduced
+
+
+def create_palette_banks(img, transparent: int, max_banks: int) -> PaletteBanks:
+    """
+    Splits an image over up to `max_banks` 16 color palettes, giving each 8x8 tile the bank that holds its colors.
+    :param img: Path to the source image or the loaded image
+    :param transparent: The RGB15 value of the transparent color
+    :param max_banks: Max number of palette banks (1 to 16)
+    :return: The PaletteBanks with the banks' palettes, the index plane and the bank of every tile
+    """
+    pixels = np.asarray(open_rgb_image(img), dtype=np.uint8)
+    height, width = pixels.shape[:2]
+
+    # Pad to whole tiles with the transparent color
+    round_height, round_width = -(-height // 8) * 8, -(-width // 8) * 8
+    rgb15 = np.full((round_height, round_width), transparent, dtype=np.uint16)
+    rgb15[:height, :width] = rgb888_array_to_rgb15(pixels)
+
+    color_sets, tiles = _tile_color_sets(rgb15, transparent)
+    tile_bank_list, banks = assign_banks(color_sets, max_banks)
+
+    # Build each bank's palette, most used colors first
+    histogram = np.bincount(rgb15.ravel(), minlength=1 << 15)
+    palette = []
+    bank_colors = []
+    for bank in banks:
+        colors = sorted(bank, key=lambda c: (-histogram[c], c))
+        colors = reduce_bank(colors, histogram)
+        entries = [transparent] + colors
+        palette.extend(entries + [0] * (16 - len(entries)))
+        bank_colors.append(len(colors))
+
+    # Convert every tile's colors to indices of its own bank (closest color if it didn't fit)
+    tile_bank_array = np.array(tile_bank_list, dtype=np.int64)
+    tile_indices = np.zeros_like(tiles, dtype=np.uint8)
+    lossy_tiles = 0
+    for b in range(len(banks)):
+        in_bank = tile_bank_array == b
+        if not in_bank.any():
+            continue
+        bank_palette = palette[b * 16:(b + 1) * 16]
+        used = bank_colors[b] + 1
+
+        bank_tiles = tiles[in_bank]
+        colors, inverse = np.unique(bank_tiles, return_inverse=True)
+        closest = nearest_colors(unpack_rgb15_array(colors), unpack_rgb15_array(bank_palette[:used]))
+
+        # The transparent color always maps to index 0
+        closest[colors == transparent] = 0
+        tile_indices[in_bank] = closest[inverse.reshape(bank_tiles.shape)]
+
+        exact = np.isin(colors, bank_palette[:used])
+        lossy_tiles += int((~exact[inverse.reshape(bank_tiles.shape)]).any(axis=1).sum())
+
+    tiles_y, tiles_x = round_height // 8, round_width // 8
+    indices = tile_indices.reshape(tiles_y, tiles_x, 8, 8).transpose(0, 2, 1, 3).reshape(round_height, round_width)
+
+    return PaletteBanks(
+        palette=palette,
+        indices=indices[:height, :width],
+        tile_banks=tile_bank_array.reshape(tiles_y, tiles_x),
+        bank_colors=bank_colors,
+        lossy_tiles=lossy_tiles,
+    )
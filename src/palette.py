@@ -1,9 +1,24 @@
 import os.path
 
 from PIL import Image as PILImage
-from .gba_utils import rgb24_to_rgb15, unpack_gba_color
+from .gba_utils import rgb24_to_rgb15, unpack_gba_color, open_rgb_image, rgb888_array_to_rgb15
 import numpy as np
 
+from .errors import ConversionError
+
+# Number of possible RGB15 colors
+RGB15_COLORS = 1 << 15
+
+# Lloyd iterations used to refine a median cut palette
+KMEANS_ITERATIONS = 3
+
+# Number of palettes whose nearest color lookup tables are kept (a long running process converts many images
+# with the same few palettes)
+NEAREST_LUT_PALETTES = 64
+
+# Palette (as a tuple) to the palette index of every RGB15 color matched against it so far (-1 if not matched yet)
+_nearest_luts: dict[tuple, np.ndarray] = {}
+
 def float_transparent_color(gba_palette:list, transparent:int) -> list:
     """
     Will take the transparent color and will force it to be the first color in palette.
@@ -24,26 +39,38 @@ def float_transparent_color(gba_palette:list, transparent:int) -> list:
 
     return gba_palette
 
-def extract_palette_img(filename:str, bpp:int, transparent:int) -> list:
+def swap_transparent_color(gba_palette:list, transparent:int) -> list:
     """
-    Extract a GBA palette directly from an image where each pixel represents
-    a palette entry.
+    Moves the transparent color to index 0 by swapping it with the first color, so every other entry keeps its
+    index (the transparent color is inserted in front if the palette doesn't have it).
+    :param gba_palette: The current palette of the input image.
+    :param transparent: The RGB15 value of the transparent color.
+    :return: The palette with the transparent color at index 0
+    """
+    if transparent in gba_palette:
+        index = gba_palette.index(transparent)
+        gba_palette[0], gba_palette[index] = gba_palette[index], gba_palette[0]
+    else:
+        gba_palette.insert(0, transparent)
 
-    :param transparent: The RGB15 value of the transparent color
+    return gba_palette
+
+def read_palette_img(filename:str, bpp:int) -> list:
+    """
+    Reads the colors of a palette image (each pixel is one entry) in order, without moving the transparent color.
     :param filename: Path to the palette image file.
     :param bpp: Bits per pixel; palette size is 2^bpp.
     :return: List of GBA RGB15 palette entries.
+    :raises ConversionError: If the image is missing or too big
     """
     if not os.path.exists(filename):
-        print("ERROR: Path to palette image file doesn't exist")
-        return None
+        raise ConversionError(f"Path to palette image file doesn't exist: `{filename}`")
 
     img = PILImage.open(filename).convert("RGB")
     width, height = img.size
 
     if (width * height) > (1 << bpp):
-        print(f"ERROR: Too many pixels for bpp (curr: {width * height}; max: {(1 << bpp)}) ")
-        return None
+        raise ConversionError(f"Too many pixels for bpp (curr: {width * height}; max: {(1 << bpp)}): `{filename}`")
 
     gba_palette = []
     for j in range(height):
@@ -53,35 +80,283 @@ def extract_palette_img(filename:str, bpp:int, transparent:int) -> list:
                 rgb24_to_rgb15(pxl)
             )
 
+    return gba_palette
+
+def extract_palette_img(filename:str, bpp:int, transparent:int) -> list:
+    """
+    Extract a GBA palette directly from an image where each pixel represents
+    a palette entry.
+
+    :param transparent: The RGB15 value of the transparent color
+    :param filename: Path to the palette image file.
+    :param bpp: Bits per pixel; palette size is 2^bpp.
+    :return: List of GBA RGB15 palette entries.
+    :raises ConversionError: If the image is missing or too big
+    """
+    gba_palette = read_palette_img(filename, bpp)
+
     # Force magenta as palette index 0 (transparency key)
     float_transparent_color(gba_palette, transparent)
 
     return gba_palette
 
+def extract_variant_palette(filename:str, bpp:int, transparent:int, base_path:str, base_size:int) -> list:
+    """
+    Extracts a palette variant (e.g. a color swap) whose entries map one to one onto the base palette's indices.
+    With a base palette image the variant has that image's layout and gets the same transparent reordering,
+    otherwise it has the layout of the generated palette (as exported with `generate_palette`).
+    :param filename: Path to the variant palette image file.
+    :param bpp: Bits per pixel; palette size is 2^bpp.
+    :param transparent: The RGB15 value of the transparent color
+    :param base_path: Path to the base palette image (None if the base palette is generated)
+    :param base_size: Number of entries of the base palette
+    :return: List of GBA RGB15 palette entries in the base palette's order.
+    :raises ConversionError: If the variant doesn't fit the base palette
+    """
+    variant = read_palette_img(filename, bpp)
+
+    if base_path is None:
+        if len(variant) < base_size:
+            raise ConversionError(f"Palette variant `{filename}` has {len(variant)} colors, the palette has "
+                                  f"{base_size}")
+        return [transparent] + variant[1:base_size]
+
+    base = read_palette_img(base_path, bpp)
+    if len(variant) != len(base):
+        raise ConversionError(f"Palette variant `{filename}` has {len(variant)} colors, `{base_path}` has "
+                              f"{len(base)}")
+
+    # Move the entries exactly like the base palette's transparent color was moved (-1 for an inserted one)
+    transparent_pos = base.index(transparent) if transparent in base else -1
+    positions = float_transparent_color(list(range(len(base))), transparent_pos)
+
+    return [transparent if p in (-1, transparent_pos) else variant[p] for p in positions]
+
+
+def indexed_img_colors(img, transparent:int) -> list:
+    """
+    Reads the palette (PLTE) of an indexed image as RGB15 colors. Entries marked as fully transparent by the
+    image (tRNS) are replaced by the transparent color.
+    :param img: The loaded indexed (mode "P") image
+    :param transparent: The RGB15 value of the transparent color
+    :return: List of RGB15 colors, one per palette index of the image
+    """
+    plte = img.getpalette("RGB") or []
+    colors = [rgb24_to_rgb15(tuple(plte[i:i + 3])) for i in range(0, len(plte), 3)]
+
+    img_transparency = img.info.get("transparency", None)
+    if isinstance(img_transparency, int):
+        transparent_indices = [img_transparency]
+    elif isinstance(img_transparency, bytes):
+        transparent_indices = [i for i, alpha in enumerate(img_transparency) if alpha == 0]
+    else:
+        transparent_indices = []
+
+    for i in transparent_indices:
+        if i < len(colors):
+            colors[i] = transparent
+
+    return colors
+
+
+def remap_indexed_img(img, gba_palette:list, transparent:int, used:np.ndarray = None) -> np.ndarray:
+    """
+    Creates the table that converts the indices of an indexed image into indices of the GBA palette. Only exact
+    matches are accepted, so no color matching is needed.
+    :param img: The loaded indexed (mode "P") image
+    :param gba_palette: List of GBA RGB15 palette entries
+    :param transparent: The RGB15 value of the transparent color
+    :param used: The image indices the pixels use (None to count them in the image)
+    :return: uint8 array of GBA palette index for every image index (None if an entry isn't in the palette)
+    """
+    colors = indexed_img_colors(img, transparent)
+
+    # Only the entries the pixels actually use have to be in the palette
+    if used is None:
+        used = np.flatnonzero(np.bincount(np.asarray(img).ravel(), minlength=256))
+
+    remap = np.zeros(256, dtype=np.uint8)
+    for i in used:
+        if i >= len(colors) or colors[i] not in gba_palette:
+            return None
+        remap[i] = gba_palette.index(colors[i])
+
+    return remap
+
+
+def palette_from_indexed_img(img, bpp:int, transparent:int, used:np.ndarray = None) -> tuple[list, np.ndarray]:
+    """
+    Takes the GBA palette straight from the palette of an indexed image, with the transparent color swapped to
+    index 0 so the other entries keep the image's layout.
+    :param img: The loaded indexed (mode "P") image
+    :param bpp: Bits per pixel; palette size is 2^bpp.
+    :param transparent: The RGB15 value of the transparent color
+    :param used: The image indices the pixels use (None to count them in the image)
+    :return: The GBA palette and the table converting image indices to palette indices
+             ((None, None) if the image's palette doesn't fit in 2^bpp entries)
+    """
+    gba_palette = swap_transparent_color(indexed_img_colors(img, transparent), transparent)
+    if len(gba_palette) > (1 << bpp):
+        return None, None
+
+    return gba_palette, remap_indexed_img(img, gba_palette, transparent, used)
+
+
+def rgb15_histogram(img) -> np.ndarray:
+    """
+    Counts how many pixels of the image use each RGB15 color.
+    :param img: Path to the image file or the loaded image
+    :return: Array of 32768 pixel counts indexed by RGB15 color
+    """
+    pixels = np.asarray(open_rgb_image(img), dtype=np.uint8)
+    return np.bincount(rgb888_array_to_rgb15(pixels).ravel(), minlength=RGB15_COLORS)
+
+
+def unpack_rgb15_array(colors: np.ndarray) -> np.ndarray:
+    """
+    Vectorized unpack_gba_color.
+    :param colors: Array of RGB15 colors
+    :return: (n, 3) float array of the 5 bit r, g, b channels
+    """
+    colors = np.asarray(colors, dtype=np.int32)
+    return np.stack([colors & 0x1F, (colors >> 5) & 0x1F, (colors >> 10) & 0x1F], axis=-1).astype(np.float64)
+
+
+def pack_rgb15_array(channels: np.ndarray) -> np.ndarray:
+    """
+    Packs (n, 3) 5 bit channels back into RGB15 colors (rounding to the nearest value).
+    :param channels: (n, 3) array of r, g, b channels in [0, 31]
+    :return: Array of RGB15 colors
+    """
+    channels = np.clip(np.rint(channels), 0, 31).astype(np.int32)
+    return (channels[:, 2] << 10) | (channels[:, 1] << 5) | channels[:, 0]
+
+
+def nearest_colors(channels: np.ndarray, palette_channels: np.ndarray) -> np.ndarray:
+    """
+    Finds the closest palette color (Euclidean distance) of every color, keeping the first on ties.
+    :param channels: (n, 3) array of the colors' 5 bit channels
+    :param palette_channels: (k, 3) array of the palette's 5 bit channels
+    :return: Index of the closest palette color for every color
+    """
+    # |a - b|^2 = |a|^2 - 2ab + |b|^2 (|a|^2 is the same for every palette color so it is skipped)
+    distances = (palette_channels ** 2).sum(axis=1)[None, :] - 2 * (channels @ palette_channels.T)
+    return np.argmin(distances, axis=1)
+
+
+def median_cut(channels: np.ndarray, counts: np.ndarray, max_colors: int) -> np.ndarray:
+    """
+    Splits the weighted colors into at most `max_colors` boxes by repeatedly cutting the box with the
+    most weighted spread at the weighted median of its longest axis.
+    :param channels: (n, 3) array of the colors' 5 bit channels
+    :param counts: Number of pixels using each color
+    :param max_colors: Number of boxes (palette entries) wanted
+    :return: (k, 3) array of the weighted mean color of each box
+    """
+    def split_score(members: np.ndarray) -> tuple[float, int]:
+        # Pixel weighted range of the box's longest axis (0 for single color boxes)
+        if len(members) < 2:
+            return 0.0, 0
+        box_channels = channels[members]
+        ranges = box_channels.max(axis=0) - box_channels.min(axis=0)
+        axis = int(np.argmax(ranges))
+        return float(ranges[axis] * counts[members].sum()), axis
+
+    boxes = [np.arange(len(channels))]
+    scores = [split_score(boxes[0])]
+
+    while len(boxes) < max_colors:
+        # Split the box with the biggest score next
+        best_box = max(range(len(boxes)), key=lambda i: scores[i][0])
+        if scores[best_box][0] <= 0:
+            # Every box is a single color, nothing left to split
+            break
+
+        members = boxes.pop(best_box)
+        axis = scores.pop(best_box)[1]
+
+        order = members[np.argsort(channels[members, axis], kind="stable")]
+        cumulative = np.cumsum(counts[order])
+        cut = int(np.searchsorted(cumulative, cumulative[-1] / 2))
+        cut = min(max(cut, 1), len(order) - 1)
+
+        for half in (order[:cut], order[cut:]):
+            boxes.append(half)
+            scores.append(split_score(half))
+
+    weights = [counts[members] for members in boxes]
+    return np.array([
+        (channels[members] * w[:, None]).sum(axis=0) / w.sum() for members, w in zip(boxes, weights)
+    ])
+
+
+def _kmeans_refine(channels: np.ndarray, counts: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    """
+    Runs a few weighted Lloyd (k-means) iterations to move the palette closer to the image's colors.
+    :param channels: (n, 3) array of the colors' 5 bit channels
+    :param counts: Number of pixels using each color
+    :param centers: (k, 3) starting palette
+    :return: (k, 3) refined palette
+    """
+    for _ in range(KMEANS_ITERATIONS):
+        nearest = nearest_colors(channels, centers)
+
+        weight = np.bincount(nearest, weights=counts, minlength=len(centers))
+        for c in range(3):
+            sums = np.bincount(nearest, weights=counts * channels[:, c], minlength=len(centers))
+            # Leave centers that lost all their colors where they are
+            centers[:, c] = np.where(weight > 0, sums / np.maximum(weight, 1), centers[:, c])
+
+    return centers
+
 
 def palette_from_img(filename:str, bpp:int, transparent:int) -> list:
     """
-    Generate a GBA palette from an image by selecting the most frequently
-    used colors and enforcing GBA palette constraints.
+    Generate a GBA palette from an image. The image is histogrammed in RGB15 space; if every color fits they
+    are all used (most frequent first), otherwise the colors are quantized with a median cut refined by k-means.
 
-    :param filename: Path to the source image file.
+    :param filename: Path to the source image file (or the already loaded image).
     :param bpp: Bits per pixel; palette size is 2^bpp.
     :param transparent: The RGB15 value of the transparent color
     :return: List of GBA RGB15 palette entries.
     """
-    img = PILImage.open(filename).convert("RGB")
+    return palette_from_histogram(rgb15_histogram(filename), bpp, transparent)
 
-    colors = img.getcolors()
-    colors.sort(key=lambda c: c[0], reverse=True)
 
-    top_col = [color for count, color in colors[:2**bpp]]
-    gba_palette = [rgb24_to_rgb15(color) for color in top_col]
-
-    gba_palette = list(set(gba_palette))
+def palette_from_histogram(histogram: np.ndarray, bpp:int, transparent:int) -> list:
+    """
+    Generate a GBA palette from the RGB15 histogram of an image (see palette_from_img).
 
-    float_transparent_color(gba_palette, transparent)
+    :param histogram: Array of 32768 pixel counts indexed by RGB15 color
+    :param bpp: Bits per pixel; palette size is 2^bpp.
+    :param transparent: The RGB15 value of the transparent color
+    :return: List of GBA RGB15 palette entries.
+    """
+    histogram = histogram.copy()
+
+    # The transparent color always takes index 0
+    histogram[transparent] = 0
+    max_colors = (1 << bpp) - 1
+
+    colors = np.flatnonzero(histogram)
+    counts = histogram[colors].astype(np.float64)
+
+    if len(colors) <= max_colors:
+        # Most used first (ties broken by color value so the order is stable)
+        order = np.lexsort((colors, -counts))
+        gba_palette = [int(c) for c in colors[order]]
+    else:
+        channels = unpack_rgb15_array(colors)
+        centers = median_cut(channels, counts, max_colors)
+        centers = _kmeans_refine(channels, counts, centers)
+
+        # Rounding can make two entries (or an entry and the transparent color) the same
+        gba_palette = []
+        for color in pack_rgb15_array(centers):
+            if int(color) != transparent and int(color) not in gba_palette:
+                gba_palette.append(int(color))
 
-    gba_palette = gba_palette[:2**bpp]
+    gba_palette.insert(0, transparent)
 
     return gba_palette
 
@@ -110,19 +385,33 @@ def create_conversion_table(input_img, gba_palette):
     Create a lookup table mapping image colors to palette indices based
     on closest GBA color matching.
 
-    :param input_img: Path to the input image file.
+    :param input_img: Path to the input image file (or the already loaded image).
     :param gba_palette: List of GBA RGB15 palette entries.
     :return: Dictionary mapping RGB15 colors to palette indices.
     """
-    img = PILImage.open(input_img).convert("RGB")
-    img_palette = img.getcolors()
-
-    img24_to_gba15 = {}
+    return conversion_table_from_colors(np.flatnonzero(rgb15_histogram(input_img)), gba_palette)
 
-    for junk, color in img_palette:
-        gba_col = rgb24_to_rgb15(color)
 
-        closest_idx = closest_gba_color(gba_col, gba_palette)
-        img24_to_gba15[gba_col] = closest_idx
-
-    return img24_to_gba15
+def conversion_table_from_colors(img_colors: np.ndarray, gba_palette) -> dict:
+    """
+    Creates the conversion table of the RGB15 colors an image uses (see create_conversion_table).
+    :param img_colors: Array of the RGB15 colors used by the image
+    :param gba_palette: The generated gba palette
+    :return: Dictionary of RGB15 colors to palette indices
+    """
+    # Only colors never matched against this palette before are matched
+    key = tuple(int(color) for color in gba_palette)
+    lut = _nearest_luts.pop(key, None)
+    if lut is None:
+        lut = np.full(RGB15_COLORS, -1, dtype=np.int16)
+    new_colors = img_colors[lut[img_colors] < 0]
+    if len(new_colors):
+        lut[new_colors] = nearest_colors(unpack_rgb15_array(new_colors), unpack_rgb15_array(gba_palette))
+
+    # Most recently used last, the least recently used palette is dropped first
+    _nearest_luts[key] = lut
+    if len(_nearest_luts) > NEAREST_LUT_PALETTES:
+        del _nearest_luts[next(iter(_nearest_luts))]
+
+    closest = lut[img_colors]
+    return {int(color): int(idx) for color, idx in zip(img_colors, closest)}
@@ -0,0 +1,203 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+
+import numpy as np
+
+from .multi_palette import MAX_PALETTE_BANKS, assign_banks, reduce_bank
+from .palette import palette_from_img, rgb15_histogram, nearest_colors, unpack_rgb15_array
+from .gba_utils import open_rgb_image
+
+# Layers with their own 16 banks of palette memory on the GBA
+POOL_LAYERS = [
+    "bg",
+    "obj"
+]
+
+
+@dataclass(frozen=True)
+class PoolAssignment:
+    """
+    The shared palette bank a unit was given by the palette pool.
+
+    :param layer: Layer of the bank (`bg` or `obj`).
+    :param bank: Index of the bank in the layer's palette memory.
+    :param palette: The 16 RGB15 entries of the bank.
+    :param conversion_table: Dictionary of RGB15 colors to bank indices (shared by every unit in the bank).
+    """
+    layer: str
+    bank: int
+    palette: list
+    conversion_table: dict
+
+
+@dataclass(frozen=False)
+class PalettePool:
+    """
+    Palette banks shared by the units of one TOML.
+
+    :param name: Name of the pool (used for the shared palette files).
+    :param banks: Palettes (16 entries each) of every bank per layer.
+    :param assignments: Dictionary of unit name to its PoolAssignment.
+    :param lossy_units: Names of units whose colors didn't all fit in their bank.
+    """
+    name: str
+    banks: dict = field(default_factory=dict)
+    assignments: dict = field(default_factory=dict)
+    lossy_units: list = field(default_factory=list)
+
+    def bank_count(self, layer: str) -> int:
+        return len(self.banks.get(layer, []))
+
+    def palette_bytes(self) -> int:
+        return sum(len(banks) * 16 * 2 for banks in self.banks.values())
+
+    def layer_palette(self, layer: str) -> list:
+        """
+        :param layer: The layer (`bg` or `obj`)
+        :return: Every bank of the layer one after another, as it is loaded in palette memory
+        """
+        return [color for bank in self.banks.get(layer, []) for color in bank]
+
+
+def plan_palette_pool(name: str, unit_args: list[dict]) -> PalettePool:
+    """
+    Merges the palettes of units into at most 16 shared banks per layer and creates the conversion table of
+    every shared bank (once, over the colors of all units using it).
+    :param name: Name of the pool
+    :param unit_args: Conversion arguments of every unit in the pool (4bpp, auto-generated palettes)
+    :return: The PalettePool with the bank of every unit
+    """
+    pool = PalettePool(name=name)
+
+    for layer in POOL_LAYERS:
+        layer_args = [args for args in unit_args if args["layer"] == layer]
+        if not layer_args:
+            continue
+
+        # 1. Each unit's own (at most 15 color) palette and the colors its image uses
+        color_sets = []
+        histograms = []
+        for args in layer_args:
+            img = open_rgb_image(args["image_path"])
+            palette = palette_from_img(img, 4, args["transparent"])
+            color_sets.append(frozenset(palette[1:]))
+            histograms.append(rgb15_histogram(img))
+
+        # 2. Merge compatible palettes into banks
+        unit_banks, banks = assign_banks(color_sets, MAX_PALETTE_BANKS)
+
+        # 3. Create every bank's palette (most used colors first) and its conversion table
+        pool.banks[layer] = []
+        for b, bank in enumerate(banks):
+            members = [i for i, unit_bank in enumerate(unit_banks) if unit_bank == b]
+            histogram = sum(histograms[i] for i in members)
+            transparent = layer_args[members[0]]["transparent"]
+
+            colors = sorted(bank, key=lambda c: (-histogram[c], c))
+            colors = reduce_bank(colors, histogram)
+            palette = [transparent] + colors
+            conversion_table = _bank_conversion_table(histogram, palette)
+            pool.banks[layer].append(palette + [0] * (16 - len(palette)))
+
+            for i in members:
+                unit_name = layer_args[i]["image_name"]
+                pool.assignments[unit_name] = PoolAssignment(
+                    layer=layer,
+                    bank=b,
+                    palette=pool.banks[layer][b],
+                    conversion_table=conversion_table
+                )
+                if not color_sets[i] <= set(colors):
+                    pool.lossy_units.append(unit_name)
+
+    return pool
+
+
+def _bank_conversion_table(histogram: np.ndarray, palette: list) -> dict:
+    """
+    Creates the conversion table of a shared bank for every color its units use.
+    :param histogram: Pixel count of every RGB15 color over the bank's units
+    :param palette: The used entries of the bank
+    :return: Dictionary of RGB15 colors to bank indices
+    """
+    colors = np.flatnonzero(histogram)
+    closest = nearest_colors(unpack_rgb15_array(colors), unpack_rgb15_array(palette))
+    return {int(color): int(idx) for color, idx in zip(colors, closest)}
+
+
+def pool_unit_args(args: dict, pool: PalettePool) -> dict:
+    """
+    Points a unit's conversion arguments at its shared bank (the unit no longer emits its own palette).
+    :param args: Conversion arguments of the unit
+    :param pool: The PalettePool of the unit's TOML
+    :return: The updated arguments
+    """
+    assignment = pool.assignments.get(args["image_name"])
+    if assignment is None:
+        return args
+
+    args["pool_name"] = pool.name
+    args["pool_bank"] = assignment.bank
+    args["pool_palette"] = assignment.palette
+    args["pool_conversion_table"] = assignment.conversion_table
+    args["palette_included"] = 0
+    return args
+
+
+def write_palette_pool(pool: PalettePool, destination, output_type: str) -> None:
+    """
+    Creates the shared palette files (.h and/or .c) of a pool.
+    :param pool: The PalettePool to output
+    :param destination: The output directory
+    :param output_type: Which files to create (`both`, `c` or `h`)
+    :return: None
+    """
+    name = pool.name
+
+    header_str = "// Shared palette banks of " + name + "\n"
+    header_str += "#pragma once\n\n"
+    header_str += ("//======================================================================\n" +
+                   "//	" + name + ", " + str(len(pool.assignments)) + " units\n" +
+                   "//\t+ BG Banks  : " + str(pool.bank_count("bg")) + "\n" +
+                   "//\t+ OBJ Banks : " + str(pool.bank_count("obj")) + "\n" +
+                   "//\t" + str(datetime.now()) + "\n" +
+                   "//======================================================================\n")
+
+    c_str = ""
+    for layer in POOL_LAYERS:
+        if not pool.bank_count(layer):
+            continue
+        array_name = name + layer.capitalize() + "Pal"
+        palette = [color for bank in pool.banks[layer] for color in bank]
+
+        header_str += ("\n/**\n" +
+                       f" * @brief The number of {layer.upper()} palette banks in {array_name}. \n" +
+                       " * \n" +
+                       " */\n")
+        header_str += "#define " + array_name + "Banks " + str(pool.bank_count(layer)) + "\n\n"
+        header_str += ("/**\n" +
+                       f" * @brief The number of bytes {array_name} occupies. \n" +
+                       " * \n" +
+                       " */\n")
+        header_str += "#define " + array_name + "Len " + str(len(palette) * 2) + "\n\n"
+        header_str += ("/**\n" +
+                       f" * @brief The rgb5 (short) {layer.upper()} palette banks shared by the units of {name}. \n" +
+                       " */\n")
+        header_str += "extern const unsigned short " + array_name + "[" + str(len(palette)) + "];\n"
+
+        c_str += (f"const unsigned short {array_name}[{len(palette)}] "
+                  "__attribute__((aligned(2))) __attribute__((visibility(\"hidden\")))= \n{\n")
+        for i in range(0, len(palette), 8):
+            line = (f"0x{n:04x}" for n in palette[i:i + 8])
+            c_str += "\t" + (", ".join(line)) + ",\n"
+        c_str = c_str[0:c_str.rfind(',')]
+        c_str += "\n};\n\n"
+
+    base_name = f"{destination}/" if destination is not None else ""
+    base_name += name
+    if output_type == "both" or output_type == "h":
+        with open(base_name + ".h", "w") as file:
+            file.write(header_str)
+    if output_type == "both" or output_type == "c":
+        with open(base_name + ".c", "w") as file:
+            file.write(c_str)
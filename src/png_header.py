@@ -0,0 +1,95 @@
+import struct
+import zlib
+from dataclasses import dataclass, asdict
+from pathlib import Path
+
+from .file_cache import FileCache
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+@dataclass(frozen=True)
+class PngHeader:
+    """
+    What the IHDR and PLTE chunks of a PNG say about it (no pixels are decoded).
+
+    :param width: Width of the image in pixels.
+    :param height: Height of the image in pixels.
+    :param bit_depth: Bits per sample (or per palette index).
+    :param color_type: PNG color type (0 gray, 2 RGB, 3 indexed, 4 gray + alpha, 6 RGBA).
+    :param palette_size: Number of PLTE entries (0 if the image has no palette).
+    """
+    width: int
+    height: int
+    bit_depth: int
+    color_type: int
+    palette_size: int
+
+
+def _parse_png_header(path: Path) -> PngHeader:
+    """
+    Reads the chunks of a PNG up to the first IDAT.
+    :param path: Path to the PNG
+    :return: The PngHeader (None if the file isn't a valid PNG)
+    """
+    with open(path, "rb") as file:
+        if file.read(8) != PNG_SIGNATURE:
+            return None
+
+        header = None
+        palette_size = 0
+        while True:
+            chunk_header = file.read(8)
+            if len(chunk_header) < 8:
+                return None
+            length, chunk_type = struct.unpack(">I4s", chunk_header)
+            data = file.read(length)
+            crc = file.read(4)
+            if len(data) < length or len(crc) < 4 or zlib.crc32(chunk_type + data) != struct.unpack(">I", crc)[0]:
+                return None
+
+            if chunk_type == b"IHDR":
+                if length != 13:
+                    return None
+                header = struct.unpack(">IIBB", data[:10])
+            elif chunk_type == b"PLTE":
+                palette_size = length // 3
+            elif chunk_type in (b"IDAT", b"IEND"):
+                break
+
+    # IHDR has to be the first chunk and the image can't be empty
+    if header is None or header[0] == 0 or header[1] == 0:
+        return None
+    width, height, bit_depth, color_type = header
+    return PngHeader(width, height, bit_depth, color_type, palette_size)
+
+
+# Parsed headers by resolved path, with the mtime and size of the file they were read from
+_header_cache = FileCache(_parse_png_header, to_json=asdict, from_json=lambda header: PngHeader(**header))
+
+
+def read_png_header(path) -> PngHeader:
+    """
+    Gets the header of a PNG, reading the file only if it changed since it was last parsed.
+    :param path: Path to the PNG
+    :return: The PngHeader (None if the file is missing or isn't a valid PNG)
+    """
+    return _header_cache.get(path)
+
+
+def load_header_cache(cache_path: Path) -> None:
+    """
+    Loads the headers parsed by earlier runs.
+    :param cache_path: Path of the JSON cache
+    :return: None
+    """
+    _header_cache.load(cache_path)
+
+
+def save_header_cache(cache_path: Path) -> None:
+    """
+    Saves the parsed headers for the next run (only if new headers were parsed).
+    :param cache_path: Path of the JSON cache
+    :return: None
+    """
+    _header_cache.save(cache_path)
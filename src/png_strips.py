@@ -0,0 +1,149 @@
+import io
+import struct
+import zlib
+
+import numpy as np
+from PIL import Image as PILImage
+
+from .errors import ConversionError
+from .png_header import PNG_SIGNATURE, read_png_header
+
+# Samples per pixel of every PNG color type (0 gray, 2 RGB, 3 indexed, 4 gray + alpha, 6 RGBA)
+_COLOR_TYPE_SAMPLES = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+# 8 bit color type whose filters step over the same number of bytes, by bytes per pixel (its samples are decoded
+# unchanged, so its pixels are the unfiltered bytes)
+_RAW_COLOR_TYPES = {1: 0, 2: 4, 3: 2, 4: 6}
+
+# Bytes of IDAT data read from the file at a time
+_READ_SIZE = 1 << 16
+
+
+def _filter_step(bit_depth: int, color_type: int) -> int:
+    """
+    :param bit_depth: Bits per sample of the PNG
+    :param color_type: PNG color type
+    :return: Bytes per pixel the PNG filters step over (at least 1)
+    """
+    return max(1, _COLOR_TYPE_SAMPLES.get(color_type, 0) * bit_depth // 8)
+
+
+def can_read_png_strips(img) -> bool:
+    """
+    :param img: The opened source image (not loaded yet)
+    :return: If the image can be decoded a strip at a time: a PNG that isn't interlaced, with at most 4 bytes per
+             pixel (everything else is decoded whole)
+    """
+    if img.format != "PNG" or len(img.tile) != 1 or img.tile[0][1] != (0, 0) + img.size or img.info.get("interlace"):
+        return False
+
+    header = read_png_header(img.filename)
+    return header is not None and _filter_step(header.bit_depth, header.color_type) in _RAW_COLOR_TYPES
+
+
+def _png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    """
+    :param chunk_type: The 4 letter type of the chunk
+    :param data: The data of the chunk
+    :return: The chunk with its length and CRC
+    """
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+
+def _unfilter_rows(filtered: bytes, previous: bytes, step: int, rows: int) -> np.ndarray:
+    """
+    Unfilters PNG scanlines with PIL's decoder: they are wrapped in a PNG of 8 bit pixels with the same filter step,
+    after the unfiltered row above them (filter type None), so every filter sees the row it references.
+    :param filtered: The scanlines, each with its filter type byte
+    :param previous: The unfiltered row above them (zeros for the first row of the image)
+    :param step: Bytes per pixel the filters step over
+    :param rows: Number of scanlines
+    :return: (rows, row bytes) uint8 array of the unfiltered rows
+    """
+    row_bytes = len(previous)
+    header = struct.pack(">IIBBBBB", row_bytes // step, rows + 1, 8, _RAW_COLOR_TYPES[step], 0, 0, 0)
+    png = (PNG_SIGNATURE + _png_chunk(b"IHDR", header) +
+           _png_chunk(b"IDAT", zlib.compress(b"\0" + previous + filtered, 0)) + _png_chunk(b"IEND", b""))
+    with PILImage.open(io.BytesIO(png)) as raw:
+        return np.asarray(raw).reshape(rows + 1, row_bytes)[1:]
+
+
+def _idat_data(file):
+    """
+    :param file: The PNG file, positioned after its signature
+    :return: Generator of the compressed image data of the IDAT chunks, a piece at a time
+    """
+    while True:
+        chunk_header = file.read(8)
+        if len(chunk_header) < 8:
+            return
+        length, chunk_type = struct.unpack(">I4s", chunk_header)
+        if chunk_type == b"IEND":
+            return
+        if chunk_type != b"IDAT":
+            file.seek(length + 4, io.SEEK_CUR)
+            continue
+
+        while length > 0:
+            data = file.read(min(length, _READ_SIZE))
+            if not data:
+                return
+            length -= len(data)
+            yield data
+        file.seek(4, io.SEEK_CUR)
+
+
+def read_png_strips(img, strip_height: int):
+    """
+    Decodes a PNG a strip of rows at a time: the IDAT data is inflated incrementally and every strip is unfiltered
+    against the last row of the strip above, so only one strip is ever decoded.
+    :param img: The opened source image (see can_read_png_strips)
+    :param strip_height: Height of a strip in pixels
+    :return: Generator of the strips of the image from top to bottom as images of its mode, palette and info (the
+             last one can be shorter)
+    :raises ConversionError: If the image data is broken or ends early
+    """
+    header = read_png_header(img.filename)
+    step = _filter_step(header.bit_depth, header.color_type)
+    row_bytes = -(-img.width * _COLOR_TYPE_SAMPLES[header.color_type] * header.bit_depth // 8)
+    rawmode = img.tile[0][3]
+
+    def make_strip(rows: int) -> PILImage.Image:
+        nonlocal previous
+        unfiltered = _unfilter_rows(bytes(pending[:rows * (row_bytes + 1)]), previous, step, rows)
+        del pending[:rows * (row_bytes + 1)]
+        previous = unfiltered[-1].tobytes()
+
+        strip = PILImage.frombytes(img.mode, (img.width, rows), unfiltered.tobytes(), "raw", rawmode)
+        if img.mode == "P" and img.palette is not None:
+            strip.putpalette(img.palette)
+        strip.info.update(img.info)
+        return strip
+
+    previous = bytes(row_bytes)
+    pending = bytearray()
+    strip_bytes = strip_height * (row_bytes + 1)
+    top = 0
+
+    inflater = zlib.decompressobj()
+    try:
+        with open(img.filename, "rb") as file:
+            file.seek(len(PNG_SIGNATURE))
+            for data in _idat_data(file):
+                while data and top < img.height:
+                    pending += inflater.decompress(data, strip_bytes)
+                    data = inflater.unconsumed_tail
+                    while len(pending) >= strip_bytes and top < img.height:
+                        rows = min(strip_height, img.height - top)
+                        yield make_strip(rows)
+                        top += rows
+        pending += inflater.flush()
+    except zlib.error as error:
+        raise ConversionError(f"Image data can't be inflated ({error}): `{img.filename}`") from error
+
+    while top < img.height:
+        rows = min(strip_height, img.height - top, len(pending) // (row_bytes + 1))
+        if rows == 0:
+            raise ConversionError(f"Image data ends after {top} of {img.height} rows: `{img.filename}`")
+        yield make_strip(rows)
+        top += rows
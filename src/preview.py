@@ -0,0 +1,167 @@
+import io
+from contextlib import redirect_stdout
+from pathlib import Path
+
+import numpy as np
+from PIL import Image as PILImage
+
+from .bitmap import bitmap_row_width
+from .converter import create_unit_tile_data, create_unit_bitmap, _mode_args
+from .deduper import dedupe_tiles
+from .errors import ConversionError, InvalidOptionsError
+from .gba_utils import rgb15_array_to_rgb888
+from .tile_creator import unpack_index_plane, hex_to_words, order_tiles
+
+# Width (in tiles) of the deduped tile sheet
+SHEET_TILES_WIDE = 16
+
+# Gap (pixels) between the tile sheet and the reconstruction
+SHEET_GAP = 8
+
+
+def _colorize(indices: np.ndarray, gba_palette: list, bank_plane: np.ndarray = None) -> np.ndarray:
+    """
+    Looks up the color of every palette index.
+    :param indices: (height, width) array of palette indices
+    :param gba_palette: The palette (16 entries per bank when using palette banks)
+    :param bank_plane: (height, width) array of the palette bank of every pixel (None for a single palette)
+    :return: (height, width, 3) uint8 RGB array
+    """
+    if bank_plane is not None:
+        indices = bank_plane.astype(np.int64) * 16 + indices
+
+    # Indices past the end of the palette show as black like unset palette memory
+    palette = np.zeros(max(len(gba_palette), int(indices.max(initial=0)) + 1), dtype=np.uint32)
+    palette[:len(gba_palette)] = gba_palette
+    return rgb15_array_to_rgb888(palette)[indices]
+
+
+def _tile_bank_plane(tile_banks: np.ndarray, width: int, height: int) -> np.ndarray:
+    """
+    :param tile_banks: (tiles_y, tiles_x) palette bank of every tile
+    :param width: Width of the plane in pixels
+    :param height: Height of the plane in pixels
+    :return: (height, width) palette bank of every pixel
+    """
+    return np.repeat(np.repeat(tile_banks, 8, axis=0), 8, axis=1)[:height, :width]
+
+
+def _render_bitmap(args: dict) -> np.ndarray:
+    """
+    Decodes a bitmap unit's data back into pixels.
+    :param args: Conversion arguments of the unit
+    :return: (height, width, 3) uint8 RGB array
+    """
+    img, gba_palette, bitmap_data = create_unit_bitmap(args)
+
+    data = hex_to_words(bitmap_data).astype("<u4").view(np.uint8)
+    if args["bpp"] == 16:
+        colors = data.view("<u2")[:img.width * img.height].reshape(img.height, img.width)
+        return rgb15_array_to_rgb888(colors)
+
+    row_width = bitmap_row_width(img.width, 8)
+    indices = data[:row_width * img.height].reshape(img.height, row_width)[:, :img.width]
+    return _colorize(indices, gba_palette)
+
+
+def _render_tile_sheet(tile_words: np.ndarray, tile_mapping: list, stream_banks: np.ndarray, gba_palette: list,
+                       bpp: int) -> np.ndarray:
+    """
+    Lays the deduped tiles out in rows of SHEET_TILES_WIDE tiles.
+    :param tile_words: (unique tiles, 2*bpp) array of the deduped tiles
+    :param tile_mapping: Unique tile of every tile in stream order
+    :param stream_banks: Palette bank of every tile in stream order (None for a single palette)
+    :param gba_palette: The palette of the unit
+    :param bpp: The number of bits per pixel into a palette
+    :return: (height, width, 3) uint8 RGB array
+    """
+    num_tiles = len(tile_words)
+    rows = max(1, -(-num_tiles // SHEET_TILES_WIDE))
+    padded = np.zeros((rows * SHEET_TILES_WIDE, 2 * bpp), dtype=np.uint32)
+    padded[:num_tiles] = tile_words
+
+    width, height = SHEET_TILES_WIDE * 8, rows * 8
+    indices = unpack_index_plane(padded.ravel(), width, height, 1, 1, bpp)
+
+    bank_plane = None
+    if stream_banks is not None:
+        # Every unique tile is shown with the bank of its first use
+        first_use = np.zeros(rows * SHEET_TILES_WIDE, dtype=np.int64)
+        for tile, unique in reversed(list(enumerate(tile_mapping))):
+            first_use[unique] = stream_banks[tile]
+        bank_plane = _tile_bank_plane(first_use.reshape(rows, SHEET_TILES_WIDE), width, height)
+
+    return _colorize(indices, gba_palette, bank_plane)
+
+
+def render_unit_preview(args: dict, sheet: bool = False) -> np.ndarray:
+    """
+    Converts a unit (without writing its output) and decodes the packed tiles back into what the GBA shows.
+    :param args: Conversion arguments of the unit
+    :param sheet: If the deduped tile sheet and the reconstruction from the tile mapping should be shown side
+                  by side in place of the plain decoded tiles
+    :return: (height, width, 3) uint8 RGB array
+    :raises InvalidOptionsError: If the unit's settings don't fit its image
+    :raises ConversionError: If the unit can't be converted
+    """
+    args = _mode_args(args)
+    if args.get("mode") == "bitmap":
+        return _render_bitmap(args)
+
+    img, gba_palette, tile_data, banks = create_unit_tile_data(args)
+
+    bpp = args["bpp"]
+    meta_w, meta_h = args["meta_width"], args["meta_height"]
+    width, height = img.width, img.height
+
+    bank_plane = None
+    stream_banks = None
+    if banks is not None:
+        bank_plane = _tile_bank_plane(banks.tile_banks, width, height)
+        stream_banks = order_tiles(banks.tile_banks, meta_w, meta_h)
+
+    if not sheet:
+        indices = unpack_index_plane(hex_to_words(tile_data), width, height, meta_w, meta_h, bpp)
+        return _colorize(indices, gba_palette, bank_plane)
+
+    # Rebuild the image through the tile mapping, so a wrong mapping shows up in the preview
+    unique_data, tile_mapping = dedupe_tiles(tile_data, bpp)
+    tile_words = hex_to_words(unique_data).reshape(-1, 2 * bpp)
+    rebuilt = tile_words[np.asarray(tile_mapping, dtype=np.int64)].ravel()
+    reconstruction = _colorize(unpack_index_plane(rebuilt, width, height, meta_w, meta_h, bpp), gba_palette,
+                               bank_plane)
+    tile_sheet = _render_tile_sheet(tile_words, tile_mapping, stream_banks, gba_palette, bpp)
+
+    # Tile sheet on the left, reconstruction on the right
+    out_height = max(tile_sheet.shape[0], reconstruction.shape[0])
+    out_width = tile_sheet.shape[1] + SHEET_GAP + reconstruction.shape[1]
+    combined = np.full((out_height, out_width, 3), 255, dtype=np.uint8)
+    combined[:tile_sheet.shape[0], :tile_sheet.shape[1]] = tile_sheet
+    combined[:reconstruction.shape[0], tile_sheet.shape[1] + SHEET_GAP:] = reconstruction
+    return combined
+
+
+def write_unit_preview(args: dict, preview_path: Path, sheet: bool = False, scale: int = 1) -> tuple[bool, str]:
+    """
+    Renders the preview of a unit and saves it as a PNG (safe to run in a worker process).
+    :param args: Conversion arguments of the unit
+    :param preview_path: Path of the PNG
+    :param sheet: If the deduped tile sheet and the reconstruction should be shown side by side
+    :param scale: Integer scale of the PNG (nearest neighbor)
+    :return: If the preview failed and everything the conversion printed
+    """
+    log = io.StringIO()
+    with redirect_stdout(log):
+        try:
+            pixels = render_unit_preview(args, sheet)
+        except (ConversionError, InvalidOptionsError) as error:
+            print(f" \t ERROR: {error}")
+            pixels = None
+    if pixels is None:
+        return True, log.getvalue()
+
+    if scale > 1:
+        pixels = np.repeat(np.repeat(pixels, scale, axis=0), scale, axis=1)
+    PILImage.fromarray(pixels, "RGB").save(preview_path)
+
+    return False, log.getvalue()
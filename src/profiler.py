@@ -0,0 +1,362 @@
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from pathlib import Path
+
+
+@dataclass(frozen=False)
+class StageRecord:
+    """
+    Timing information for one pipeline stage of one unit.
+
+    :param unit: Name of the unit the stage ran for.
+    :param stage: Name of the pipeline stage (e.g. `decode`, `dedupe`).
+    :param start: Wall clock start offset (seconds) from when profiling began.
+    :param wall: Wall time spent in the stage (seconds).
+    :param cpu: CPU time spent in the stage (seconds).
+    :param items: Number of items the stage processed (pixels, tiles, bytes...).
+    :param peak_traced: Peak growth of the Python heap (tracemalloc) during the stage in bytes (0 if not tracked).
+    :param peak_rss: Peak growth of the resident set size during the unit in bytes (units only).
+    """
+    unit: str
+    stage: str
+    start: float = 0.0
+    wall: float = 0.0
+    cpu: float = 0.0
+    items: int = 0
+    peak_traced: int = 0
+    peak_rss: int = 0
+
+
+# Order the stages are shown in the summary table
+PIPELINE_STAGES = [
+    "cache",
+    "decode",
+    "palette",
+    "conversion_table",
+    "tile_packing",
+    "bitmap_packing",
+    "sprite_slicing",
+    "elide",
+    "dedupe",
+    "compression",
+    "emission",
+]
+
+
+_MEMORY_UNITS = {
+    "K": 1 << 10,
+    "M": 1 << 20,
+    "G": 1 << 30,
+}
+
+
+def parse_memory_size(text: str) -> int:
+    """
+    Parses a memory size such as `512M`, `2G` or `1048576`.
+    :param text: The size with an optional K, M or G suffix (B/iB also accepted)
+    :return: The size in bytes
+    """
+    value = text.strip().upper()
+    for suffix in ("IB", "B"):
+        if value.endswith(suffix):
+            value = value[:-len(suffix)]
+            break
+
+    multiplier = 1
+    if value[-1:] in ("K", "M", "G"):
+        multiplier = _MEMORY_UNITS[value[-1]]
+        value = value[:-1]
+
+    return int(float(value) * multiplier)
+
+
+def current_rss() -> int:
+    """
+    Reads the resident set size of this process.
+    :return: The RSS in bytes (0 if it can't be read on this platform)
+    """
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+
+    # No procfs, fall back on the peak RSS
+    try:
+        import resource
+    except ImportError:
+        return 0
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+class RssSampler:
+    """
+    Polls the resident set size on a background thread to find its peak.
+    Catches memory that tracemalloc can't see (PIL image buffers, ctypes).
+    """
+
+    def __init__(self, interval: float = 0.005) -> None:
+        self.interval = interval
+        self.baseline = 0
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        self.baseline = self.peak = current_rss()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def stop(self) -> int:
+        """
+        Stops sampling.
+        :return: How far (in bytes) the RSS grew above where it was when sampling started
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.peak = max(self.peak, current_rss())
+        return max(0, self.peak - self.baseline)
+
+
+class Profiler:
+    """
+    Collects per unit, per stage timings (and optionally peak memory) of the conversion pipeline.
+    """
+
+    def __init__(self, track_memory: bool = False) -> None:
+        self.records: list[StageRecord] = []
+        self.current_unit = ""
+        self.track_memory = track_memory
+        self._origin = time.perf_counter()
+        self._open_stages: list[dict] = []
+
+        if track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def unit(self, name: str):
+        """
+        Marks every stage run inside the context as belonging to the unit `name`.
+        :param name: Name of the unit
+        :return: The StageRecord covering the whole unit
+        """
+        previous_unit = self.current_unit
+        self.current_unit = name
+
+        sampler = None
+        if self.track_memory:
+            sampler = RssSampler()
+            sampler.start()
+
+        try:
+            with self.stage("unit") as record:
+                yield record
+        finally:
+            if sampler is not None:
+                record.peak_rss = sampler.stop()
+            self.current_unit = previous_unit
+
+    @contextmanager
+    def stage(self, name: str, items: int = 0):
+        """
+        Times the code inside the context as the stage `name` of the current unit.
+        :param name: Name of the stage
+        :param items: Number of items processed (can also be set on the yielded record)
+        :return: The StageRecord being filled
+        """
+        record = StageRecord(unit=self.current_unit, stage=name, items=items)
+
+        # Heap in use when the stage starts and the highest absolute heap seen during it
+        memory = {"start": 0, "peak": 0}
+        if self.track_memory:
+            memory["start"] = memory["peak"] = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self._open_stages.append(memory)
+
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield record
+        finally:
+            record.start = wall_start - self._origin
+            record.wall = time.perf_counter() - wall_start
+            record.cpu = time.process_time() - cpu_start
+
+            # Inner stages reset the peak, so the outer stage keeps the max of all of them
+            self._open_stages.pop()
+            if self.track_memory:
+                memory["peak"] = max(memory["peak"], tracemalloc.get_traced_memory()[1])
+                record.peak_traced = memory["peak"] - memory["start"]
+                if self._open_stages:
+                    parent = self._open_stages[-1]
+                    parent["peak"] = max(parent["peak"], memory["peak"])
+                tracemalloc.reset_peak()
+
+            self.records.append(record)
+
+    def unit_record(self, name: str) -> StageRecord:
+        """
+        :param name: Name of the unit
+        :return: The record covering the whole unit (None if the unit wasn't profiled)
+        """
+        for record in self.records:
+            if record.unit == name and record.stage == "unit":
+                return record
+        return None
+
+    def unit_names(self) -> list[str]:
+        """
+        :return: The names of all profiled units in the order they ran
+        """
+        names = []
+        for record in self.records:
+            if record.unit not in names:
+                names.append(record.unit)
+        return names
+
+    def summary_table(self) -> str:
+        """
+        Creates a printable table of every unit's stages and the totals per stage.
+        :return: The table as a string
+        """
+        header = f" \t{'unit':<20} {'stage':<17} {'wall ms':>10} {'cpu ms':>10} {'items':>10}"
+        if self.track_memory:
+            header += f" {'heap MB':>9} {'rss MB':>9}"
+        header += "\n"
+        table = header + " \t" + "-" * (len(header) - 3) + "\n"
+
+        stage_order = {name: i for i, name in enumerate(PIPELINE_STAGES + ["unit"])}
+        for unit_name in self.unit_names():
+            unit_records = [r for r in self.records if r.unit == unit_name]
+            unit_records.sort(key=lambda r: stage_order.get(r.stage, len(stage_order)))
+            for r in unit_records:
+                stage_name = "total" if r.stage == "unit" else r.stage
+                table += f" \t{unit_name[:20]:<20} {stage_name:<17} {r.wall*1000:>10.2f} {r.cpu*1000:>10.2f} {r.items:>10}"
+                if self.track_memory:
+                    rss = f"{r.peak_rss / (1 << 20):>9.2f}" if r.stage == "unit" else f"{'':>9}"
+                    table += f" {r.peak_traced / (1 << 20):>9.2f} {rss}"
+                table += "\n"
+
+        # Totals per stage over every unit
+        table += " \t" + "-" * (len(header) - 3) + "\n"
+        for stage_name in PIPELINE_STAGES:
+            stage_records = [r for r in self.records if r.stage == stage_name]
+            if not stage_records:
+                continue
+            wall = sum(r.wall for r in stage_records)
+            cpu = sum(r.cpu for r in stage_records)
+            items = sum(r.items for r in stage_records)
+            table += f" \t{'(all units)':<20} {stage_name:<17} {wall*1000:>10.2f} {cpu*1000:>10.2f} {items:>10}"
+            if self.track_memory:
+                peak = max(r.peak_traced for r in stage_records)
+                table += f" {peak / (1 << 20):>9.2f} {'':>9}"
+            table += "\n"
+
+        return table
+
+    def write_json(self, path: Path) -> None:
+        """
+        Writes every stage record as JSON.
+        :param path: Path of the JSON file
+        :return: None
+        """
+        with open(path, "w") as file:
+            json.dump({"records": [asdict(r) for r in self.records]}, file, indent=2)
+
+    def write_chrome_trace(self, path: Path) -> None:
+        """
+        Writes the records in the Chrome trace event format (viewable in chrome://tracing or Perfetto).
+        :param path: Path of the trace file
+        :return: None
+        """
+        events = []
+        for r in self.records:
+            events.append({
+                "name": r.unit if r.stage == "unit" else r.stage,
+                "cat": "unit" if r.stage == "unit" else "stage",
+                "ph": "X",
+                "ts": r.start * 1e6,
+                "dur": r.wall * 1e6,
+                "pid": 1,
+                "tid": 1,
+                "args": {
+                    "unit": r.unit,
+                    "cpu_ms": r.cpu * 1000,
+                    "items": r.items,
+                    "peak_traced": r.peak_traced,
+                    "peak_rss": r.peak_rss,
+                },
+            })
+
+        with open(path, "w") as file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+
+
+# Profiler used by the pipeline, None when profiling is off
+_active_profiler = None
+
+
+def enable_profiling(track_memory: bool = False) -> Profiler:
+    """
+    Turns on profiling for every following conversion.
+    :param track_memory: If peak memory (tracemalloc and RSS) should be measured as well
+    :return: The now active Profiler
+    """
+    global _active_profiler
+    _active_profiler = Profiler(track_memory)
+    return _active_profiler
+
+
+def disable_profiling() -> None:
+    """
+    Turns off profiling.
+    :return: None
+    """
+    global _active_profiler
+    if _active_profiler is not None and _active_profiler.track_memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _active_profiler = None
+
+
+@contextmanager
+def stage(name: str, items: int = 0):
+    """
+    Times a pipeline stage when profiling is on, otherwise does nothing.
+    :param name: Name of the stage
+    :param items: Number of items processed (can also be set on the yielded record)
+    :return: The StageRecord being filled
+    """
+    if _active_profiler is None:
+        yield StageRecord(unit="", stage=name, items=items)
+        return
+
+    with _active_profiler.stage(name, items) as record:
+        yield record
+
+
+@contextmanager
+def unit(name: str):
+    """
+    Groups the stages run inside the context under the unit `name` when profiling is on.
+    :param name: Name of the unit
+    :return: The StageRecord covering the whole unit
+    """
+    if _active_profiler is None:
+        yield StageRecord(unit=name, stage="unit")
+        return
+
+    with _active_profiler.unit(name) as record:
+        yield record
@@ -0,0 +1,32 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable
+
+# Where the conversion's progress messages go in the current thread (None prints them)
+_progress_sink: ContextVar[Callable] = ContextVar("progress_sink", default=None)
+
+
+def log_progress(message: str) -> None:
+    """
+    Reports a step of the conversion (printed by the command line, collected by the Python API).
+    :param message: The message, formatted like the command line prints it
+    :return: None
+    """
+    sink = _progress_sink.get()
+    if sink is None:
+        print(message)
+    else:
+        sink(message)
+
+
+@contextmanager
+def progress_sink(sink: Callable):
+    """
+    Sends the progress messages of everything run in the block (in this thread only) to a callback.
+    :param sink: Called with every message
+    """
+    token = _progress_sink.set(sink)
+    try:
+        yield
+    finally:
+        _progress_sink.reset(token)
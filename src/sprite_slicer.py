@@ -0,0 +1,147 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+# Legal OBJ sizes (width, height in tiles) and their (shape, size) attribute values
+OBJ_SHAPES = {
+    (1, 1): (0, 0), (2, 2): (0, 1), (4, 4): (0, 2), (8, 8): (0, 3),  # Square
+    (2, 1): (1, 0), (4, 1): (1, 1), (4, 2): (1, 2), (8, 4): (1, 3),  # Wide
+    (1, 2): (2, 0), (1, 4): (2, 1), (2, 4): (2, 2), (4, 8): (2, 3),  # Tall
+}
+
+# How many tiles one more OAM entry is worth when weighing OBJs against tiles
+OBJ_COST = 2
+
+
+@dataclass(frozen=True)
+class SpriteObj:
+    """
+    One hardware OBJ of a sliced sprite.
+
+    :param x: X offset (pixels) from the sprite's top left corner.
+    :param y: Y offset (pixels) from the sprite's top left corner.
+    :param width: Width in tiles.
+    :param height: Height in tiles.
+    :param tile: Index of the OBJ's first tile in the sprite's tile data (in 32 byte units like attribute 2).
+    """
+    x: int
+    y: int
+    width: int
+    height: int
+    tile: int
+
+    @property
+    def shape(self) -> int:
+        return OBJ_SHAPES[(self.width, self.height)][0]
+
+    @property
+    def size(self) -> int:
+        return OBJ_SHAPES[(self.width, self.height)][1]
+
+    def attributes(self, bpp: int, palette_bank: int = 0) -> tuple[int, int, int]:
+        """
+        :param bpp: Bits per pixel of the tiles
+        :param palette_bank: Palette bank of the OBJ (4bpp only)
+        :return: The OBJ's attributes 0, 1 and 2 with the offsets in the coordinate fields
+        """
+        attr0 = (self.y & 0xFF) | ((bpp == 8) << 13) | (self.shape << 14)
+        attr1 = (self.x & 0x1FF) | (self.size << 14)
+        attr2 = (self.tile & 0x3FF) | (palette_bank << 12)
+        return attr0, attr1, attr2
+
+
+def _window_sums(mask: np.ndarray, width: int, height: int) -> np.ndarray:
+    """
+    Counts the set cells of every width x height window (windows start at every cell, the mask is padded
+    with zeros past its edges).
+    :param mask: 2D bool array
+    :param width: Window width
+    :param height: Window height
+    :return: Array of the counts, same shape as the mask
+    """
+    rows, cols = mask.shape
+    padded = np.zeros((rows + height, cols + width), dtype=np.int32)
+    padded[:rows, :cols] = mask
+    summed = np.zeros((rows + height + 1, cols + width + 1), dtype=np.int32)
+    summed[1:, 1:] = padded.cumsum(axis=0).cumsum(axis=1)
+
+    return (summed[height:height + rows, width:width + cols] - summed[:rows, width:width + cols]
+            - summed[height:height + rows, :cols] + summed[:rows, :cols])
+
+
+def slice_sprite(occupied: np.ndarray) -> list[tuple[int, int, int, int]]:
+    """
+    Covers the occupied tiles of a sprite with legal OBJ shapes, weighing the number of OBJs against the number
+    of tiles they use. Placements are picked greedily by cost per newly covered tile, then OBJs whose tiles are
+    all covered by others are dropped.
+    :param occupied: (tiles_y, tiles_x) bool array of the tiles that aren't fully transparent
+    :return: List of (tile x, tile y, width, height) of every OBJ
+    """
+    uncovered = occupied.copy()
+    placements = []
+
+    while uncovered.any():
+        best = None
+        for (width, height) in OBJ_SHAPES:
+            new = _window_sums(uncovered, width, height)
+            cost = (width * height + OBJ_COST) / np.maximum(new, 1)
+            cost[new == 0] = np.inf
+
+            y, x = np.unravel_index(np.argmin(cost), cost.shape)
+            candidate = (cost[y, x], -new[y, x], width * height, int(x), int(y), width, height)
+            if best is None or candidate < best:
+                best = candidate
+
+        _, _, _, x, y, width, height = best
+        placements.append((x, y, width, height))
+        uncovered[y:y + height, x:x + width] = False
+
+    # Drop OBJs that only cover tiles other OBJs already cover
+    coverage = np.zeros((occupied.shape[0] + 8, occupied.shape[1] + 8), dtype=np.int32)
+    padded = np.zeros_like(coverage, dtype=bool)
+    padded[:occupied.shape[0], :occupied.shape[1]] = occupied
+    for x, y, width, height in placements:
+        coverage[y:y + height, x:x + width] += 1
+
+    kept = []
+    for x, y, width, height in sorted(placements, key=lambda p: p[2] * p[3]):
+        area = coverage[y:y + height, x:x + width]
+        if (area[padded[y:y + height, x:x + width]] > 1).all():
+            area -= 1
+            continue
+        kept.append((x, y, width, height))
+
+    return sorted(kept, key=lambda p: (p[1], p[0]))
+
+
+def create_sprite_tiles(tile_words: np.ndarray, tiles_x: int, tiles_y: int, bpp: int) -> tuple[np.ndarray, list]:
+    """
+    Slices a sprite into OBJs and orders its tiles OBJ by OBJ (1D OBJ mapping).
+    :param tile_words: (tiles, 2*bpp) array of the packed tiles in row major order
+    :param tiles_x: Width of the sprite in tiles
+    :param tiles_y: Height of the sprite in tiles
+    :param bpp: The number of bits per pixel into a palette
+    :return: The (tiles, 2*bpp) array of the OBJs' tiles and the SpriteObjs
+    """
+    words_per_tile = 2 * bpp
+    grid = tile_words.reshape(tiles_y, tiles_x, words_per_tile)
+
+    # Every OBJ may reach past the sprite's edge, those tiles are empty
+    padded = np.zeros((tiles_y + 8, tiles_x + 8, words_per_tile), dtype=tile_words.dtype)
+    padded[:tiles_y, :tiles_x] = grid
+
+    occupied = grid.any(axis=2)
+    objs = []
+    obj_tiles = []
+    tile_index = 0
+    for x, y, width, height in slice_sprite(occupied):
+        objs.append(SpriteObj(x=x * 8, y=y * 8, width=width, height=height, tile=tile_index))
+        obj_tiles.append(padded[y:y + height, x:x + width].reshape(-1, words_per_tile))
+
+        # 8bpp tiles take two 32 byte units of OBJ VRAM
+        tile_index += width * height * (bpp // 4)
+
+    if not obj_tiles:
+        return np.zeros((0, words_per_tile), dtype=tile_words.dtype), objs
+
+    return np.concatenate(obj_tiles), objs
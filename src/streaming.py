@@ -0,0 +1,360 @@
+import os
+from array import array
+from pathlib import Path
+
+import numpy as np
+from PIL import Image as PILImage
+
+from .compress_output import make_compress_output, compress_tile_bytes
+from .converter import create_variant_palettes, fill_report
+from .deduper import EMPTY_TILE
+from .errors import ConversionError
+from .gba_utils import open_rgb_image, rgb888_array_to_rgb15
+from .palette import extract_palette_img, palette_from_histogram, conversion_table_from_colors, \
+    palette_from_indexed_img, remap_indexed_img, RGB15_COLORS
+from .png_strips import can_read_png_strips, read_png_strips
+from .profiler import stage
+from .tile_creator import pack_index_plane, padded_size
+from .tile_output import create_streamed_c_file, create_header_file, create_palette_png, tile_data_lines, \
+    bg_pool_bank
+from .units import UnitReport
+
+# Rough bytes used per pixel of a strip (cropped and RGB copies, RGB15 colors, indices and the packing
+# intermediates) and per tile of the output (mapping entry, dedupe key and its dict slot)
+_STRIP_BYTES_PER_PIXEL = 40
+_TILE_BYTES = 120
+
+
+def can_stream(args: dict) -> bool:
+    """
+    :param args: Conversion arguments of the unit
+    :return: Whether the unit can be converted a strip at a time (plain tiles without palette banks)
+    """
+    return args.get("mode", "tiles") == "tiles" and not args.get("palette_banks")
+
+
+def estimate_streaming_memory(args: dict) -> int:
+    """
+    Estimates the peak memory converting a unit a strip at a time needs, only reading the image header.
+    :param args: Conversion arguments of the unit
+    :return: The estimate in bytes
+    """
+    with PILImage.open(args["image_path"]) as img:
+        width, height = img.size
+        bytes_per_pixel = 1 if img.mode in ("1", "L", "P") else 4
+        # Images that can't be read a strip at a time are decoded whole first
+        decoded_bytes = 0 if can_read_png_strips(img) else width * height * bytes_per_pixel
+
+    round_width, round_height = padded_size(width, height, args["meta_width"], args["meta_height"])
+    strip_pixels = round_width * args["meta_height"] * 8
+    tiles = round_width * round_height // 64
+
+    estimate = decoded_bytes + strip_pixels * _STRIP_BYTES_PER_PIXEL + tiles * _TILE_BYTES
+    if args["compress"]:
+        # The packed words and the compressed stream are kept for the codec
+        estimate += tiles * 8 * args["bpp"] * 2
+    return estimate
+
+
+def image_strips(img, strip_height: int):
+    """
+    Reads the image a strip at a time. PNGs are decoded strip by strip from the file, other images (and interlaced
+    PNGs) are decoded whole the first time and cropped.
+    :param img: The opened source image
+    :param strip_height: Height of a strip in pixels
+    :return: Generator of the strips of the image from top to bottom (the last one can be shorter)
+    :raises ConversionError: If the image data ends early
+    """
+    if can_read_png_strips(img):
+        yield from read_png_strips(img, strip_height)
+        return
+
+    for top in range(0, img.height, strip_height):
+        yield img.crop((0, top, img.width, min(top + strip_height, img.height)))
+
+
+def strip_histogram(img, strip_height: int) -> np.ndarray:
+    """
+    Counts how many pixels of the image use each RGB15 color, a strip at a time.
+    :param img: The opened source image
+    :param strip_height: Height of a strip in pixels
+    :return: Array of 32768 pixel counts indexed by RGB15 color
+    """
+    histogram = np.zeros(RGB15_COLORS, dtype=np.int64)
+    for strip in image_strips(img, strip_height):
+        colors = rgb888_array_to_rgb15(np.asarray(open_rgb_image(strip), dtype=np.uint8))
+        histogram += np.bincount(colors.ravel(), minlength=RGB15_COLORS)
+    return histogram
+
+
+def strip_used_indices(img, strip_height: int) -> np.ndarray:
+    """
+    Finds the palette indices the pixels of an indexed image use, a strip at a time.
+    :param img: The opened indexed (mode "P") source image
+    :param strip_height: Height of a strip in pixels
+    :return: Array of the used indices
+    """
+    counts = np.zeros(256, dtype=np.int64)
+    for strip in image_strips(img, strip_height):
+        counts += np.bincount(np.asarray(strip).ravel(), minlength=256)
+    return np.flatnonzero(counts)
+
+
+def _streamed_palette(args: dict, img, strip_height: int):
+    """
+    Creates the GBA palette of a unit and what its pixels are converted with, without converting the whole image
+    (see create_unit_palette).
+    :param args: Conversion arguments of the unit
+    :param img: The opened source image
+    :param strip_height: Height of a strip in pixels
+    :return: The GBA palette, the remap of the image's own indices (None if not indexed) and the RGB15 to index
+             lookup table (None if the indices are remapped)
+    :raises ConversionError: If the palette image can't be used
+    """
+    transparent = args["transparent"]
+
+    index_remap = None
+    if img.mode == "P":
+        # Every strip carries the image's palette, the first row is enough to read it
+        palette_img = next(image_strips(img, 1))
+        used = strip_used_indices(img, strip_height)
+
+    with stage("palette") as record:
+        if args.get("pool_palette") is not None:
+            gba_palette = args["pool_palette"]
+        elif args["palette_path"]:
+            gba_palette = extract_palette_img(
+                filename=args["palette_path"],
+                bpp=args["bpp"],
+                transparent=transparent
+            )
+        elif img.mode == "P":
+            gba_palette, index_remap = palette_from_indexed_img(palette_img, args["bpp"], transparent, used)
+        else:
+            gba_palette = None
+
+        if img.mode == "P" and index_remap is None and gba_palette is not None:
+            index_remap = remap_indexed_img(palette_img, gba_palette, transparent, used)
+
+        # Everything else goes through color matching, with the colors counted a strip at a time
+        histogram = None
+        if index_remap is None:
+            histogram = strip_histogram(img, strip_height)
+            if not args["palette_path"] and args.get("pool_palette") is None:
+                gba_palette = palette_from_histogram(histogram, args["bpp"], transparent)
+        record.items = len(gba_palette)
+
+    if index_remap is not None:
+        return gba_palette, index_remap, None
+
+    conversion_table = args.get("pool_conversion_table")
+    with stage("conversion_table") as record:
+        if conversion_table is None:
+            conversion_table = conversion_table_from_colors(np.flatnonzero(histogram), gba_palette)
+        record.items = len(conversion_table)
+
+    lut = np.zeros(RGB15_COLORS, dtype=np.uint8)
+    lut[np.fromiter(conversion_table.keys(), dtype=np.int64)] = np.fromiter(conversion_table.values(), dtype=np.int64)
+    return gba_palette, None, lut
+
+
+def index_strips(img, strip_height: int, index_remap: np.ndarray, lut: np.ndarray):
+    """
+    :param img: The opened source image
+    :param strip_height: Height of a strip in pixels
+    :param index_remap: Remap of the image's own indices (None if the colors are matched)
+    :param lut: RGB15 to palette index lookup table (None if the indices are remapped)
+    :return: Generator of the (height, width) palette index plane of every strip
+    """
+    for strip in image_strips(img, strip_height):
+        if index_remap is not None:
+            yield index_remap[np.asarray(strip)]
+        else:
+            yield lut[rgb888_array_to_rgb15(np.asarray(open_rgb_image(strip), dtype=np.uint8))]
+
+
+def stream_tiles(word_strips, bpp: int, elide_empty: bool, dedupe: bool):
+    """
+    Drops the fully transparent and duplicate tiles of a tile stream a strip at a time (the same tiles and mapping
+    as elide_empty_tiles then dedupe_tiles on the whole stream).
+    :param word_strips: Iterable of the packed words of every strip
+    :param bpp: The number of bits per pixel into a palette
+    :param elide_empty: Whether fully transparent tiles are dropped
+    :param dedupe: Whether duplicate tiles are dropped
+    :return: Generator of the kept words, the mapping entries (None without elide_empty or dedupe) and the number
+             of elided tiles of every strip
+    """
+    seen: dict[bytes, int] = {}
+    kept_count = 0
+    for words in word_strips:
+        if not (elide_empty or dedupe):
+            yield words, None, 0
+            continue
+
+        tiles = words.reshape(-1, 2 * bpp)
+        non_empty = tiles.any(axis=1) if elide_empty else np.ones(len(tiles), dtype=bool)
+        keys = np.ascontiguousarray(tiles).view(np.dtype((np.void, tiles.shape[1] * 4))).ravel()
+
+        kept = []
+        mapping = []
+        for i, key in enumerate(keys.tolist()):
+            if not non_empty[i]:
+                mapping.append(EMPTY_TILE)
+                continue
+            if dedupe:
+                index = seen.get(key)
+                if index is None:
+                    index = seen[key] = kept_count
+                    kept_count += 1
+                    kept.append(i)
+            else:
+                index = kept_count
+                kept_count += 1
+                kept.append(i)
+            mapping.append(index)
+
+        yield tiles[kept].ravel(), mapping, len(tiles) - int(non_empty.sum())
+
+
+def run_streaming_conversion(args: dict, report: UnitReport = None) -> bool:
+    """
+    Converts a unit one metatile row at a time: every strip is decoded, matched to the palette, packed, elided,
+    deduped and written before the next one is read, so only one strip is in memory (plus the tile mapping and
+    the unique tiles). The source is read again for every pass over it (palette, then tiles).
+    :param args: Conversion arguments of the unit
+    :param report: UnitReport to fill with the sizes of the output (None to skip)
+    :return: True if the conversion failed, False otherwise
+    """
+    if args.get("image") is not None:
+        return _stream_image(args, args["image"], report)
+
+    with PILImage.open(args["image_path"]) as img:
+        return _stream_image(args, img, report)
+
+
+def _stream_image(args: dict, img, report: UnitReport) -> bool:
+    """
+    :param args: Conversion arguments of the unit
+    :param img: The opened source image
+    :param report: UnitReport to fill with the sizes of the output (None to skip)
+    :return: True if the conversion failed, False otherwise
+    """
+    meta_w = args["meta_width"]
+    meta_h = args["meta_height"]
+    bpp = args["bpp"]
+    strip_height = meta_h * 8
+
+    variant_palettes = []
+    try:
+        gba_palette, index_remap, lut = _streamed_palette(args, img, strip_height)
+        if args.get("variants"):
+            with stage("palette") as record:
+                variant_palettes = create_variant_palettes(args, gba_palette)
+                record.items = len(variant_palettes)
+            print(f" \t Reusing the tiles for {len(variant_palettes)} palette variants")
+    except ConversionError as error:
+        print(f" \t ERROR: {error}")
+        return True
+
+    strip_count = -(-img.height // strip_height)
+    print(f" \t Streaming {strip_count} strips of {strip_height} rows...")
+
+    elide_empty = bool(args.get("elide_empty"))
+    dedupe = bool(args["dedupe"])
+    output_type = args["output_type"]
+    write_c = not args["compress"] and output_type in ("both", "c")
+    pool_bank = bg_pool_bank(args)
+
+    dest = args["destination_path"]
+    tile_lines_path = Path(dest if dest is not None else ".") / f"{args['image_name']}.c.part"
+
+    raw_words = 0
+    tile_words = 0
+    elided_tiles = 0
+    line_count = 0
+    packed = bytearray() if args["compress"] else None
+    tile_mapping = array("I") if elide_empty or dedupe or pool_bank is not None else None
+    tile_lines = open(tile_lines_path, "w") if write_c else None
+    try:
+        with stage("tile_packing") as record:
+            word_strips = (pack_index_plane(indices, meta_w, meta_h, bpp)
+                           for indices in index_strips(img, strip_height, index_remap, lut))
+            for words, mapping, elided in stream_tiles(word_strips, bpp, elide_empty, dedupe):
+                raw_words += len(mapping) * 2 * bpp if mapping is not None else len(words)
+                first_tile = tile_words // (2 * bpp)
+                tile_words += len(words)
+                elided_tiles += elided
+                if pool_bank is not None:
+                    if mapping is None:
+                        mapping = range(first_tile, tile_words // (2 * bpp))
+                    mapping = [index | (pool_bank << 12) for index in mapping]
+                if mapping is not None:
+                    tile_mapping.extend(mapping)
+                if packed is not None:
+                    packed += words.astype("<u4").tobytes()
+                if tile_lines is not None:
+                    text, line_count = tile_data_lines(words, line_count)
+                    tile_lines.write(text)
+            record.items = raw_words // (2 * bpp)
+
+        raw_tiles = raw_words // (2 * bpp)
+        tile_count = tile_words // (2 * bpp)
+        if elide_empty:
+            print(f" \t\t Elided {elided_tiles} of {raw_tiles} tiles ({elided_tiles * 8 * bpp} bytes of VRAM saved)!")
+        if dedupe:
+            print(f" \t\t Deduped from {raw_tiles - elided_tiles} to {tile_count} tiles!")
+        if elide_empty and tile_count > EMPTY_TILE:
+            print(f" \t ERROR: {tile_count} tiles are left after eliding, at most {EMPTY_TILE} fit "
+                  f"below the reserved empty tile index (0x{EMPTY_TILE:03x})")
+            return True
+
+        compressed_bytes = None
+        if packed is not None:
+            with stage("compression") as record:
+                record.items = len(packed)
+                compressed_bytes = compress_tile_bytes(bytes(packed))
+            packed = None
+
+        if tile_lines is not None:
+            tile_lines.close()
+            tile_lines = None
+
+        with stage("emission") as record:
+            if compressed_bytes is not None:
+                make_compress_output(
+                    arguments=args,
+                    image=img,
+                    compressed_bytes=compressed_bytes,
+                    gba_palette=gba_palette,
+                    tile_mapping=tile_mapping,
+                    variant_palettes=variant_palettes,
+                    tile_count=tile_count
+                )
+            else:
+                if write_c:
+                    create_streamed_c_file(args, tile_lines_path, tile_words, tile_mapping, gba_palette,
+                                           variant_palettes)
+                if output_type in ("both", "h"):
+                    create_header_file(args, img, gba_palette, variant_palettes, tile_count)
+                if args["generate_palette"]:
+                    create_palette_png(
+                        gba_pal=gba_palette,
+                        dest=dest,
+                        file_path=args["image_path"],
+                        bpp=bpp
+                    )
+            record.items = tile_words if compressed_bytes is None else len(compressed_bytes)
+    except ConversionError as error:
+        print(f" \t ERROR: {error}")
+        return True
+    finally:
+        if tile_lines is not None:
+            tile_lines.close()
+        if write_c and tile_lines_path.exists():
+            os.remove(tile_lines_path)
+
+    if report is not None:
+        fill_report(report, args, raw_words, tile_words, len(tile_mapping) if tile_mapping is not None else 0,
+                    compressed_bytes, gba_palette, None, variant_palettes)
+        report.elided_tile_count = elided_tiles
+    return False
@@ -1,129 +1,182 @@
-from PIL import Image as PILImage
+import numpy as np
 import math
 
-from .gba_utils import rgb24_to_rgb15
+from .gba_utils import open_rgb_image, rgb888_array_to_rgb15, rgb15_array_to_rgb888
 
-def create_tile_data(file_path:str, conversion_table:dict, meta_w:int, meta_h:int, bpp:int, hex_out:bool=True) -> list:
+def padded_size(width:int, height:int, meta_w:int, meta_h:int) -> tuple[int, int]:
     """
-    Takes the input image path and based on meta height and width separates them by GBA tiles (8x8 pixels)
-    and given a conversion table form rgb24 to rgb15, creates the VRAM data of palette indices.
-    :param file_path: Path to the input image
-    :param conversion_table: Dictionary of rgb24 colors to rgb15 colors (native GBA color)
+    Size an image is padded to so it is made of whole metatiles.
+    :param width: Width of the image in pixels
+    :param height: Height of the image in pixels
     :param meta_w: Number of tiles one meta tile's width consists of
     :param meta_h: Number of tiles one meta tile's height consists of
-    :param bpp: The number of bits per pixel into a palette
-    :param hex_out: If the data should be converted to HEX format
-    :return: A list of the created VRAM data
+    :return: The padded (width, height) in pixels
     """
+    meta_total_width = meta_w * 8
+    meta_total_height = meta_h * 8
 
-    # Load the image and ensure it is in RGB format
-    img = PILImage.open(file_path).convert("RGB")
-    width, height = img.size
+    return (math.ceil(width / meta_total_width) * meta_total_width,
+            math.ceil(height / meta_total_height) * meta_total_height)
 
-    # Pad the image dimensions so they are multiples of 8 (GBA tile size)
-    round_width = math.ceil(width / 8) * 8
-    round_height = math.ceil(height / 8) * 8
-    if (round_width, round_height) != (width, height):
-        # Create a padded image using magenta as the filler color
-        padded = PILImage.new("RGB", (round_width, round_height), (255, 0, 255))
-        padded.paste(img, (0, 0))
-        img = padded
-        width, height = round_width, round_height
+def order_tiles(tile_values:np.ndarray, meta_w:int, meta_h:int) -> np.ndarray:
+    """
+    Puts per tile values (e.g. a palette bank per tile) in the same order the tiles have in the tile stream.
+    :param tile_values: (tiles_y, tiles_x) array with one value per 8x8 tile
+    :param meta_w: Number of tiles one meta tile's width consists of
+    :param meta_h: Number of tiles one meta tile's height consists of
+    :return: 1D array of the values in tile stream order (padding tiles get 0)
+    """
+    tiles_y, tiles_x = tile_values.shape
+    round_x = -(-tiles_x // meta_w) * meta_w
+    round_y = -(-tiles_y // meta_h) * meta_h
 
-    # Total pixel dimensions of a single metatile
-    meta_total_width = meta_w * 8
-    meta_total_height = meta_h * 8
+    padded = np.zeros((round_y, round_x), dtype=tile_values.dtype)
+    padded[:tiles_y, :tiles_x] = tile_values
 
-    # Compute overall data size metrics
-    num_pxl = width * height              # Total number of pixels
-    num_bits = num_pxl * bpp              # Total number of bits
-    num_bytes = num_bits // 8             # Total number of bytes
-    num_u32 = num_bytes // 4              # Total number of 32-bit words
+    return padded.reshape(round_y // meta_h, meta_h, round_x // meta_w, meta_w).transpose(0, 2, 1, 3).ravel()
 
-    # Number of metatiles that fit horizontally
-    num_metatiles_width = width // (meta_w * 8)
+def pack_index_plane(indices:np.ndarray, meta_w:int, meta_h:int, bpp:int) -> np.ndarray:
+    """
+    Packs a plane of palette indices into the GBA 1D tile stream. Tiles are ordered metatile by metatile
+    (left to right, top to bottom) and tile by tile inside each metatile, each tile row being packed into
+    32 / bpp pixels per word with the leftmost pixel in the lowest bits.
+    :param indices: (height, width) array of palette indices
+    :param meta_w: Number of tiles one meta tile's width consists of
+    :param meta_h: Number of tiles one meta tile's height consists of
+    :param bpp: The number of bits per pixel into a palette
+    :return: uint32 array of the packed words
+    """
+    height, width = indices.shape
 
-    # Pixel traversal state
-    y = 0
-    x_offset = y_offset = 0
+    # Pad with the transparent index so the plane is made of whole metatiles
+    round_width, round_height = padded_size(width, height, meta_w, meta_h)
+    if (round_width, round_height) != (width, height):
+        padded = np.zeros((round_height, round_width), dtype=indices.dtype)
+        padded[:height, :width] = indices
+        indices = padded
 
-    # Counters for tile, metatile, and pixel traversal
-    pxl_bit_count = pxl_row_count = meta_row_count = meta_col_count = 0
-    metatile_row_count = metatile_col_count = 0
-    total_meta_tiles = 0
+    metatile_rows = round_height // (meta_h * 8)
+    metatile_cols = round_width // (meta_w * 8)
 
-    # Output tile data as a flat list
-    tile_data_1d = []
+    # (metatile row, tile row, pixel row, metatile col, tile col, pixel col)
+    # -> (metatile row, metatile col, tile row, tile col, pixel row, pixel col)
+    tiles = indices.reshape(metatile_rows, meta_h, 8, metatile_cols, meta_w, 8).transpose(0, 3, 1, 4, 2, 5)
+
+    # Each group of 32 / bpp consecutive pixels in a tile row becomes one word
+    pixels_per_u32 = 32 // bpp
+    pixels = tiles.reshape(-1, pixels_per_u32).astype(np.uint32)
+    shifts = np.arange(pixels_per_u32, dtype=np.uint32) * bpp
+
+    return np.bitwise_or.reduce(pixels << shifts, axis=1).astype(np.uint32)
+
+def unpack_index_plane(words:np.ndarray, width:int, height:int, meta_w:int, meta_h:int, bpp:int) -> np.ndarray:
+    """
+    Unpacks a GBA 1D tile stream back into a plane of palette indices (the inverse of pack_index_plane).
+    :param words: uint32 array of the packed words (padded to whole metatiles like pack_index_plane makes them)
+    :param width: Width of the image in pixels
+    :param height: Height of the image in pixels
+    :param meta_w: Number of tiles one meta tile's width consists of
+    :param meta_h: Number of tiles one meta tile's height consists of
+    :param bpp: The number of bits per pixel into a palette
+    :return: (height, width) uint8 array of palette indices
+    """
+    round_width, round_height = padded_size(width, height, meta_w, meta_h)
+    metatile_rows = round_height // (meta_h * 8)
+    metatile_cols = round_width // (meta_w * 8)
 
-    # Number of pixels packed into a single 32-bit word
+    # Every word holds 32 / bpp pixels, leftmost pixel in the lowest bits
     pixels_per_u32 = 32 // bpp
+    shifts = np.arange(pixels_per_u32, dtype=np.uint32) * bpp
+    words = np.asarray(words, dtype=np.uint32)[:round_width * round_height // pixels_per_u32]
+    pixels = ((words[:, None] >> shifts) & ((1 << bpp) - 1)).astype(np.uint8)
+
+    # (metatile row, metatile col, tile row, tile col, pixel row, pixel col)
+    # -> (metatile row, tile row, pixel row, metatile col, tile col, pixel col)
+    tiles = pixels.reshape(metatile_rows, metatile_cols, meta_h, meta_w, 8, 8).transpose(0, 2, 4, 1, 3, 5)
+
+    return tiles.reshape(round_height, round_width)[:height, :width]
+
+def hex_to_words(tile_data:list) -> np.ndarray:
+    """
+    Parses tile data formatted by words_to_hex.
+    :param tile_data: List of "0x%08x" strings
+    :return: uint32 array of the words
+    """
+    return np.array([int(word, 16) for word in tile_data], dtype=np.uint32)
+
+def render_tile_data(tile_data:list, gba_palette:list, width:int, height:int, meta_w:int, meta_h:int,
+                     bpp:int) -> np.ndarray:
+    """
+    Decodes tile data into the colors the GBA would show.
+    :param tile_data: The packed tile data (uint32 hex strings or an uint32 array)
+    :param gba_palette: The palette of the tiles (RGB15)
+    :param width: Width of the image in pixels
+    :param height: Height of the image in pixels
+    :param meta_w: Number of tiles one meta tile's width consists of
+    :param meta_h: Number of tiles one meta tile's height consists of
+    :param bpp: The number of bits per pixel into a palette
+    :return: (height, width, 3) uint8 RGB array
+    """
+    if not isinstance(tile_data, np.ndarray):
+        tile_data = hex_to_words(tile_data)
+    indices = unpack_index_plane(tile_data, width, height, meta_w, meta_h, bpp)
+
+    # Indices past the end of the palette show as black like unset palette memory
+    palette = np.zeros(1 << bpp, dtype=np.uint32)
+    palette[:min(len(gba_palette), 1 << bpp)] = gba_palette[:1 << bpp]
+
+    return rgb15_array_to_rgb888(palette)[indices]
+
+def words_to_hex(words:np.ndarray) -> list:
+    """
+    Formats packed words the way they are written in the C output.
+    :param words: Array of packed u32 words
+    :return: List of "0x%08x" strings
+    """
+    return [f"0x{word:08x}" for word in words.tolist()]
+
+def create_tile_data_from_indices(indices:np.ndarray, meta_w:int, meta_h:int, bpp:int, hex_out:bool=True) -> list:
+    """
+    Creates the VRAM data of a plane of palette indices (e.g. the pixels of an indexed image).
+    :param indices: (height, width) array of palette indices
+    :param meta_w: Number of tiles one meta tile's width consists of
+    :param meta_h: Number of tiles one meta tile's height consists of
+    :param bpp: The number of bits per pixel into a palette
+    :param hex_out: If the data should be converted to HEX format
+    :return: A list of the created VRAM data
+    """
+    words = pack_index_plane(indices, meta_w, meta_h, bpp)
+
+    if hex_out:
+        return words_to_hex(words)
+    return words.tolist()
+
+def create_index_plane(img, conversion_table:dict) -> np.ndarray:
+    """
+    Converts every pixel of an image into its palette index.
+    :param img: Path to the input image (or the already loaded image)
+    :param conversion_table: Dictionary of RGB15 colors to palette indices
+    :return: (height, width) uint8 array of palette indices
+    """
+    pixels = np.asarray(open_rgb_image(img), dtype=np.uint8)
+
+    lut = np.zeros(1 << 15, dtype=np.uint8)
+    lut[np.fromiter(conversion_table.keys(), dtype=np.int64)] = np.fromiter(conversion_table.values(), dtype=np.int64)
+
+    return lut[rgb888_array_to_rgb15(pixels)]
+
+def create_tile_data(file_path:str, conversion_table:dict, meta_w:int, meta_h:int, bpp:int, hex_out:bool=True) -> list:
+    """
+    Takes the input image path and based on meta height and width separates them by GBA tiles (8x8 pixels)
+    and given a conversion table form rgb24 to rgb15, creates the VRAM data of palette indices.
+    :param file_path: Path to the input image (or the already loaded image)
+    :param conversion_table: Dictionary of rgb24 colors to rgb15 colors (native GBA color)
+    :param meta_w: Number of tiles one meta tile's width consists of
+    :param meta_h: Number of tiles one meta tile's height consists of
+    :param bpp: The number of bits per pixel into a palette
+    :param hex_out: If the data should be converted to HEX format
+    :return: A list of the created VRAM data
+    """
+    indices = create_index_plane(file_path, conversion_table)
 
-    # Number of bytes per pixel row segment (used implicitly)
-    bits_per_pixel_row = bpp // 4
-    # 8bpp -> 2
-    # 4bpp -> 1
-
-    try:
-        # Iterate over each 32-bit word of output data
-        for i in range(0, num_u32):  # Each U32 contains (32 / bpp) pixels
-            line_offset = 0
-
-            # Process one 8-pixel row of a tile in chunks
-            for j in range(0, 8, pixels_per_u32):
-                word = 0
-
-                # Pack palette indices into a 32-bit word
-                for x in range(pixels_per_u32):
-                    # Read the pixel from the image
-                    px = img.getpixel((x + x_offset + line_offset, y + y_offset))
-
-                    # Convert RGB24 -> RGB15 -> palette index
-                    idx = conversion_table[rgb24_to_rgb15(px)]
-
-                    # Shift palette index into the correct position
-                    shift = bpp * x
-                    word |= (idx << shift)
-
-                # Advance horizontally within the tile row
-                line_offset += pixels_per_u32
-
-                # Append the packed word to output (hex or raw integer)
-                if hex_out:
-                    tile_data_1d.append(f"0x{word:08x}")
-                else:
-                    tile_data_1d.append(word)
-
-            # Move to the next pixel row
-            y += 1
-            pxl_row_count += 1
-
-            # Finished an 8-pixel-high tile
-            if pxl_row_count % 8 == 0:
-                y = 0
-                meta_col_count += 1
-
-            # Finished a row of tiles within a metatile
-            if meta_col_count % meta_w == 0 and meta_col_count != 0:
-                meta_row_count += 1
-                meta_col_count = 0
-
-            # Finished a full metatile
-            if meta_row_count % meta_h == 0 and meta_row_count != 0:
-                total_meta_tiles += 1
-                metatile_col_count += 1
-                meta_row_count = 0
-
-            # Move to the next metatile row
-            if metatile_col_count % num_metatiles_width == 0 and metatile_col_count != 0:
-                metatile_row_count += 1
-                metatile_col_count = 0
-
-            # Compute the current pixel offsets based on tile and metatile position
-            x_offset = meta_col_count * 8 + metatile_col_count * meta_total_width
-            y_offset = meta_row_count * 8 + metatile_row_count * meta_total_height
-
-    except IndexError:
-        # Catch out-of-bounds access caused by misaligned traversal
-        print("ERROR: Out of bounds for", x_offset, y_offset, "on dimensions", width, height)
-
-    return tile_data_1d
+    return create_tile_data_from_indices(indices, meta_w, meta_h, bpp, hex_out)
@@ -1,14 +1,19 @@
 import os
+import shutil
 from PIL import Image as PILImage
 from datetime import datetime
 
 from .gba_utils import rgb15_to_rgb888
-from .tile_creator import create_tile_data
-from .deduper import dedupe_tiles
+from .tile_creator import padded_size
+from .deduper import EMPTY_TILE
 
 # Type alias for a loaded PIL image
 LoadedImage = PILImage.Image
 
+# C type of the emitted tile mapping entries and its size in bytes
+TILE_MAPPING_TYPE = "unsigned short"
+TILE_MAPPING_ENTRY_BYTES = 2
+
 def get_filename_from_path(file_path:str) -> str:
     """
     Extracts the filename from a file path.
@@ -23,13 +28,261 @@ def get_filename_from_path(file_path:str) -> str:
 
     return file_name
 
-def create_header_file(arguments:dict, image:LoadedImage, conversion_table:dict, gba_palette:list) -> None:
+def has_tile_mapping(arguments:dict) -> bool:
+    """
+    Determines if the unit's output has a tile mapping (made when deduping, eliding, using palette banks or
+    pooling a BG's palette).
+    :param arguments: Command line arguments
+    :return: True if a tile mapping is emitted
+    """
+    return bool(arguments["dedupe"] or arguments.get("palette_banks") or arguments.get("elide_empty")
+                or bg_pool_bank(arguments) is not None)
+
+def bg_pool_bank(arguments:dict) -> int:
+    """
+    :param arguments: Command line arguments
+    :return: The pooled palette bank the screen entries of a BG unit point at (None if it isn't a pooled BG)
+    """
+    if (arguments.get("pool_bank") is not None and arguments.get("layer") == "bg"
+            and arguments.get("mode", "tiles") != "sprite"):
+        return arguments["pool_bank"]
+    return None
+
+def tile_mapping_declaration(file_name:str, num_tiles:int, arguments:dict, gba_palette:list) -> str:
+    """
+    Creates the header declarations of the tile mapping (and the palette bank count when using palette banks).
+    :param file_name: Name of the unit
+    :param num_tiles: Number of tiles of the unit before deduping
+    :param arguments: Command line arguments
+    :param gba_palette: The palette of the unit (16 entries per bank when using palette banks)
+    :return: The declarations as a string
+    """
+    file_str = ""
+    if arguments.get("elide_empty"):
+        file_str += ("\n/**\n" +
+                     " * @brief The reserved tile index of fully transparent (elided) tiles in " +
+                     file_name + "TileMapping. \n" +
+                     " * \n" +
+                     " */\n")
+        file_str += "#define " + file_name + f"EmptyTile 0x{EMPTY_TILE:03x}\n"
+
+    file_str += ("\n/**\n" +
+                " * @brief The screen entries to create " + file_name + " from its Tiles (tile index in bits 0-9, \n" +
+                " * palette bank in bits 12-15). \n" +
+                " * \n" +
+                " */\n")
+    file_str += f"extern const {TILE_MAPPING_TYPE} " + file_name + f"TileMapping[{num_tiles}];\n"
+
+    if arguments.get("palette_banks"):
+        file_str += ("\n/**\n" +
+                     f" * @brief The number of 16 color palette banks {file_name}'s Palette holds. \n" +
+                     " * \n" +
+                     " */\n")
+        file_str += "#define " + file_name + f"PalBanks {len(gba_palette) // 16}\n"
+
+    return file_str
+
+def tile_mapping_array(file_name:str, tile_mapping:list) -> str:
+    """
+    Creates the C array of the tile mapping.
+    :param file_name: Name of the unit
+    :param tile_mapping: The screen entry of every tile
+    :return: The C array as a string
+    """
+    file_str = f"\nconst {TILE_MAPPING_TYPE} {file_name}TileMapping[{len(tile_mapping)}] = \n{{\n\t"
+    count = 0
+    for index in tile_mapping:
+        file_str += f"0x{index:04x}, "
+        count += 1
+        if count % 8 == 0 and count != 0:
+            file_str += "\n\t"
+    file_str = file_str[:file_str.rfind(',')]
+    file_str += "\n};\n"
+    return file_str
+
+def pool_bank_declaration(file_name:str, arguments:dict) -> str:
+    """
+    Creates the header define of the shared palette bank a unit uses when palettes are pooled.
+    :param file_name: Name of the unit
+    :param arguments: Command line arguments
+    :return: The define as a string (empty if the unit's palette isn't pooled)
+    """
+    if arguments.get("pool_bank") is None:
+        return ""
+
+    array_name = arguments["pool_name"] + arguments["layer"].capitalize() + "Pal"
+    file_str = ("\n/**\n" +
+                f" * @brief The bank of {array_name} (in {arguments['pool_name']}.h) {file_name} uses. \n" +
+                " * \n" +
+                " */\n")
+    file_str += "#define " + file_name + "PalBank " + str(arguments["pool_bank"]) + "\n"
+    return file_str
+
+def palette_array_size(gba_palette:list, bpp:int) -> int:
+    """
+    :param gba_palette: The palette of the unit
+    :param bpp: Bits per pixel
+    :return: Number of entries of the emitted palette array (2^bpp, or every bank when using palette banks)
+    """
+    return max(2**bpp, len(gba_palette))
+
+def variant_palette_declarations(file_name:str, variant_palettes:list, bpp:int) -> str:
+    """
+    Creates the header declarations of the palette variants.
+    :param file_name: Name of the unit
+    :param variant_palettes: The (name, palette) of every palette variant
+    :param bpp: Bits per pixel
+    :return: The declarations as a string
+    """
+    file_str = ""
+    for variant_name, palette in variant_palettes:
+        file_str += ("\n/**\n" +
+                     f" * @brief The {variant_name} variant of {file_name}'s Palette (uses the same Tiles). \n" +
+                     " */\n")
+        file_str += (f"extern const unsigned short {file_name}_{variant_name}Pal"
+                     f"[{palette_array_size(palette, bpp)}];\n")
+    return file_str
+
+def obj_palette_bank(arguments:dict) -> int:
+    """
+    :param arguments: Command line arguments
+    :return: The OBJ palette bank of a sprite (its pooled bank, 0 if it isn't pooled)
+    """
+    if arguments.get("pool_bank") is not None and arguments.get("layer") == "obj":
+        return arguments["pool_bank"]
+    return 0
+
+def sprite_obj_declarations(file_name:str, objs:list) -> str:
+    """
+    Creates the header declarations of a sprite's OBJ attribute table.
+    :param file_name: Name of the unit
+    :param objs: The SpriteObjs of the sprite
+    :return: The declarations as a string
+    """
+    file_str = ("\n/**\n" +
+                f" * @brief The number of OBJs {file_name} is made of. \n" +
+                " * \n" +
+                " */\n")
+    file_str += "#define " + file_name + "ObjCount " + str(len(objs)) + "\n"
+
+    file_str += ("\n/**\n" +
+                 f" * @brief Attributes 0, 1 and 2 of every OBJ of {file_name} (shape, size, tile index). The y/x \n" +
+                 " * fields hold the OBJ's offset from the sprite's top left, add the sprite's position to them. \n" +
+                 " */\n")
+    file_str += "extern const unsigned short " + file_name + f"ObjAttrs[{len(objs) * 3}];\n"
+    return file_str
+
+def sprite_obj_array(file_name:str, objs:list, bpp:int, palette_bank:int) -> str:
+    """
+    Creates the C array of a sprite's OBJ attribute table.
+    :param file_name: Name of the unit
+    :param objs: The SpriteObjs of the sprite
+    :param bpp: Bits per pixel
+    :param palette_bank: OBJ palette bank of the sprite
+    :return: The C array as a string
+    """
+    file_str = (f"\nconst unsigned short {file_name}ObjAttrs[{len(objs) * 3}] "
+                "__attribute__((aligned(4))) __attribute__((visibility(\"hidden\")))= \n{\n")
+    for obj in objs:
+        attrs = obj.attributes(bpp, palette_bank)
+        file_str += "\t" + ", ".join(f"0x{a:04x}" for a in attrs) + \
+                    f", // {obj.width * 8}x{obj.height * 8} at ({obj.x}, {obj.y})\n"
+    file_str += "};\n"
+    return file_str
+
+def animation_declarations(file_name:str, frame_tiles:int, deltas:list) -> str:
+    """
+    Creates the header declarations of an animation's frames and delta runs.
+    :param file_name: Name of the unit
+    :param frame_tiles: Number of tiles in one frame
+    :param deltas: The DeltaRuns of every frame transition
+    :return: The declarations as a string
+    """
+    num_runs = sum(len(runs) for runs in deltas)
+
+    file_str = ("\n/**\n" +
+                f" * @brief The number of frames of {file_name} and the tiles in each (its VRAM slots). \n" +
+                f" * {file_name}TileMapping holds the tile of every slot, frame after frame. \n" +
+                " * \n" +
+                " */\n")
+    file_str += "#define " + file_name + "FrameCount " + str(len(deltas)) + "\n"
+    file_str += "#define " + file_name + "FrameTiles " + str(frame_tiles) + "\n"
+
+    file_str += ("\n/**\n" +
+                 f" * @brief Where the runs of every frame transition start in {file_name}DeltaRuns (transition N, \n" +
+                 f" * frame N to N+1 looping back to 0, uses runs DeltaStarts[N] to DeltaStarts[N+1]). \n" +
+                 " * \n" +
+                 " */\n")
+    file_str += "extern const unsigned short " + file_name + f"DeltaStarts[{len(deltas) + 1}];\n"
+
+    file_str += ("\n/**\n" +
+                 f" * @brief The slots that change between frames as (slot, tile, count) runs, copy Tiles \n" +
+                 " * tile to tile+count-1 into slots slot to slot+count-1. \n" +
+                 " */\n")
+    file_str += "extern const unsigned short " + file_name + f"DeltaRuns[{max(num_runs, 1) * 3}];\n"
+    return file_str
+
+def animation_arrays(file_name:str, deltas:list) -> str:
+    """
+    Creates the C arrays of an animation's delta runs.
+    :param file_name: Name of the unit
+    :param deltas: The DeltaRuns of every frame transition
+    :return: The C arrays as a string
+    """
+    starts = [0]
+    for runs in deltas:
+        starts.append(starts[-1] + len(runs))
+
+    file_str = (f"\nconst unsigned short {file_name}DeltaStarts[{len(starts)}] "
+                "__attribute__((aligned(2))) __attribute__((visibility(\"hidden\")))= \n{\n")
+    for i in range(0, len(starts), 8):
+        file_str += "\t" + ", ".join(str(n) for n in starts[i:i + 8]) + ",\n"
+    file_str += "};\n"
+
+    file_str += (f"\nconst unsigned short {file_name}DeltaRuns[{max(starts[-1], 1) * 3}] "
+                 "__attribute__((aligned(2))) __attribute__((visibility(\"hidden\")))= \n{\n")
+    for n, runs in enumerate(deltas):
+        for run in runs:
+            file_str += f"\t{run.slot}, {run.tile}, {run.count}, // frame {n} to {(n + 1) % len(deltas)}\n"
+    if not starts[-1]:
+        file_str += "\t0, 0, 0, // no tiles change\n"
+    file_str += "};\n"
+    return file_str
+
+def palette_array(array_name:str, gba_palette:list, bpp:int) -> str:
+    """
+    Creates the C array of a palette.
+    :param array_name: Name of the array
+    :param gba_palette: The palette
+    :param bpp: Bits per pixel
+    :return: The C array as a string
+    """
+    file_str = (
+        f"\nconst unsigned short {array_name}[{palette_array_size(gba_palette, bpp)}] "
+        "__attribute__((aligned(2))) __attribute__((visibility(\"hidden\")))= \n{\n"
+    )
+
+    for i in range(0, len(gba_palette), 8):
+        line = gba_palette[i:i + 8]
+        line = (f"0x{n:04x}" for n in line)
+        file_str += "\t" + (", ".join(line)) + ",\n"
+
+    # Remove trailing comma
+    file_str = file_str[0:file_str.rfind(',')]
+    file_str += "\n};\n"
+    return file_str
+
+def create_header_file(arguments:dict, image:LoadedImage, gba_palette:list, variant_palettes:list = None,
+                       tile_count:int = None, objs:list = None, deltas:list = None) -> None:
     """
     Creates the header file for the tile output.
     :param arguments: Command line arguments
     :param image: The PIL image
-    :param conversion_table: Dictionary of rgb24 colors to rgb15 colors (native GBA color)
     :param gba_palette: The 2^bpp wide palette for the image (palette that will be in the GBA)
+    :param variant_palettes: The (name, palette) of every palette variant (None if there are none)
+    :param tile_count: Number of tiles in the tile data after deduping/eliding (None if every tile is kept)
+    :param objs: The SpriteObjs of the unit (None if not in sprite mode)
+    :param deltas: The DeltaRuns of every frame transition (None if not in animation mode)
     """
 
     # Extract metatile and color depth configuration
@@ -37,9 +290,8 @@ def create_header_file(arguments:dict, image:LoadedImage, conversion_table:dict,
     meta_h = arguments["meta_height"]
     bpp = arguments["bpp"]
 
-    # Extract image dimensions
-    img_w = image.width
-    img_h = image.height
+    # Extract image dimensions (padded to whole metatiles like the tile data)
+    img_w, img_h = padded_size(image.width, image.height, meta_w, meta_h)
 
     # Output destination and input paths
     dest = arguments["destination_path"]
@@ -52,15 +304,19 @@ def create_header_file(arguments:dict, image:LoadedImage, conversion_table:dict,
 
     # Calculate raw data sizes
     num_pxl = img_w * img_h
-    num_bits = num_pxl * bpp
-    num_bytes = num_bits // 8
-    num_u32 = num_bytes // 4
 
     # Calculate number of 8x8 tiles
     num_tiles = num_pxl // (8 * 8)
 
+    # Only the kept tiles are stored
+    stored_tiles = tile_count if tile_count is not None else num_tiles
+    num_bytes = stored_tiles * 8 * bpp
+    num_u32 = num_bytes // 4
+
     # File header comments and include guard
-    if arguments["dedupe"]:
+    if arguments.get("elide_empty"):
+        file_str = "// " + file_name + " on " + pal_name + " Palette; Empty Tiles Elided\n"
+    elif arguments["dedupe"]:
         file_str = "// " + file_name + " on " + pal_name + " Palette; Deduped\n"
     else:
         file_str = "// " + file_name + " on " + pal_name + " Palette\n"
@@ -84,7 +340,7 @@ def create_header_file(arguments:dict, image:LoadedImage, conversion_table:dict,
                  " * @brief The number of tiles to make " + file_name + ". \n" +
                  " * \n" +
                  " */\n")
-    file_str += "#define " + file_name + "TileAmount " + str(num_tiles) + "\n\n"
+    file_str += "#define " + file_name + "TileAmount " + str(stored_tiles) + "\n\n"
 
     # Tile data length macro
     file_str += ("/**\n" +
@@ -101,14 +357,20 @@ def create_header_file(arguments:dict, image:LoadedImage, conversion_table:dict,
                  " */\n")
     file_str += "extern const unsigned int " + file_name + "Tiles[" + str(num_u32) + "];\n"
 
-    if arguments["dedupe"]:
+    if has_tile_mapping(arguments):
         # External tile mapping data declaration
-        file_str += ("\n/**\n" +
-                     " * @brief The array of Tile indices to create " +
-                     file_name + " from other Tiles after deduping. \n" +
-                     " * \n" +
-                     " */\n")
-        file_str += "extern const unsigned int " + file_name + f"TileMapping[{num_tiles}];\n"
+        file_str += tile_mapping_declaration(file_name, num_tiles, arguments, gba_palette)
+
+    if objs is not None:
+        # OBJ attribute table declaration
+        file_str += sprite_obj_declarations(file_name, objs)
+
+    if deltas is not None:
+        # Frame and delta run declarations
+        file_str += animation_declarations(file_name, meta_w * meta_h, deltas)
+
+    # Shared palette bank if the palette is pooled
+    file_str += pool_bank_declaration(file_name, arguments)
 
     # Palette declarations if palette output is enabled
     if arguments["palette_included"]:
@@ -123,19 +385,28 @@ def create_header_file(arguments:dict, image:LoadedImage, conversion_table:dict,
                      " */\n")
         file_str += "extern const unsigned short " + file_name + "Pal[" + str(len(gba_palette)) + "];\n"
 
+    # Palette variant declarations
+    if variant_palettes:
+        file_str += variant_palette_declarations(file_name, variant_palettes, bpp)
+
     # Write the header file to disk
     new_file_name = f"{dest}/" if dest is not None else ""
     new_file_name += file_name + ".h"
     with open(new_file_name, "w") as file:
         file.write(file_str)
 
-def create_c_file(arguments:dict, image:LoadedImage, conversion_table:dict, gba_palette:list) -> None:
+def create_c_file(arguments:dict, image:LoadedImage, tile_data:list, tile_mapping:list, gba_palette:list,
+                  variant_palettes:list = None, objs:list = None, deltas:list = None) -> None:
     """
     Creates the C file for the tile output.
     :param arguments: Command line arguments
     :param image: The PIL image
-    :param conversion_table: Dictionary of rgb24 colors to rgb15 colors (native GBA color)
+    :param tile_data: The packed tile data (uint32 hex strings)
+    :param tile_mapping: The screen entry of every tile (None if not deduped and without palette banks)
     :param gba_palette: The 2^bpp wide palette for the image (palette that will be in the GBA)
+    :param variant_palettes: The (name, palette) of every palette variant (None if there are none)
+    :param objs: The SpriteObjs of the unit (None if not in sprite mode)
+    :param deltas: The DeltaRuns of every frame transition (None if not in animation mode)
     """
 
     # Extract metatile and color depth configuration
@@ -143,28 +414,18 @@ def create_c_file(arguments:dict, image:LoadedImage, conversion_table:dict, gba_
     meta_h = arguments["meta_height"]
     bpp    = arguments["bpp"]
 
-    # Extract image dimensions
-    img_w = image.width
-    img_h = image.height
+    # Extract image dimensions (padded to whole metatiles like the tile data)
+    img_w, img_h = padded_size(image.width, image.height, meta_w, meta_h)
 
     # Output destination and image path
     dest = arguments["destination_path"]
     file_path = arguments["image_path"]
 
-    # Generate tile data array
-    final_array = create_tile_data(file_path, conversion_table, meta_w, meta_h, bpp)
-    tile_mapping = None
-
-    if arguments["dedupe"]:
-        final_array, tile_mapping = dedupe_tiles(final_array, bpp)
-
     file_name = get_filename_from_path(file_path)
 
-    # Calculate data sizes
+    # Calculate data sizes (only the tiles kept after deduping/eliding are stored)
     num_pxl = img_w * img_h
-    num_bits = num_pxl * bpp
-    num_bytes = num_bits // 8
-    num_u32 = num_bytes // 4
+    num_u32 = len(tile_data)
 
     # Begin C array definition with alignment attributes
     file_str = (
@@ -174,8 +435,8 @@ def create_c_file(arguments:dict, image:LoadedImage, conversion_table:dict, gba_
 
     # Format output into readable blocks
     lc = 0
-    for i in range(0, len(final_array), 8):
-        line = final_array[i:i + 8]
+    for i in range(0, len(tile_data), 8):
+        line = tile_data[i:i + 8]
         file_str += "\t" + (", ".join(line)) + ",\n"
         lc += 1
 
@@ -185,42 +446,97 @@ def create_c_file(arguments:dict, image:LoadedImage, conversion_table:dict, gba_
 
     file_str += "};\n"
 
-    # If deduped add the tile_mapping table
-    if arguments["dedupe"]:
-        file_str += (
-            f"\nconst unsigned char {file_name}TileMapping[{num_pxl // (8*8)}] = \n{{\n\t"
-        )
-        count = 0
-        for index in tile_mapping:
-            file_str += f"{index}, "
-            count += 1
-            if count % 8 == 0 and count != 0:
-                file_str += "\n\t"
-        file_str = file_str[:-2]
-        file_str += "\n};\n"
+    file_str += c_file_tables(arguments, file_name, tile_mapping, gba_palette, variant_palettes, objs, deltas)
+
+    # Write the C file to disk
+    new_file_name = f"{dest}/" if dest is not None else ""
+    new_file_name += file_name + ".c"
+    with open(new_file_name, "w") as file:
+        file.write(file_str)
+
+def c_file_tables(arguments:dict, file_name:str, tile_mapping:list, gba_palette:list, variant_palettes:list = None,
+                  objs:list = None, deltas:list = None) -> str:
+    """
+    Creates the arrays that follow the tile data in the C file.
+    :param arguments: Command line arguments
+    :param file_name: Name of the unit
+    :param tile_mapping: The screen entry of every tile (None if not deduped and without palette banks)
+    :param gba_palette: The 2^bpp wide palette for the image (palette that will be in the GBA)
+    :param variant_palettes: The (name, palette) of every palette variant (None if there are none)
+    :param objs: The SpriteObjs of the unit (None if not in sprite mode)
+    :param deltas: The DeltaRuns of every frame transition (None if not in animation mode)
+    :return: The C arrays as a string
+    """
+    bpp = arguments["bpp"]
+    file_str = ""
+
+    # If deduped or using palette banks add the tile_mapping table
+    if tile_mapping is not None:
+        file_str += tile_mapping_array(file_name, tile_mapping)
+
+    # If sliced into OBJs add their attributes
+    if objs is not None:
+        file_str += sprite_obj_array(file_name, objs, bpp, obj_palette_bank(arguments))
+
+    # If animated add the delta runs between frames
+    if deltas is not None:
+        file_str += animation_arrays(file_name, deltas)
 
     # Append palette data if included
     if arguments["palette_included"]:
-        file_str += (
-            f"\nconst unsigned short {file_name}Pal[{2**bpp}] "
-            "__attribute__((aligned(2))) __attribute__((visibility(\"hidden\")))= \n{\n"
-        )
+        file_str += palette_array(f"{file_name}Pal", gba_palette, bpp)
 
-        for i in range(0, len(gba_palette), 8):
-            line = gba_palette[i:i + 8]
-            line = (f"0x{n:04x}" for n in line)
-            file_str += "\t" + (", ".join(line)) + ",\n"
+    # Append the palette variants
+    for variant_name, palette in variant_palettes or []:
+        file_str += palette_array(f"{file_name}_{variant_name}Pal", palette, bpp)
 
-        # Remove trailing comma
-        file_str = file_str[0:file_str.rfind(',')]
-        file_str += "\n};\n"
+    return file_str
 
+def tile_data_lines(words, line_count:int = 0) -> tuple[str, int]:
+    """
+    Formats packed words the way create_c_file writes them (8 per line, a blank line every 8 lines), so tile
+    data can be written a part at a time.
+    :param words: Array of packed u32 words (a whole number of lines, except for the last part)
+    :param line_count: Number of lines written before these words
+    :return: The formatted lines and the new number of lines
+    """
+    words = words.tolist()
+    file_str = ""
+    for i in range(0, len(words), 8):
+        file_str += "\t" + ", ".join(f"0x{word:08x}" for word in words[i:i + 8]) + ",\n"
+        line_count += 1
+
+        # Insert blank line every 8 rows
+        if line_count % 8 == 0:
+            file_str += "\n"
+
+    return file_str, line_count
+
+def create_streamed_c_file(arguments:dict, tile_lines_path:str, num_u32:int, tile_mapping:list, gba_palette:list,
+                           variant_palettes:list = None) -> None:
+    """
+    Creates the C file for the tile output from tile data that was formatted while it was converted.
+    :param arguments: Command line arguments
+    :param tile_lines_path: Path of the file holding the lines made by tile_data_lines
+    :param num_u32: Number of words in the tile data
+    :param tile_mapping: The screen entry of every tile (None if not deduped or elided)
+    :param gba_palette: The 2^bpp wide palette for the image (palette that will be in the GBA)
+    :param variant_palettes: The (name, palette) of every palette variant (None if there are none)
+    """
+    dest = arguments["destination_path"]
+    file_name = get_filename_from_path(arguments["image_path"])
 
-    # Write the C file to disk
     new_file_name = f"{dest}/" if dest is not None else ""
     new_file_name += file_name + ".c"
     with open(new_file_name, "w") as file:
-        file.write(file_str)
+        file.write(
+            "const unsigned int " + file_name + "Tiles[" + str(num_u32) + "] "
+            "__attribute__((aligned(4))) __attribute__((visibility(\"hidden\")))=\n{\n"
+        )
+        with open(tile_lines_path, "r") as tile_lines:
+            shutil.copyfileobj(tile_lines, file)
+        file.write("};\n")
+        file.write(c_file_tables(arguments, file_name, tile_mapping, gba_palette, variant_palettes))
 
 def create_palette_png(file_path:str, gba_pal:list, dest:str, bpp:int):
     """
@@ -231,26 +547,23 @@ def create_palette_png(file_path:str, gba_pal:list, dest:str, bpp:int):
     :param bpp: Bits per pixel
     """
 
-    # Determine the palette image dimensions (square)
+    # Determine the palette image dimensions (square, or one row per bank when using palette banks)
     side_length = 2 ** (bpp // 2)
-    pal_img = PILImage.new(mode="RGB", size=(side_length, side_length))
+    width, height = side_length, side_length
+    if len(gba_pal) > 2 ** bpp:
+        width, height = 16, len(gba_pal) // 16
+    pal_img = PILImage.new(mode="RGB", size=(width, height))
 
     # Pad palette to full size if needed
-    gba_pal = gba_pal + [0x0] * (2 ** bpp - len(gba_pal))
+    gba_pal = gba_pal + [0x0] * (width * height - len(gba_pal))
 
     # Write palette colors into the image
-    break_out = False
-    for i in range(side_length):
-        for j in range(side_length):
-            if i * side_length + j >= len(gba_pal):
-                break_out = True
-                break
+    for i in range(height):
+        for j in range(width):
             pal_img.putpixel(
                 (j, i),
-                rgb15_to_rgb888(gba_pal[i * side_length + j])
+                rgb15_to_rgb888(gba_pal[i * width + j])
             )
-        if break_out:
-            break
 
     # Save the palette PNG
     file_name = get_filename_from_path(file_path)
@@ -259,27 +572,31 @@ def create_palette_png(file_path:str, gba_pal:list, dest:str, bpp:int):
 
     pal_img.save(file_path)
 
-def make_output(arguments:dict, conversion_table:dict, gba_palette:list) -> None:
+def make_output(arguments:dict, image:LoadedImage, tile_data:list, tile_mapping:list, gba_palette:list,
+                variant_palettes:list = None, objs:list = None, deltas:list = None) -> None:
     """
     Creates the output files that the user indicated as wanted
     :param arguments: Dictionary of command line arguments
-    :param conversion_table: Dictionary of rgb24 colors to rgb15 colors (native GBA color)
+    :param image: The loaded source image
+    :param tile_data: The packed tile data (uint32 hex strings)
+    :param tile_mapping: The screen entry of every tile (None if not deduped and without palette banks)
     :param gba_palette: The 2^bpp wide palette for the image (palette that will be in the GBA)
+    :param variant_palettes: The (name, palette) of every palette variant (None if there are none)
+    :param objs: The SpriteObjs of the unit (None if not in sprite mode)
+    :param deltas: The DeltaRuns of every frame transition (None if not in animation mode)
     """
 
-    # Load the source image
-    img = PILImage.open(arguments["image_path"]).convert("RGB")
-
     # Determine which output files to generate
     output_type = arguments["output_type"]
 
     # Generate C source file if requested
     if output_type == "both" or output_type == "c":
-        create_c_file(arguments, img, conversion_table, gba_palette)
+        create_c_file(arguments, image, tile_data, tile_mapping, gba_palette, variant_palettes, objs, deltas)
 
     # Generate header file if requested
     if output_type == "both" or output_type == "h":
-        create_header_file(arguments, img, conversion_table, gba_palette)
+        create_header_file(arguments, image, gba_palette, variant_palettes, len(tile_data) // (2 * arguments["bpp"]), objs,
+                           deltas)
 
     # Generate palette preview PNG if enabled
     if arguments["generate_palette"]:
@@ -0,0 +1,130 @@
+import json
+import os
+from dataclasses import dataclass
+from fnmatch import fnmatch
+from pathlib import Path
+
+from .config import read_toml
+
+
+@dataclass(frozen=True)
+class UnitLocation:
+    """
+    Where a unit is defined.
+
+    :param name: Name of the unit.
+    :param toml_path: Path of the pix2gba.toml defining it.
+    :param position: Index of the unit's entry in the TOML's `[[unit]]` list.
+    """
+    name: str
+    toml_path: Path
+    position: int
+
+
+def build_unit_index(build_roots: list[Path]) -> dict[str, list[UnitLocation]]:
+    """
+    Indexes every unit of the discovered projects by name.
+    :param build_roots: List of directories containing pix2gba.toml files
+    :return: Dictionary of unit name to every place it is defined
+    """
+    index: dict[str, list[UnitLocation]] = {}
+    for build_root in build_roots:
+        toml_path = build_root / "pix2gba.toml"
+        for position, element in enumerate(read_toml(toml_path).get("unit", [])):
+            if "name" in element:
+                index.setdefault(element["name"], []).append(UnitLocation(element["name"], toml_path, position))
+    return index
+
+
+def duplicate_units(index: dict[str, list[UnitLocation]]) -> dict[str, list[UnitLocation]]:
+    """
+    :param index: The unit index
+    :return: The units defined more than once, with every place they are defined
+    """
+    return {name: locations for name, locations in index.items() if len(locations) > 1}
+
+
+def lookup_unit(index: dict[str, list[UnitLocation]], unit_name: str) -> list[UnitLocation]:
+    """
+    Finds a unit in the index, checking its TOMLs still define it where the index says.
+    :param index: The unit index
+    :param unit_name: Name of the unit
+    :return: Every place the unit is defined (empty if it isn't indexed or the index is out of date)
+    """
+    locations = index.get(unit_name, [])
+    for location in locations:
+        toml_data = read_toml(location.toml_path)
+        units = toml_data.get("unit", []) if toml_data is not None else []
+        if location.position >= len(units) or units[location.position].get("name") != unit_name:
+            return []
+    return locations
+
+
+def is_unit_glob(pattern: str) -> bool:
+    """
+    :param pattern: A unit name or glob
+    :return: If the pattern has glob characters (a glob can match units the index doesn't know about yet)
+    """
+    return any(char in pattern for char in "*?[")
+
+
+def _toml_stat(toml_path: Path) -> list[int]:
+    """
+    :param toml_path: Path of a pix2gba.toml
+    :return: The mtime (ns) and size of the TOML (None if it is missing)
+    """
+    try:
+        stat = os.stat(toml_path)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def select_unit_names(index: dict[str, list[UnitLocation]], patterns: list[str]) -> list[str]:
+    """
+    :param index: The unit index
+    :param patterns: Unit names or globs (e.g. `enemy_*`)
+    :return: The names of the indexed units matching any of the patterns
+    """
+    return [name for name in index if any(fnmatch(name, pattern) for pattern in patterns)]
+
+
+def save_unit_index(index: dict[str, list[UnitLocation]], index_path: Path) -> None:
+    """
+    Saves the unit index for the next commands, with the mtime and size of every TOML it was read from.
+    :param index: The unit index
+    :param index_path: Path of the JSON index
+    :return: None
+    """
+    toml_paths = {location.toml_path for locations in index.values() for location in locations}
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(index_path, "w") as file:
+        json.dump({
+            "tomls": {str(toml_path): _toml_stat(toml_path) for toml_path in toml_paths},
+            "units": {
+                name: [{"toml": str(location.toml_path), "position": location.position} for location in locations]
+                for name, locations in index.items()
+            }
+        }, file)
+
+
+def load_unit_index(index_path: Path) -> dict[str, list[UnitLocation]]:
+    """
+    Loads the unit index saved by an earlier command.
+    :param index_path: Path of the JSON index
+    :return: The unit index (None if there is none or one of its TOMLs changed since it was saved)
+    """
+    try:
+        with open(index_path, "r") as file:
+            data = json.load(file)
+        tomls, units = data["tomls"], data["units"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+    if any(_toml_stat(Path(toml_path)) != stat for toml_path, stat in tomls.items()):
+        return None
+
+    return {
+        name: [UnitLocation(name, Path(location["toml"]), location["position"]) for location in locations]
+        for name, locations in units.items()
+    }
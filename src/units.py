@@ -2,6 +2,22 @@ from dataclasses import dataclass
 from pathlib import Path
 
 
+@dataclass(frozen=True)
+class VramScene:
+    """
+    Units that are in VRAM at the same time, planned together so their tiles don't overlap.
+
+    :param name: Name of the scene (used for the scene's header of base tile indices).
+    :param units: Names of the units in the scene (from the same TOML).
+    :param obj_mapping: OBJ VRAM mapping the game uses (`1d` or `2d`).
+    :param charblocks: Charblocks the BG units' tiles may be placed in.
+    """
+    name: str
+    units: tuple
+    obj_mapping: str = "1d"
+    charblocks: tuple = (0, 1, 2, 3)
+
+
 @dataclass(frozen=True)
 class ConversionConfig:
     """
@@ -12,12 +28,20 @@ class ConversionConfig:
     :param output_type: Output format selector (e.g., 'c', 'h', or 'both').
     :param root_dir: Root directory used for resolving relative paths.
     :param output_dir: Directory where generated files will be written.
+    :param rom_budget: Max ROM bytes all units of the config may use (None for no budget).
+    :param vram_budget: Max VRAM bytes all units of the config may use (None for no budget).
+    :param palette_pool: Name of the shared palette the auto-generated palettes are pooled into (None to not pool).
+    :param scenes: The VramScenes of the config.
     """
     bpp: int
     transparent: str
     output_type: str
     root_dir: Path
     output_dir: Path
+    rom_budget: int = None
+    vram_budget: int = None
+    palette_pool: str = None
+    scenes: tuple = ()
 
 
 @dataclass(frozen=True)
@@ -33,6 +57,14 @@ class ConversionUnit:
     :param palette_include: Whether the palette should be emitted in output.
     :param generate_palette: Whether to generate a PNG palette preview.
     :param compress: Whether to apply compression to generated output.
+    :param palette_banks: Max number of 16 color palettes the tiles are split over (0 for a single palette).
+    :param layer: Layer the unit is shown on (`bg` or `obj`), picks the palette memory when pooling palettes.
+    :param variants: Paths to palette images of color variants that reuse the unit's tiles.
+    :param elide_empty: Whether to drop fully transparent tiles (they map to a reserved empty tile index).
+    :param mode: How the image is output (`tiles`, `sprite` to slice it into hardware OBJs, `bitmap` or `animation`).
+    :param bitmap_mode: Bitmap mode (3, 4 or 5) of a unit in `bitmap` mode.
+    :param frame_width: Width of one frame (pixels) of a unit in `animation` mode.
+    :param frame_height: Height of one frame (pixels) of a unit in `animation` mode.
     """
     config: ConversionConfig
     name: str
@@ -43,6 +75,14 @@ class ConversionUnit:
     generate_palette: bool
     compress: bool
     dedupe: bool
+    palette_banks: int = 0
+    layer: str = "bg"
+    variants: tuple = ()
+    elide_empty: bool = False
+    mode: str = "tiles"
+    bitmap_mode: int = 3
+    frame_width: int = 0
+    frame_height: int = 0
 
 
 @dataclass(frozen=False)
@@ -73,3 +113,55 @@ class VerificationStats:
     successful_units: int
     failed_unit_names: list[str]
     unit_error_code: list[int]
+
+
+@dataclass(frozen=False)
+class UnitReport:
+    """
+    Sizes of the data produced when converting a unit (used for the build report and size budgets).
+
+    :param name: Name of the unit.
+    :param bpp: Bits per pixel of the tile data.
+    :param raw_bytes: Bytes of tile data before deduping and compression.
+    :param tile_count: Number of 8x8 tiles before deduping.
+    :param elided_tile_count: Number of fully transparent tiles dropped from the tile data.
+    :param deduped_tile_count: Number of 8x8 tiles after eliding and deduping (same as tile_count if neither ran).
+    :param tile_bytes: Bytes of tile data after deduping (what is loaded into VRAM).
+    :param compressed_bytes: Bytes of the compressed stream (0 if not compressed).
+    :param palette_size: Number of colors in the palette.
+    :param palette_bytes: Bytes of palette data emitted (0 if the palette isn't included).
+    :param palette_banks: Number of 16 color palette banks used (0 if the unit has a single palette).
+    :param variant_count: Number of palette variants emitted (their palettes are counted in palette_bytes).
+    :param lossy_tiles: Number of tiles whose colors didn't all fit in their palette bank.
+    :param obj_count: Number of OBJs the sprite was sliced into (0 if not in sprite mode).
+    :param frame_count: Number of frames of an animation (0 if not in animation mode).
+    :param delta_tiles: Number of tiles copied over a whole loop of an animation's delta frames.
+    :param tile_base: Index of the unit's first tile in its charblock or OBJ VRAM (0 if not in a scene).
+    :param mapping_size: Number of entries in the tile mapping (0 if there is none).
+    :param mapping_bytes: Bytes of tile mapping data emitted.
+    :param rom_bytes: Total bytes the unit's output adds to the ROM.
+    :param vram_bytes: Total bytes the unit's tiles take in VRAM once loaded.
+    :param build_time: Wall time taken to convert the unit (seconds).
+    """
+    name: str
+    bpp: int = 0
+    raw_bytes: int = 0
+    tile_count: int = 0
+    elided_tile_count: int = 0
+    deduped_tile_count: int = 0
+    tile_bytes: int = 0
+    compressed_bytes: int = 0
+    palette_size: int = 0
+    palette_bytes: int = 0
+    palette_banks: int = 0
+    lossy_tiles: int = 0
+    variant_count: int = 0
+    obj_count: int = 0
+    frame_count: int = 0
+    delta_tiles: int = 0
+    tile_base: int = 0
+    mapping_size: int = 0
+    mapping_bytes: int = 0
+    rom_bytes: int = 0
+    vram_bytes: int = 0
+    build_time: float = 0.0
@@ -1,9 +1,14 @@
-import os
-from pathlib import Path
+import numpy as np
 from PySide6 import QtCore, QtGui, QtWidgets
 from PySide6.QtCore import Qt
 
-from .gba_utils import rgb15_to_rgb888, rgb888_to_hex
+from .tile_creator import render_tile_data
+
+# Largest zoom the zoom control allows
+MAX_ZOOM = 16
+
+# Size (pixels) the window tries to show the unit at when it opens
+FIT_SIZE = 1024
 
 
 class OutputWindow(QtWidgets.QMainWindow):
@@ -11,7 +16,7 @@ class OutputWindow(QtWidgets.QMainWindow):
     Visualization window for rendered GBA tile and palette data.
 
     This window reconstructs pixel output from packed tile data and a GBA
-    palette, displaying the result using Qt drawing primitives. It is intended
+    palette, decoding the whole tile stream at once into an image. It is intended
     as a debugging and verification tool for tile conversion output.
 
     The renderer respects metatile layout and bit-depth when reconstructing
@@ -41,14 +46,27 @@ class OutputWindow(QtWidgets.QMainWindow):
         """
         super().__init__()
 
-        # Qt display setup
+        # Qt display setup, large units scroll
         self.label = QtWidgets.QLabel()
-        self.canvas = QtGui.QPixmap(pxl_width, pxl_height)
-        self.canvas.fill(Qt.white)
-        self.label.setPixmap(self.canvas)
-        self.setCentralWidget(self.label)
+        self.scroll_area = QtWidgets.QScrollArea()
+        self.scroll_area.setWidget(self.label)
+        self.scroll_area.setAlignment(Qt.AlignCenter)
+        self.setCentralWidget(self.scroll_area)
         self.setWindowTitle("Visualizer")
 
+        # Zoom control, starting at the biggest zoom (up to 8x) that fits on screen
+        self.zoom = QtWidgets.QSpinBox()
+        self.zoom.setRange(1, MAX_ZOOM)
+        self.zoom.setSuffix("x")
+        self.zoom.setValue(max(1, min(8, FIT_SIZE // max(pxl_width, pxl_height, 1))))
+        self.zoom.valueChanged.connect(self.show_zoomed)
+
+        toolbar = self.addToolBar("Zoom")
+        toolbar.addWidget(QtWidgets.QLabel(" Zoom: "))
+        toolbar.addWidget(self.zoom)
+        QtGui.QShortcut(QtGui.QKeySequence.ZoomIn, self, lambda: self.zoom.stepBy(1))
+        QtGui.QShortcut(QtGui.QKeySequence.ZoomOut, self, lambda: self.zoom.stepBy(-1))
+
         # Store rendering data
         self.tile_data = tile_data
         self.pal_data = pal_data
@@ -57,94 +75,38 @@ class OutputWindow(QtWidgets.QMainWindow):
         self.pxl_height = pxl_height
         self.meta_width = meta_width
         self.meta_height = meta_height
+        self.image = None
 
     def render(self) -> None:
         """
-        Renders the tile data to the canvas using the provided palette.
+        Renders the tile data using the provided palette.
+
+        The whole tile stream is unpacked and converted to colors in bulk,
+        then wrapped in a single QImage that is shown at the selected zoom.
+        """
+        pixels = render_tile_data(self.tile_data, self.pal_data, self.pxl_width, self.pxl_height,
+                                  self.meta_width, self.meta_height, self.bpp)
+        pixels = np.ascontiguousarray(pixels)
+
+        # QImage doesn't own the buffer, copy it so the array can be freed
+        self.image = QtGui.QImage(pixels.data, self.pxl_width, self.pxl_height, self.pxl_width * 3,
+                                  QtGui.QImage.Format_RGB888).copy()
+        self.show_zoomed()
 
-        Tile data is unpacked according to the configured bit depth and drawn
-        pixel-by-pixel while respecting tile, metatile, and image layout.
-        The final output is scaled up for easier viewing.
+    def show_zoomed(self) -> None:
+        """
+        Shows the rendered image scaled by the zoom control (nearest neighbor, so pixels stay sharp).
         """
-        canvas = self.label.pixmap()
-        painter = QtGui.QPainter(canvas)
-
-        pen = QtGui.QPen()
-        pen.setWidth(1)
-
-        # Metatile layout calculations
-        num_metatiles_width = self.pxl_width // (self.meta_width * 8)
-        meta_total_width = self.meta_width * 8
-        meta_total_height = self.meta_height * 8
-
-        # Position tracking
-        y = 0
-        x_offset = y_offset = 0
-        pxl_row_count = meta_row_count = meta_col_count = 0
-        metatile_row_count = metatile_col_count = 0
-        total_meta_tiles = 0
-
-        # Bit unpacking helpers
-        pxl_per_u32 = 32 // self.bpp
-        pxl_mask = (1 << self.bpp) - 1
-
-        # Iterate over each packed 32-bit word
-        for u32_hex in self.tile_data:
-            u32 = int(u32_hex, 16)
-
-            # Extract pixels from the packed word
-            for pxl in range(pxl_per_u32):
-                pal_index = (u32 >> (pxl * self.bpp)) & pxl_mask
-                r, g, b = rgb15_to_rgb888(self.pal_data[pal_index])
-
-                pen.setColor(QtGui.QColor(r, g, b))
-                painter.setPen(pen)
-                painter.fillRect(
-                    x_offset + pxl,
-                    y + y_offset,
-                    1,
-                    1,
-                    QtGui.QColor(r, g, b),
-                )
-
-            # Advance within tile rows
-            y += 1
-            pxl_row_count += 1
-
-            # Move to next tile column after 8 rows
-            if pxl_row_count % 8 == 0:
-                y = 0
-                meta_col_count += 1
-
-            # Move to next metatile row
-            if meta_col_count % self.meta_width == 0 and meta_col_count != 0:
-                meta_row_count += 1
-                meta_col_count = 0
-
-            # Move to next metatile
-            if meta_row_count % self.meta_height == 0 and meta_row_count != 0:
-                total_meta_tiles += 1
-                metatile_col_count += 1
-                meta_row_count = 0
-
-            # Wrap to next metatile row
-            if metatile_col_count % num_metatiles_width == 0 and metatile_col_count != 0:
-                metatile_row_count += 1
-                metatile_col_count = 0
-
-            # Update pixel offsets
-            x_offset = meta_col_count * 8 + metatile_col_count * meta_total_width
-            y_offset = meta_row_count * 8 + metatile_row_count * meta_total_height
-
-        painter.end()
-
-        # Scale up the final image for visibility
-        scale = 8
-        scaled = canvas.scaled(
-            self.pxl_width * scale,
-            self.pxl_height * scale,
+        if self.image is None:
+            return
+
+        zoom = self.zoom.value()
+        scaled = self.image.scaled(
+            self.pxl_width * zoom,
+            self.pxl_height * zoom,
             Qt.IgnoreAspectRatio,
             Qt.FastTransformation,
         )
-
-        self.label.setPixmap(scaled)
+        self.label.setPixmap(QtGui.QPixmap.fromImage(scaled))
+        self.label.resize(scaled.size())
+        self.resize(min(scaled.width() + 40, FIT_SIZE + 40), min(scaled.height() + 80, FIT_SIZE + 80))
@@ -0,0 +1,317 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+
+import numpy as np
+
+# Size of one of the four BG charblocks
+CHARBLOCK_BYTES = 0x4000
+BG_CHARBLOCKS = 4
+
+# OBJ VRAM starts after the BG charblocks, its tile indices count 32 byte units in both color modes
+OBJ_VRAM_OFFSET = 0x10000
+OBJ_VRAM_BYTES = 0x8000
+OBJ_TILE_BYTES = 32
+
+# Width (in 32 byte units) of the OBJ tile matrix in 2D mapping
+OBJ_2D_WIDTH = 32
+
+# Tile indices (screen entries and OBJ attribute 2) are 10 bits
+MAX_TILE_INDEX = 1024
+
+OBJ_MAPPINGS = [
+    "1d",
+    "2d"
+]
+
+
+@dataclass(frozen=True)
+class VramRequest:
+    """
+    The VRAM a unit's tiles need.
+
+    :param name: Name of the unit.
+    :param layer: Layer of the unit (`bg` or `obj`).
+    :param bpp: Bits per pixel of the tiles.
+    :param tile_count: Number of tiles in the unit's final (deduped) tile data.
+    :param tiles_x: Width of the unit's image in tiles (2D OBJ mapping only).
+    :param tiles_y: Height of the unit's image in tiles (2D OBJ mapping only).
+    :param row_major: If the tiles are the image's tiles in row major order (needed for 2D OBJ mapping).
+    :param reserve_empty: If the unit's mapping uses the reserved empty tile index (0x3FF).
+    """
+    name: str
+    layer: str
+    bpp: int
+    tile_count: int
+    tiles_x: int = 0
+    tiles_y: int = 0
+    row_major: bool = True
+    reserve_empty: bool = False
+
+    @property
+    def tile_bytes(self) -> int:
+        return 8 * self.bpp
+
+    @property
+    def size(self) -> int:
+        return self.tile_count * self.tile_bytes
+
+    @property
+    def max_bg_tiles(self) -> int:
+        """
+        :return: How many tiles a BG's screen entries can index (the empty tile index isn't one of them)
+        """
+        return MAX_TILE_INDEX - 1 if self.reserve_empty else MAX_TILE_INDEX
+
+
+@dataclass(frozen=True)
+class VramPlacement:
+    """
+    Where a unit's tiles go in VRAM.
+
+    :param name: Name of the unit.
+    :param layer: Layer of the unit (`bg` or `obj`).
+    :param tile_base: Index of the unit's first tile (in its charblock for BG, in OBJ VRAM for OBJ).
+    :param char_block: Charblock the BG's tile indices count from (-1 for OBJ units).
+    :param address: Byte offset of the unit's first tile from the start of VRAM.
+    :param size: Bytes the unit's tiles take.
+    """
+    name: str
+    layer: str
+    tile_base: int
+    char_block: int
+    address: int
+    size: int
+
+
+@dataclass(frozen=False)
+class VramPlan:
+    """
+    Placement of every unit of a scene in VRAM.
+
+    :param scene: Name of the scene.
+    :param obj_mapping: OBJ VRAM mapping of the scene (`1d` or `2d`).
+    :param placements: Dictionary of unit name to its VramPlacement (in placing order).
+    :param errors: Why units couldn't be placed (the scene doesn't fit if there are any).
+    :param bg_bytes: Bytes of the charblocks used by BG tiles.
+    :param bg_capacity: Bytes of the charblocks the scene may use.
+    :param obj_bytes: Bytes of OBJ VRAM used.
+    """
+    scene: str
+    obj_mapping: str
+    placements: dict = field(default_factory=dict)
+    errors: list = field(default_factory=list)
+    bg_bytes: int = 0
+    bg_capacity: int = 0
+    obj_bytes: int = 0
+
+    @property
+    def obj_capacity(self) -> int:
+        return OBJ_VRAM_BYTES
+
+
+def _charblock_regions(charblocks: tuple) -> list[list[int]]:
+    """
+    Merges neighboring charblocks into regions tiles can run across.
+    :param charblocks: The charblocks the scene may use
+    :return: [start, end) byte range of every region
+    """
+    regions = []
+    for block in sorted(set(charblocks)):
+        start = block * CHARBLOCK_BYTES
+        if regions and regions[-1][1] == start:
+            regions[-1][1] += CHARBLOCK_BYTES
+        else:
+            regions.append([start, start + CHARBLOCK_BYTES])
+    return regions
+
+
+def _place_bg(request: VramRequest, regions: list, cursors: list) -> VramPlacement:
+    """
+    Places BG tiles at the first spot of a region they fit in. The tiles may run into the next charblock as long
+    as the last one is still reachable from the charblock the BG's tile indices count from.
+    :param request: The unit's VramRequest
+    :param regions: [start, end) of every charblock region
+    :param cursors: First free byte of every region (updated)
+    :return: The VramPlacement (None if the tiles don't fit)
+    """
+    tile_bytes = request.tile_bytes
+    max_tiles = request.max_bg_tiles
+
+    for r, (start, end) in enumerate(regions):
+        address = -(-cursors[r] // tile_bytes) * tile_bytes
+        char_block = address // CHARBLOCK_BYTES
+
+        # Tile indices only reach so far past the charblock base, start over at the next charblock
+        if (address - char_block * CHARBLOCK_BYTES) // tile_bytes + request.tile_count > max_tiles:
+            char_block += 1
+            address = char_block * CHARBLOCK_BYTES
+
+        if address + request.size <= end:
+            cursors[r] = address + request.size
+            return VramPlacement(
+                name=request.name,
+                layer="bg",
+                tile_base=(address - char_block * CHARBLOCK_BYTES) // tile_bytes,
+                char_block=char_block,
+                address=address,
+                size=request.size
+            )
+
+    return None
+
+
+def _place_obj_1d(request: VramRequest, cursor: int) -> VramPlacement:
+    """
+    Places OBJ tiles right after the previous unit's (8bpp tiles start on an even index).
+    :param request: The unit's VramRequest
+    :param cursor: First free 32 byte unit of OBJ VRAM
+    :return: The VramPlacement (None if the tiles don't fit)
+    """
+    units = request.bpp // 4
+    tile_base = -(-cursor // units) * units
+    if (tile_base + request.tile_count * units) * OBJ_TILE_BYTES > OBJ_VRAM_BYTES:
+        return None
+
+    return VramPlacement(
+        name=request.name,
+        layer="obj",
+        tile_base=tile_base,
+        char_block=-1,
+        address=OBJ_VRAM_OFFSET + tile_base * OBJ_TILE_BYTES,
+        size=request.size
+    )
+
+
+def _place_obj_2d(request: VramRequest, occupied: np.ndarray) -> VramPlacement:
+    """
+    Places an OBJ unit's image as a rectangle at the first free spot of the 32x32 OBJ tile matrix.
+    :param request: The unit's VramRequest
+    :param occupied: (32, 32) bool array of the used 32 byte units (updated)
+    :return: The VramPlacement (None if the tiles don't fit)
+    """
+    units = request.bpp // 4
+    width, height = request.tiles_x * units, request.tiles_y
+    rows, cols = occupied.shape
+
+    for y in range(rows - height + 1):
+        for x in range(0, cols - width + 1, units):
+            if occupied[y:y + height, x:x + width].any():
+                continue
+
+            occupied[y:y + height, x:x + width] = True
+            tile_base = y * OBJ_2D_WIDTH + x
+            return VramPlacement(
+                name=request.name,
+                layer="obj",
+                tile_base=tile_base,
+                char_block=-1,
+                address=OBJ_VRAM_OFFSET + tile_base * OBJ_TILE_BYTES,
+                size=width * height * OBJ_TILE_BYTES
+            )
+
+    return None
+
+
+def plan_scene(name: str, requests: list[VramRequest], obj_mapping: str = "1d",
+               charblocks: tuple = (0, 1, 2, 3)) -> VramPlan:
+    """
+    Packs the tiles of every unit of a scene into the charblocks (BG) and OBJ VRAM, in the order given.
+    :param name: Name of the scene
+    :param requests: VramRequest of every unit
+    :param obj_mapping: OBJ VRAM mapping the game uses (`1d` or `2d`)
+    :param charblocks: Charblocks the BG tiles may use (the rest are left for screenblocks)
+    :return: The VramPlan (check its errors before using it)
+    """
+    plan = VramPlan(scene=name, obj_mapping=obj_mapping, bg_capacity=len(set(charblocks)) * CHARBLOCK_BYTES)
+
+    regions = _charblock_regions(charblocks)
+    cursors = [start for start, _ in regions]
+    obj_cursor = 0
+    obj_occupied = np.zeros((OBJ_VRAM_BYTES // OBJ_TILE_BYTES // OBJ_2D_WIDTH, OBJ_2D_WIDTH), dtype=bool)
+
+    for request in requests:
+        if request.layer == "bg":
+            # Past this the tile indices run into the flip bits, no charblock base can help
+            if request.tile_count > request.max_bg_tiles:
+                plan.errors.append(f"`{request.name}` has {request.tile_count} tiles, its screen entries can only "
+                                   f"index {request.max_bg_tiles}")
+                continue
+            placement = _place_bg(request, regions, cursors)
+            if placement is None:
+                plan.errors.append(f"`{request.name}` ({request.size} bytes) doesn't fit in charblocks "
+                                   f"{', '.join(str(b) for b in sorted(set(charblocks)))}")
+                continue
+            plan.bg_bytes += placement.size
+
+        elif obj_mapping == "2d":
+            if not request.row_major:
+                plan.errors.append(f"`{request.name}` needs its tiles in image order for 2D OBJ mapping "
+                                   f"(1x1 metatiles, no dedupe, elide_empty or sprite mode)")
+                continue
+            placement = _place_obj_2d(request, obj_occupied)
+            if placement is None:
+                plan.errors.append(f"`{request.name}` ({request.tiles_x}x{request.tiles_y} tiles) doesn't fit in "
+                                   f"the free space of the 2D OBJ tile matrix")
+                continue
+            plan.obj_bytes += placement.size
+
+        else:
+            placement = _place_obj_1d(request, obj_cursor)
+            if placement is None:
+                plan.errors.append(f"`{request.name}` ({request.size} bytes) doesn't fit in the "
+                                   f"{OBJ_VRAM_BYTES - obj_cursor * OBJ_TILE_BYTES} bytes of OBJ VRAM left")
+                continue
+            obj_cursor = placement.tile_base + request.tile_count * (request.bpp // 4)
+            plan.obj_bytes = obj_cursor * OBJ_TILE_BYTES
+
+        plan.placements[request.name] = placement
+
+    return plan
+
+
+def write_vram_header(plan: VramPlan, destination) -> None:
+    """
+    Creates the header with the charblock, base tile index and VRAM offset of every unit of a scene.
+    :param plan: The VramPlan of the scene (without errors)
+    :param destination: The output directory
+    :return: None
+    """
+    name = plan.scene
+
+    header_str = "// VRAM layout of " + name + "\n"
+    header_str += "#pragma once\n\n"
+    header_str += ("//======================================================================\n" +
+                   "//	" + name + ", " + str(len(plan.placements)) + " units\n" +
+                   "//\t+ BG  : " + str(plan.bg_bytes) + " / " + str(plan.bg_capacity) + " bytes\n" +
+                   "//\t+ OBJ : " + str(plan.obj_bytes) + " / " + str(plan.obj_capacity) + " bytes (" +
+                   plan.obj_mapping.upper() + " mapping)\n" +
+                   "//\t" + str(datetime.now()) + "\n" +
+                   "//======================================================================\n")
+
+    for placement in plan.placements.values():
+        unit_name = placement.name
+        header_str += "\n"
+        if placement.layer == "bg":
+            header_str += ("/**\n" +
+                           f" * @brief The charblock (character base block) {unit_name}'s tile indices count from. \n" +
+                           " * \n" +
+                           " */\n")
+            header_str += "#define " + unit_name + "CharBlock " + str(placement.char_block) + "\n\n"
+            where = "its charblock"
+        else:
+            where = "OBJ VRAM (32 byte units)"
+
+        header_str += ("/**\n" +
+                       f" * @brief Index of {unit_name}'s first tile in {where}, already added to its mapping. \n" +
+                       " * \n" +
+                       " */\n")
+        header_str += "#define " + unit_name + "TileBase " + str(placement.tile_base) + "\n\n"
+        header_str += ("/**\n" +
+                       f" * @brief Byte offset of {unit_name}'s tiles from the start of VRAM. \n" +
+                       " * \n" +
+                       " */\n")
+        header_str += "#define " + unit_name + "VramOffset " + f"0x{placement.address:05x}" + "\n"
+
+    base_name = f"{destination}/" if destination is not None else ""
+    with open(base_name + name + ".h", "w") as file:
+        file.write(header_str)
@@ -0,0 +1,64 @@
+import os
+from pathlib import Path
+
+from .units import ConversionUnit
+
+
+def unit_sources(unit: ConversionUnit) -> list[Path]:
+    """
+    :param unit: The unit
+    :return: Every file the unit's output depends on (its image, palette images and TOML)
+    """
+    sources = [Path(unit.config.root_dir / unit.name).with_suffix(".png"), unit.config.root_dir / "pix2gba.toml"]
+    if unit.palette_path != "":
+        sources.append(Path(unit.palette_path))
+    sources.extend(Path(variant) for variant in unit.variants)
+    return [source.resolve() for source in sources]
+
+
+def watched_sources(units: list[ConversionUnit]) -> dict[Path, set[str]]:
+    """
+    Finds which units have to be rebuilt when each source file changes.
+    :param units: Every unit of the discovered projects (None for units missing arguments)
+    :return: Dictionary of source file to the names of the units depending on it
+    """
+    units = [unit for unit in units if unit is not None]
+    watched: dict[Path, set[str]] = {}
+    for unit in units:
+        for source in unit_sources(unit):
+            watched.setdefault(source, set()).add(unit.name)
+
+    # A pooled palette is made from every unit of the TOML, so any of their images changes all of them
+    pooled: dict[Path, set[str]] = {}
+    for unit in units:
+        if unit.config.palette_pool is not None:
+            pooled.setdefault(unit.config.root_dir, set()).add(unit.name)
+    for unit in units:
+        if unit.config.palette_pool is not None:
+            watched[unit_sources(unit)[0]] |= pooled[unit.config.root_dir]
+
+    return watched
+
+
+def source_snapshot(sources) -> dict[Path, tuple]:
+    """
+    :param sources: The files to look at
+    :return: Dictionary of file to its (mtime, size) (None if it doesn't exist)
+    """
+    snapshot = {}
+    for source in sources:
+        try:
+            stat = os.stat(source)
+            snapshot[source] = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            snapshot[source] = None
+    return snapshot
+
+
+def changed_sources(old: dict[Path, tuple], new: dict[Path, tuple]) -> list[Path]:
+    """
+    :param old: The earlier snapshot
+    :param new: The current snapshot
+    :return: The files that were changed, created or removed in between
+    """
+    return [source for source in new if old.get(source) != new[source]]
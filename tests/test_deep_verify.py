@@ -0,0 +1,66 @@
+import numpy as np
+from PIL import Image as PILImage
+
+from src.deep_verify import deep_verify_unit
+
+TRANSPARENT = 0x5D53
+
+
+def _unit_args(image_path) -> dict:
+    return {
+        "image_path": image_path,
+        "image_name": image_path.stem,
+        "meta_width": 1,
+        "meta_height": 1,
+        "bpp": 4,
+        "transparent": TRANSPARENT,
+        "palette_path": None,
+        "palette_included": 1,
+        "compress": 0,
+        "dedupe": 0,
+        "palette_banks": 0,
+        "layer": "bg",
+        "variants": [],
+        "elide_empty": 0,
+        "mode": "tiles",
+        "bitmap_mode": 3,
+        "frame_width": 0,
+        "frame_height": 0
+    }
+
+
+def test_trns_indexed_png_round_trips(tmp_path):
+    # 16 PLTE entries, the first one is fully transparent (tRNS) but stored as opaque red
+    plte = [(255, 0, 0)] + [(16 * i, 255 - 16 * i, 8 * i) for i in range(1, 16)]
+    indices = (np.arange(16 * 16, dtype=np.uint8) % 16).reshape(16, 16)
+    indices[:6] = 0
+
+    img = PILImage.fromarray(indices, mode="P")
+    img.putpalette([channel for color in plte for channel in color])
+    image_path = tmp_path / "trns.png"
+    img.save(image_path, transparency=bytes([0] + [255] * 15))
+
+    result, log = deep_verify_unit("trns", _unit_args(image_path))
+
+    assert not result.failed, log
+    assert result.source_colors == 15
+    assert result.mismatched_pixels == 0
+    assert result.warnings == ()
+
+
+def test_deduped_tiles_decode_through_the_mapping(tmp_path):
+    colors = [(0, 0, 0)] + [(16 * i, 255 - 16 * i, 8 * i) for i in range(1, 16)]
+    tile = (np.arange(64, dtype=np.uint8) % 15 + 1).reshape(8, 8)
+    other = tile[::-1, :]
+    indices = np.block([[tile, other, other], [other, tile, tile]])
+
+    img = PILImage.fromarray(indices, mode="P")
+    img.putpalette([channel for color in colors for channel in color])
+    image_path = tmp_path / "dupes.png"
+    img.save(image_path)
+
+    args = _unit_args(image_path) | {"dedupe": 1}
+    result, log = deep_verify_unit("dupes", args)
+
+    assert not result.failed, log
+    assert result.mismatched_pixels == 0
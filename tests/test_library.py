@@ -0,0 +1,56 @@
+import threading
+
+import numpy as np
+import pytest
+
+from src import convert_image, ConvertOptions
+from src.errors import ConversionError, InvalidOptionsError
+
+TRANSPARENT = 0x5D53
+
+
+def _rgb15_image(colors: list) -> np.ndarray:
+    rgb = np.array([((c & 31) << 3, ((c >> 5) & 31) << 3, ((c >> 10) & 31) << 3) for c in colors], dtype=np.uint8)
+    return rgb[np.arange(16 * 16) % len(colors)].reshape(16, 16, 3)
+
+
+def test_palette_keeps_its_size_with_the_transparent_color_moved_to_index_0():
+    palette = [0x0400 + i for i in range(16)]
+    palette[3] = TRANSPARENT
+
+    result = convert_image(_rgb15_image(palette), ConvertOptions(palette=tuple(palette)))
+
+    assert len(result.palette) == 16
+    assert result.palette[0] == TRANSPARENT and result.palette[3] == palette[0]
+
+
+def test_full_palette_without_the_transparent_color_is_rejected():
+    palette = tuple(0x0400 + i for i in range(16))
+
+    with pytest.raises(InvalidOptionsError):
+        convert_image(_rgb15_image(list(palette)), ConvertOptions(palette=palette))
+
+
+def test_conversion_errors_are_raised_not_printed(capsys):
+    # 32x32 solid tiles leave 1024 tiles after eliding, one past the reserved empty tile index
+    image = np.full((256, 256, 3), 248, dtype=np.uint8)
+
+    with pytest.raises(ConversionError):
+        convert_image(image, ConvertOptions(elide_empty=True))
+    assert capsys.readouterr().out == ""
+
+
+def test_threads_keep_their_own_log(capsys):
+    logs = {}
+
+    def convert(dedupe):
+        logs[dedupe] = convert_image(_rgb15_image([0x001F, 0x03E0]), ConvertOptions(dedupe=dedupe)).log
+
+    threads = [threading.Thread(target=convert, args=(dedupe,)) for dedupe in (False, True)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert "Deduping" in logs[True] and "Deduping" not in logs[False]
+    assert capsys.readouterr().out == ""
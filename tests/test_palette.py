@@ -0,0 +1,37 @@
+import numpy as np
+from PIL import Image as PILImage
+
+from src.gba_utils import rgb24_to_rgb15
+from src.palette import palette_from_indexed_img
+
+TRANSPARENT = 0x5D53
+
+
+def _indexed_img(plte: list) -> PILImage.Image:
+    indices = (np.arange(16 * 16, dtype=np.uint8) % len(plte)).reshape(16, 16)
+    img = PILImage.fromarray(indices, mode="P")
+    img.putpalette([channel for color in plte for channel in color])
+    return img
+
+
+def test_full_plte_keeps_its_layout_with_transparent_at_nonzero_index():
+    plte = [(16 * i, 255 - 16 * i, 8 * i) for i in range(16)]
+    plte[5] = (152, 80, 184)  # RGB15 0x5D53
+    assert rgb24_to_rgb15(plte[5]) == TRANSPARENT
+
+    gba_palette, remap = palette_from_indexed_img(_indexed_img(plte), 4, TRANSPARENT)
+
+    expected = [rgb24_to_rgb15(color) for color in plte]
+    expected[0], expected[5] = expected[5], expected[0]
+    assert gba_palette == expected
+    assert remap[0] == 5 and remap[5] == 0 and remap[1] == 1
+
+
+def test_small_plte_gets_no_duplicate_entry():
+    plte = [(16 * i, 255 - 16 * i, 8 * i) for i in range(8)]
+
+    gba_palette, _ = palette_from_indexed_img(_indexed_img(plte), 4, TRANSPARENT)
+
+    assert gba_palette[0] == TRANSPARENT
+    assert len(gba_palette) == 9
+    assert gba_palette[1:] == [rgb24_to_rgb15(color) for color in plte]
@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+from PIL import Image as PILImage
+
+from src.compress_output import _load_lz77_lib
+from src.converter import run_conversion
+from src.png_strips import can_read_png_strips, read_png_strips
+from src.streaming import run_streaming_conversion
+
+TRANSPARENT = 0x5D53
+
+
+def _unit_args(image_path, destination, **options) -> dict:
+    args = {
+        "image_path": image_path,
+        "image_name": image_path.stem,
+        "meta_width": 1,
+        "meta_height": 1,
+        "bpp": 4,
+        "transparent": TRANSPARENT,
+        "palette_path": None,
+        "palette_included": 1,
+        "generate_palette": 0,
+        "destination_path": destination,
+        "output_type": "both",
+        "compress": 0,
+        "dedupe": 0,
+        "palette_banks": 0,
+        "layer": "bg",
+        "variants": [],
+        "elide_empty": 0,
+        "mode": "tiles",
+        "bitmap_mode": 3,
+        "frame_width": 0,
+        "frame_height": 0
+    }
+    args.update(options)
+    return args
+
+
+def _outputs(directory) -> dict:
+    # The generation date in the header comments differs between the two runs
+    return {path.name: [line for line in path.read_text().splitlines() if not line.startswith("//\t20")]
+            for path in sorted(directory.iterdir())}
+
+
+def _rgb_image(path, width, height):
+    rng = np.random.default_rng(5)
+    colors = rng.integers(0, 256, (12, 3), dtype=np.uint8)
+    pixels = colors[rng.integers(0, len(colors), (height // 8 + 1, width // 8 + 1))].repeat(8, 0).repeat(8, 1)
+    pixels[:16, :16] = (0xA8, 0x98, 0xB8)
+    PILImage.fromarray(np.ascontiguousarray(pixels[:height, :width])).save(path)
+
+
+def _indexed_image(path, width, height):
+    indices = (np.arange(width * height) // 7 % 16).astype(np.uint8).reshape(height, width)
+    indices[:8] = 0
+    img = PILImage.fromarray(indices, mode="P")
+    img.putpalette([channel for i in range(16) for channel in (16 * i, 255 - 16 * i, 8 * i)])
+    img.save(path, transparency=0)
+
+
+@pytest.mark.parametrize("make_image, size, options", [
+    (_rgb_image, (64, 96), {"dedupe": 1}),
+    (_rgb_image, (37, 45), {"meta_width": 2, "meta_height": 2, "elide_empty": 1}),
+    (_indexed_image, (48, 40), {"elide_empty": 1, "dedupe": 1}),
+    (_indexed_image, (29, 51), {"meta_height": 2}),
+    (_rgb_image, (80, 72), {"compress": 1, "dedupe": 1}),
+])
+def test_streamed_output_matches_a_normal_build(tmp_path, make_image, size, options):
+    if options.get("compress"):
+        try:
+            _load_lz77_lib()
+        except OSError:
+            pytest.skip("The LZ77 codec isn't built")
+
+    image_path = tmp_path / "unit.png"
+    make_image(image_path, *size)
+    normal, streamed = tmp_path / "normal", tmp_path / "streamed"
+    normal.mkdir()
+    streamed.mkdir()
+
+    assert not run_conversion(_unit_args(image_path, normal, **options))
+    assert not run_streaming_conversion(_unit_args(image_path, streamed, **options))
+    assert _outputs(streamed) == _outputs(normal)
+
+
+@pytest.mark.parametrize("mode", ["RGB", "RGBA", "L", "LA", "P", "1"])
+def test_png_strips_decode_like_pil(tmp_path, mode):
+    rng = np.random.default_rng(3)
+    pixels = rng.integers(0, 256, (53, 41, 3), dtype=np.uint8)
+    pixels[::3] = pixels[0]
+    image_path = tmp_path / f"{mode}.png"
+    PILImage.fromarray(pixels).convert(mode).save(image_path)
+
+    with PILImage.open(image_path) as img:
+        assert can_read_png_strips(img)
+        strips = list(read_png_strips(img, 16))
+        expected = np.asarray(img)
+
+    assert [strip.height for strip in strips] == [16, 16, 16, 5]
+    assert np.array_equal(np.concatenate([np.asarray(strip) for strip in strips]), expected)
@@ -0,0 +1,14 @@
+from src.vram_planner import VramRequest, plan_scene
+
+
+def test_bg_with_more_tiles_than_screen_entries_can_index_is_rejected():
+    plan = plan_scene("s", [VramRequest("big", "bg", 4, 1100)])
+
+    assert "big" not in plan.placements
+    assert len(plan.errors) == 1
+
+
+def test_bg_reserving_the_empty_tile_gets_one_tile_less():
+    assert plan_scene("s", [VramRequest("bg", "bg", 4, 1024)]).errors == []
+    assert plan_scene("s", [VramRequest("bg", "bg", 4, 1024, reserve_empty=True)]).errors != []
+    assert plan_scene("s", [VramRequest("bg", "bg", 4, 1023, reserve_empty=True)]).errors == []